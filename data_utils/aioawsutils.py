@@ -0,0 +1,480 @@
+"""A library containing asyncio counterparts of the AWS utils in awsutils
+
+AsyncS3Base and AsyncSSMBase offer the same methods as S3Base and SSMBase as
+coroutines, running on aiobotocore. All requests of an instance share one
+connection pool and are bounded by a semaphore, so thousands of small object
+operations can overlap on a single thread. Use them as async context managers::
+
+    async with AsyncS3Base() as s3_base:
+        data = await s3_base.load_json_from_s3(bucket, key)
+"""
+import asyncio
+from contextlib import AsyncExitStack
+
+from data_utils import generalutils as gu
+from data_utils.awsutils import S3Base, S3ObjectError, REGION_NAME, botocore
+
+aiobotocore_session = gu.lazy_import('aiobotocore.session')
+aiobotocore_config = gu.lazy_import('aiobotocore.config')
+
+
+class AsyncSSMBase(object):
+    """AsyncSSMBase class to handle the ssm requests on an asyncio event loop
+    """
+    ssm_conn = None
+    logger = None
+
+    def __init__(self, external_sess=None, region_name=REGION_NAME, endpoint_url=None):
+        """Initialization of class with needed arguments for ssm
+
+        Parameters
+        ----------
+        external_sess : aiobotocore client
+                        Already opened ssm client, which is not closed by this instance
+        region_name : String
+                        Region of the ssm client
+        endpoint_url : String
+                        Custom endpoint, e.g. of a local moto server
+        """
+        self.ssm_conn = external_sess
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self.logger = gu.get_logger("AsyncSSMBase")
+        self._exit_stack = None
+
+    async def __aenter__(self):
+        await self.ssm_connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def ssm_connect(self):
+        if self.ssm_conn is None:
+            self._exit_stack = AsyncExitStack()
+            self.ssm_conn = await self._exit_stack.enter_async_context(
+                aiobotocore_session.get_session().create_client(
+                    "ssm", region_name=self.region_name, endpoint_url=self.endpoint_url))
+        return self.ssm_conn
+
+    async def close(self):
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+            self._exit_stack = None
+            self.ssm_conn = None
+
+    async def get_ssm_parameter(self, name, encoded=False):
+        """Returns the value of a parameter from ssm using the provided name
+
+        Parameters
+        ----------
+        name : String
+                        Name of the parameter
+
+        Returns
+        -------
+        String
+                        Value of the parameter
+        """
+        obj = await self.ssm_conn.get_parameter(Name=name, WithDecryption=False)
+        target_name = obj["Parameter"]["Value"]
+
+        return target_name.encode() if encoded else target_name
+
+
+class AsyncS3Base(object):
+    """AsyncS3Base class to handle the s3 requests on an asyncio event loop
+
+    Attributes
+    ----------
+    max_concurrency : int
+                    Number of requests in flight at the same time
+    part_size : int
+                    Bodies larger than this are uploaded as multipart uploads
+    max_parts_in_flight : int
+                    Parts of a multipart upload sent at the same time, an upload buffers
+                    at most max_parts_in_flight + 2 parts
+    """
+    s3_conn = None
+    logger = None
+    max_concurrency = 64
+    part_size = 8 * 1024 * 1024
+    max_parts_in_flight = 4
+    delete_batch_size = 1000
+
+    def __init__(self, region_name=REGION_NAME, endpoint_url=None, max_concurrency=None):
+        """Initialization of class with needed arguments for s3
+
+        Parameters
+        ----------
+        region_name : String
+                        Region of the s3 client
+        endpoint_url : String
+                        Custom endpoint, e.g. of a local moto server
+        max_concurrency : int
+                        Number of requests in flight, also the size of the connection pool
+        """
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self.max_concurrency = max_concurrency or self.max_concurrency
+        self.logger = gu.get_logger("AsyncS3Base")
+        self._exit_stack = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        await self.s3_connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def s3_connect(self):
+        """
+        Opens the s3 client with a connection pool of max_concurrency connections
+        """
+        if self.s3_conn is None:
+            self._exit_stack = AsyncExitStack()
+            config = aiobotocore_config.AioConfig(max_pool_connections=self.max_concurrency)
+            self.s3_conn = await self._exit_stack.enter_async_context(
+                aiobotocore_session.get_session().create_client(
+                    "s3", region_name=self.region_name, endpoint_url=self.endpoint_url, config=config))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.s3_conn
+
+    async def close(self):
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+            self._exit_stack = None
+            self.s3_conn = None
+
+    async def _request(self, operation, **params):
+        async with self._semaphore:
+            return await getattr(self.s3_conn, operation)(**params)
+
+    def create_s3_uri(self, bucket, key, tmpFileName, FileType=None):
+        """creates and s3 uri: s3://bucket/key
+
+        Arguments:
+                bucket {string} -- bucket name
+                key {string} -- key path
+        """
+        return gu.get_target_path(["s3://", bucket, key, tmpFileName], FileType)
+
+    async def check_if_object_exists(self, bucket, key):
+        """
+        Checks with a single HEAD request whether a given object exists in a bucket or not.
+        return -- True: object exists
+                          False: object does not exist
+        """
+        try:
+            await self._request("head_object", Bucket=bucket, Key=key)
+            return True
+        except botocore.exceptions.ClientError as e:
+            if S3Base._is_not_found(e):
+                return False
+            raise
+
+    async def iter_objects(self, bucket, prefix=""):
+        """Lazily lists the objects under a prefix with list_objects_v2 pagination
+
+        Returns
+        -------
+        async generator
+                        dicts with Key, Size, ETag and LastModified of each object
+        """
+        paginator = self.s3_conn.get_paginator("list_objects_v2")
+        async for page in paginator.paginate(Bucket=bucket, Prefix=prefix or ""):
+            for obj in page.get("Contents", []):
+                yield {"Key": obj["Key"], "Size": obj["Size"], "ETag": obj["ETag"],
+                       "LastModified": obj["LastModified"]}
+
+    async def list_keys(self, bucket, prefix=None):
+        """
+        Returns a list of bucket-keys under the prefix, an empty list without prefix.
+        """
+        if not prefix:
+            return []
+        return [obj["Key"] async for obj in self.iter_objects(bucket, prefix)]
+
+    async def get_object_from_s3(self, bucket, key):
+        """Fetches the body of an object with a single GET request
+
+        Returns
+        -------
+        bytes
+                        Body of the object, None if the object does not exist
+        """
+        try:
+            async with self._semaphore:
+                response = await self.s3_conn.get_object(Bucket=bucket, Key=key)
+                async with response["Body"] as stream:
+                    return await stream.read()
+        except botocore.exceptions.ClientError as e:
+            if S3Base._is_not_found(e):
+                return None
+            raise
+
+    async def load_file_from_s3(self, bucket, key):
+        """
+        Wrapper for loading a file with key from S3 bucket.
+        return -- object of file content
+        """
+        try:
+            return await self.get_object_from_s3(bucket, key)
+        except botocore.exceptions.ClientError as e:
+            self.logger.warning(
+                "The following error occured while loading %s from bucket %s: %s" % (key, bucket, e))
+            return None
+
+    async def load_list_file_from_s3(self, bucket, key):
+        """
+        Wrapper for getting file list with key from S3 bucket.
+        return -- objectlist of file content
+        """
+        try:
+            data = await self.get_object_from_s3(bucket, key)
+            return None if data is None else S3Base._decode_payload(data, "lines")
+        except botocore.exceptions.ClientError as e:
+            self.logger.warning(
+                f"The following error occured while loading {key} from bucket {bucket}: {e}")
+            return []
+
+    async def load_json_from_s3(self, bucket, key):
+        """
+        Wrapper for loading a json-file with key form given S3 bucket.
+        return -- object of json file
+        """
+        binary_data = await self.load_file_from_s3(bucket, key)
+        if binary_data:
+            try:
+                return S3Base._decode_payload(binary_data, "json")
+            except Exception as e:
+                self.logger.critical(
+                    "could not convert %s, Exception: %s" % (key, e))
+        return None
+
+    async def load_files_from_s3(self, bucket, keys=None, prefix=None, decode="bytes"):
+        """Loads many objects concurrently, bounded by max_concurrency
+
+        Like S3Base.load_files_from_s3, at most 2 * max_concurrency objects are
+        loaded ahead of the consumer, and a prefix is listed while loading.
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        keys : list
+                        Keys to load
+        prefix : String
+                        Loads all objects under this prefix if no keys are given
+        decode : String
+                        "bytes", "lines" or "json" as in S3Base.load_files_from_s3
+
+        Returns
+        -------
+        async generator
+                        (key, payload) tuples in completion order, payload is None for a
+                        missing object and an S3ObjectError if loading or decoding failed
+        """
+        if keys is None:
+            keys = (obj["Key"] async for obj in self.iter_objects(bucket, prefix)) if prefix else []
+        pending = set()
+        try:
+            async for key in self._aiter(keys):
+                pending.add(asyncio.ensure_future(self._load_and_decode(bucket, key, decode)))
+                if len(pending) >= 2 * self.max_concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    async def _aiter(items):
+        if hasattr(items, "__aiter__"):
+            async for item in items:
+                yield item
+        else:
+            for item in items:
+                yield item
+
+    async def _load_and_decode(self, bucket, key, decode):
+        try:
+            data = await self.get_object_from_s3(bucket, key)
+            return key, None if data is None else S3Base._decode_payload(data, decode)
+        except Exception as e:
+            return key, S3ObjectError(bucket, key, e)
+
+    async def upload_as_jsonp_to_s3(self, json_context, bucket, key):
+        """
+        Wrapper to upload a jsonp-file with key to S3 bucket.
+        """
+        await self.upload_object_to_s3(json_context, bucket, key)
+
+    async def upload_as_json_to_s3(self, json_context, bucket, key):
+        """
+        Wrapper to upload json-file with key to S3 bucket.
+        """
+        await self.upload_object_to_s3(gu.json_dumps(json_context), bucket, key)
+
+    async def upload_as_csv_to_s3(self, csv_context, bucket, key):
+        """
+        Wrapper to upload a csv-file with key to a S3 bucket.
+        """
+        await self.upload_object_to_s3(csv_context, bucket, key)
+
+    async def upload_object_to_s3(self, body, bucket, key, extra_args=None):
+        """Uploads an unspecified file with key to a S3 bucket
+
+        Bodies larger than part_size are uploaded as multipart upload with the
+        parts sent concurrently.
+
+        Parameters
+        ----------
+        body : String, bytes, file object, iterator or async iterable
+                        Content of the object, (async) iterators have to yield str or bytes chunks.
+                        File objects and iterators are read in the default executor, so their
+                        blocking reads don't stall the event loop.
+        bucket : String
+                        Name of the bucket
+        key : String
+                        Key of the object
+        extra_args : dict
+                        Additional arguments for the PutObject/CreateMultipartUpload requests
+        """
+        extra_args = extra_args or {}
+        parts_of_body = self._iter_parts(body)
+        first_part = await self._next_part(parts_of_body)
+        next_part = await self._next_part(parts_of_body)
+        if not next_part:
+            await self._request("put_object", Bucket=bucket, Key=key, Body=first_part, **extra_args)
+            return
+
+        upload = await self._request("create_multipart_upload", Bucket=bucket, Key=key, **extra_args)
+        upload_id = upload["UploadId"]
+        try:
+            parts = []
+            pending = set()
+            part = first_part
+            while part:
+                pending.add(asyncio.ensure_future(
+                    self._upload_part(bucket, key, upload_id, len(parts) + len(pending) + 1, part)))
+                if len(pending) >= min(self.max_parts_in_flight, self.max_concurrency):
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    parts.extend(task.result() for task in done)
+                part, next_part = next_part, (await self._next_part(parts_of_body) if next_part else b"")
+            if pending:
+                done, _ = await asyncio.wait(pending)
+                parts.extend(task.result() for task in done)
+            parts.sort(key=lambda uploaded: uploaded["PartNumber"])
+            await self._request("complete_multipart_upload", Bucket=bucket, Key=key, UploadId=upload_id,
+                                MultipartUpload={"Parts": parts})
+        except Exception:
+            await self._request("abort_multipart_upload", Bucket=bucket, Key=key, UploadId=upload_id)
+            raise
+
+    async def _iter_parts(self, body):
+        if hasattr(body, "__aiter__"):
+            buffer = bytearray()
+            async for chunk in body:
+                buffer += chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+                while len(buffer) >= self.part_size:
+                    yield bytes(buffer[:self.part_size])
+                    del buffer[:self.part_size]
+            if buffer:
+                yield bytes(buffer)
+            return
+        stream = S3Base._as_readable(body)
+        in_memory = isinstance(body, (str, bytes, bytearray, memoryview))
+        loop = asyncio.get_running_loop()
+        while True:
+            if in_memory:
+                part = stream.read(self.part_size)
+            else:
+                part = await loop.run_in_executor(None, stream.read, self.part_size)
+            if not part:
+                return
+            yield part
+
+    @staticmethod
+    async def _next_part(parts_of_body):
+        try:
+            return await parts_of_body.__anext__()
+        except StopAsyncIteration:
+            return b""
+
+    async def _upload_part(self, bucket, key, upload_id, number, part):
+        response = await self._request("upload_part", Bucket=bucket, Key=key, UploadId=upload_id,
+                                       PartNumber=number, Body=part)
+        return {"ETag": response["ETag"], "PartNumber": number}
+
+    async def delete_file_from_s3(self, bucket, key):
+        """
+        Wrapper for deleteing a file with key from given S3 bucket.
+        """
+        await self._request("delete_object", Bucket=bucket, Key=key)
+
+    async def delete_all_keys_from_list(self, bucket, prefix, max_batches_in_flight=4):
+        """Deletes all keys under a prefix with concurrent DeleteObjects batches
+
+        Batches are sent as soon as the listing has filled them, like
+        S3Base.delete_keys_in_batches, so the keys are never listed up front.
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        prefix : String
+                        Prefix of the keys to delete, nothing is deleted without prefix
+        max_batches_in_flight : int
+                        Number of concurrent DeleteObjects requests
+
+        Returns
+        -------
+        dict
+                        "deleted": list of deleted keys,
+                        "errors": list of dicts with Key, Code and Message of failed keys
+        """
+        result = {"deleted": [], "errors": []}
+        if not prefix:
+            return result
+        pending = set()
+        batch = []
+        try:
+            async for obj in self.iter_objects(bucket, prefix):
+                batch.append(obj["Key"])
+                if len(batch) < self.delete_batch_size:
+                    continue
+                if len(pending) >= max_batches_in_flight:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    self._collect_delete_results(done, result)
+                pending.add(asyncio.ensure_future(self._delete_batch(bucket, batch)))
+                batch = []
+            if batch:
+                pending.add(asyncio.ensure_future(self._delete_batch(bucket, batch)))
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                self._collect_delete_results(done, result)
+        finally:
+            for task in pending:
+                task.cancel()
+        return result
+
+    async def _delete_batch(self, bucket, batch):
+        response = await self._request("delete_objects", Bucket=bucket,
+                                       Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True})
+        errors = response.get("Errors", [])
+        failed = set(error["Key"] for error in errors)
+        return [key for key in batch if key not in failed], errors
+
+    @staticmethod
+    def _collect_delete_results(tasks, result):
+        for task in tasks:
+            deleted, errors = task.result()
+            result["deleted"].extend(deleted)
+            result["errors"].extend(errors)
@@ -1,8 +1,9 @@
 """A library containing commonly used utils for general api usage
 """
-import json
 import urllib3
 
+from data_utils import generalutils as gu
+
 
 def handle_get_request(url, headers=None, fields=None):
 	"""Requests data from the provided URL via a get request
@@ -36,7 +37,7 @@ def handle_get_request(url, headers=None, fields=None):
 	if r.status != 200:
 		print(f"----- Something Went Wrong on GET Request: Response: {r.data} -----")
 		return None
-	return json.loads(r.data.decode('utf-8'))
+	return gu.json_loads(r.data)
 
 
 def handle_post_request(url, body=None, headers=None, fields=None):
@@ -63,7 +64,7 @@ def handle_post_request(url, body=None, headers=None, fields=None):
 	"""
 
 	http = urllib3.PoolManager()
-	encoded_body = json.dumps(body).encode('utf-8')
+	encoded_body = gu.json_dumps(body)
 	if fields:
 		r = http.request(
 			'POST',
@@ -78,4 +79,4 @@ def handle_post_request(url, body=None, headers=None, fields=None):
 	if r.status != 200:
 		print(f"----- Something Went Wrong on POST Request: Response: {r.data} -----")
 		return None
-	return json.loads(r.data.decode('utf-8'))
+	return gu.json_loads(r.data)
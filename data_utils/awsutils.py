@@ -1,267 +1,2860 @@
 """A library containing commonly used utils for AWS API
 """
 import os
-import boto3
-import botocore
-import pandas as pd
+import io
 import logging
 import json
+import time
+import threading
+import queue
+import atexit
+import tempfile
+import random
+import socket
+import hashlib
+from contextlib import contextmanager
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 from data_utils import generalutils as gu
-from s3fs import S3FileSystem
-import awswrangler as wr
+
+# heavy dependencies are imported on first use to keep the import time low
+boto3 = gu.lazy_import('boto3')
+botocore = gu.lazy_import('botocore')
+s3transfer = gu.lazy_import('boto3.s3.transfer')
+s3fs = gu.lazy_import('s3fs')
+wr = gu.lazy_import('awswrangler')
+pa = gu.lazy_import('pyarrow')
+pq = gu.lazy_import('pyarrow.parquet')
+pd = gu.lazy_import('pandas')
+
+
+class S3ObjectError(Exception):
+    """Error of a single object in a bulk operation, returned instead of raised
+
+    Attributes
+    ----------
+    bucket : String
+                    Name of the bucket
+    key : String
+                    Key of the failed object
+    error : Exception
+                    Original exception
+    """
+
+    def __init__(self, bucket, key, error):
+        super(S3ObjectError, self).__init__(f"{bucket}/{key}: {error}")
+        self.bucket = bucket
+        self.key = key
+        self.error = error
+
+
+class _S3ObjectFile(io.RawIOBase):
+    """Seekable read-only file over an S3 object, every read is a ranged GET
+
+    Lets pyarrow read the parquet footer and only the column chunks of the
+    selected columns and row groups instead of downloading the whole object.
+    All reads are pinned with If-Match to the ETag given or returned by the
+    first read, so an object overwritten in the middle of a read fails with
+    PreconditionFailed instead of mixing two versions.
+    """
+
+    def __init__(self, client, bucket, key, size, etag=None):
+        super(_S3ObjectFile, self).__init__()
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else min(self.size, self.position + size)
+        if end <= self.position:
+            return b""
+        params = {"Bucket": self.bucket, "Key": self.key, "Range": f"bytes={self.position}-{end - 1}"}
+        if self.etag is not None:
+            params["IfMatch"] = self.etag
+        response = self.client.get_object(**params)
+        self.etag = self.etag or response["ETag"]
+        data = response["Body"].read()
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+REGION_NAME = 'eu-central-1'
+
+# Named parquet writer configurations, see S3Base.resolve_parquet_writer.
+# row_group_size is given in rows, data_page_size in bytes.
+PARQUET_WRITER_PRESETS = {
+    "default": {},
+    "fast-write": {
+        "compression": "snappy",
+        "use_dictionary": False,
+        "write_statistics": False,
+        "row_group_size": 1024 * 1024,
+    },
+    "small-files": {
+        "compression": "zstd",
+        "compression_level": 9,
+        "use_dictionary": True,
+        "write_statistics": True,
+        "row_group_size": 1024 * 1024,
+    },
+    "scan-optimised": {
+        "compression": "zstd",
+        "compression_level": 3,
+        "use_dictionary": True,
+        "write_statistics": True,
+        "row_group_size": 128 * 1024,
+        "data_page_size": 1024 * 1024,
+    },
+}
+
+PARQUET_COLUMN_OPTIONS = ("compression", "compression_level", "use_dictionary", "write_statistics")
+
+# pandas dtypes of arrow types as returned by wr.s3.read_parquet(dtype_backend="numpy_nullable"),
+# all other types are converted with the pyarrow defaults
+NULLABLE_PANDAS_DTYPES = {
+    "int8": "Int8", "int16": "Int16", "int32": "Int32", "int64": "Int64",
+    "uint8": "UInt8", "uint16": "UInt16", "uint32": "UInt32", "uint64": "UInt64",
+    "bool": "boolean", "string": "string", "large_string": "string",
+}
+
+
+def _nullable_pandas_dtype(arrow_type):
+    """types_mapper of pyarrow.Table.to_pandas for NULLABLE_PANDAS_DTYPES"""
+    dtype = NULLABLE_PANDAS_DTYPES.get(str(arrow_type))
+    return pd.api.types.pandas_dtype(dtype) if dtype else None
+
+
+class AdaptiveRetryPolicy(object):
+    """Retries with jittered exponential backoff and an adaptive request rate per prefix
+
+    Installed on a botocore client with register, it handles the retries of
+    every request sent with the client instead of the botocore retry modes.
+    Each bucket/prefix (the key up to its last "/") has a token bucket:
+    requests wait for a token before they are sent, a throttling error
+    (e.g. 503 SlowDown) multiplies the rate of the prefix with decrease and
+    every success_threshold successes in a row multiply it with increase.
+
+    Attributes
+    ----------
+    max_attempts : int
+                    Attempts of a request including the first one
+    base_delay, max_delay : float
+                    Seconds of the backoff, which is drawn uniformly from
+                    0 to min(max_delay, base_delay * 2 ** retries)
+    initial_rate, min_rate, max_rate : float
+                    Requests per second per prefix
+    """
+
+    THROTTLING_CODES = ("SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded",
+                        "TooManyRequests", "RequestThrottled", "503", "429")
+    TRANSIENT_CODES = ("InternalError", "ServiceUnavailable", "RequestTimeout", "RequestTimeTooSkewed",
+                       "500", "502", "504")
+
+    def __init__(self, max_attempts=8, base_delay=0.1, max_delay=20.0, initial_rate=3500.0, min_rate=1.0,
+                 max_rate=3500.0, decrease=0.5, increase=1.2, success_threshold=50, max_prefixes=10000):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.decrease = decrease
+        self.increase = increase
+        self.success_threshold = success_threshold
+        self.max_prefixes = max_prefixes
+        self._lock = threading.Lock()
+        self._prefixes = OrderedDict()
+        self._totals = {"requests": 0, "retries": 0, "throttles": 0, "failures": 0}
+
+    def register(self, client):
+        """Installs the policy on a client, whose own retries should be disabled
+        """
+        service = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register(f"before-parameter-build.{service}", self._before_request)
+        client.meta.events.register(f"needs-retry.{service}", self._needs_retry)
+        client.meta.events.register(f"after-call.{service}", self._after_call)
+
+    def state(self):
+        """Returns the current state of the policy
+
+        Returns
+        -------
+        dict
+                        Totals of requests, retries, throttles and failures and per prefix
+                        the current rate, retries, throttles and successes in a row
+        """
+        with self._lock:
+            prefixes = dict((prefix, dict((name, value) for name, value in bucket.items()
+                                          if name not in ("tokens", "updated")))
+                            for prefix, bucket in self._prefixes.items())
+            return dict(self._totals, prefixes=prefixes)
+
+    def reset(self):
+        with self._lock:
+            self._prefixes.clear()
+            for name in self._totals:
+                self._totals[name] = 0
+
+    def acquire(self, prefix):
+        """Takes a token of the prefix, sleeping until one is available
+        """
+        while True:
+            with self._lock:
+                bucket = self._get_bucket(prefix)
+                now = time.monotonic()
+                bucket["tokens"] = min(max(1.0, bucket["rate"]),
+                                       bucket["tokens"] + (now - bucket["updated"]) * bucket["rate"])
+                bucket["updated"] = now
+                if bucket["tokens"] >= 1:
+                    bucket["tokens"] -= 1
+                    return
+                wait_seconds = (1 - bucket["tokens"]) / bucket["rate"]
+            time.sleep(wait_seconds)
+
+    def _get_bucket(self, prefix):
+        bucket = self._prefixes.get(prefix)
+        if bucket is None:
+            bucket = self._prefixes[prefix] = {"rate": self.initial_rate, "tokens": 1.0,
+                                               "updated": time.monotonic(), "retries": 0, "throttles": 0,
+                                               "successes": 0}
+            while len(self._prefixes) > self.max_prefixes:
+                self._prefixes.popitem(last=False)
+        self._prefixes.move_to_end(prefix)
+        return bucket
+
+    @staticmethod
+    def _prefix(params):
+        key = params.get("Key") or params.get("Prefix") or ""
+        return f"{params.get('Bucket', '')}/{key.rsplit('/', 1)[0] if '/' in key else ''}"
+
+    def _before_request(self, params, context, **kwargs):
+        prefix = context["retry_prefix"] = self._prefix(params)
+        with self._lock:
+            self._totals["requests"] += 1
+        self.acquire(prefix)
+
+    def _error_code(self, response, caught_exception):
+        if caught_exception is not None:
+            return "connection" if isinstance(caught_exception, (botocore.exceptions.ConnectionError,
+                                                                 botocore.exceptions.HTTPClientError)) else None
+        if response is None:
+            return None
+        http_response, parsed = response
+        code = (parsed or {}).get("Error", {}).get("Code")
+        if code:
+            return code
+        return str(http_response.status_code) if http_response.status_code >= 500 or \
+            http_response.status_code == 429 else None
+
+    def _needs_retry(self, response, attempts, caught_exception, request_dict, **kwargs):
+        code = self._error_code(response, caught_exception)
+        if code is None or not (code == "connection" or code in self.THROTTLING_CODES or
+                                code in self.TRANSIENT_CODES):
+            return None
+        prefix = request_dict.get("context", {}).get("retry_prefix", "")
+        with self._lock:
+            bucket = self._get_bucket(prefix)
+            bucket["successes"] = 0
+            if code in self.THROTTLING_CODES:
+                bucket["throttles"] += 1
+                self._totals["throttles"] += 1
+                bucket["rate"] = max(self.min_rate, bucket["rate"] * self.decrease)
+                bucket["tokens"] = min(bucket["tokens"], 0.0)
+            if attempts >= self.max_attempts:
+                self._totals["failures"] += 1
+                return None
+            bucket["retries"] += 1
+            self._totals["retries"] += 1
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+        time.sleep(delay)
+        self.acquire(prefix)
+        return 0
+
+    def _after_call(self, http_response, context, **kwargs):
+        if http_response.status_code >= 300:
+            return
+        with self._lock:
+            bucket = self._get_bucket(context.get("retry_prefix", ""))
+            bucket["successes"] += 1
+            if bucket["successes"] >= self.success_threshold:
+                bucket["successes"] = 0
+                bucket["rate"] = min(self.max_rate, bucket["rate"] * self.increase)
+
+
+s3_retry_policy = AdaptiveRetryPolicy()
+
+
+class MetricsRecorder(object):
+    """Counts, latency histograms, bytes and error codes per operation and bucket
+
+    Installed on botocore clients with register, it records every request of
+    the clients as "{service}.{operation}", e.g. "s3.PutObject"; local steps
+    like parquet encoding are recorded with timer. The metrics are available
+    with snapshot and are sent to the sinks with flush. While the recorder is
+    disabled, which is the default unless the environment variable
+    DATA_UTILS_METRICS is set, the hooks return right away and timer is a no-op.
+
+    Attributes
+    ----------
+    LATENCY_BUCKETS_MS : tuple
+                    Upper bounds of the latency histogram in milliseconds
+    """
+
+    LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self, enabled=False, sinks=None):
+        self.enabled = enabled
+        self.sinks = list(sinks or [])
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._since = time.time()
+
+    def enable(self, *sinks):
+        self.sinks.extend(sinks)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def register(self, client):
+        """Installs the request hooks on a client
+        """
+        service = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register(f"before-parameter-build.{service}", self._before_request)
+        client.meta.events.register(f"after-call.{service}", self._after_call)
+        client.meta.events.register(f"after-call-error.{service}", self._after_call_error)
+
+    def record(self, operation, bucket="", seconds=0.0, bytes_in=0, bytes_out=0, error=None):
+        """Records one call of an operation
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            metric = self._operations.setdefault(operation, {}).get(bucket)
+            if metric is None:
+                metric = self._operations[operation][bucket] = {
+                    "count": 0, "errors": {}, "bytes_in": 0, "bytes_out": 0,
+                    "latency_ms": {"sum": 0.0, "max": 0.0, "histogram": [0] * (len(self.LATENCY_BUCKETS_MS) + 1)}}
+            milliseconds = seconds * 1000
+            metric["count"] += 1
+            metric["bytes_in"] += bytes_in or 0
+            metric["bytes_out"] += bytes_out or 0
+            metric["latency_ms"]["sum"] += milliseconds
+            metric["latency_ms"]["max"] = max(metric["latency_ms"]["max"], milliseconds)
+            index = 0
+            while index < len(self.LATENCY_BUCKETS_MS) and milliseconds > self.LATENCY_BUCKETS_MS[index]:
+                index += 1
+            metric["latency_ms"]["histogram"][index] += 1
+            if error:
+                metric["errors"][error] = metric["errors"].get(error, 0) + 1
+
+    @contextmanager
+    def timer(self, operation, bucket=""):
+        """Records the duration of the block as a call of operation
+
+        Yields
+        ------
+        dict
+                        Set "bytes_in" and "bytes_out" in it to record the bytes of the step
+        """
+        if not self.enabled:
+            yield {}
+            return
+        sizes = {}
+        start = time.perf_counter()
+        error = None
+        try:
+            yield sizes
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record(operation, bucket, time.perf_counter() - start, sizes.get("bytes_in", 0),
+                        sizes.get("bytes_out", 0), error)
+
+    def snapshot(self, reset=False):
+        """Returns the metrics recorded since the start or the last reset
+
+        Returns
+        -------
+        dict
+                        "since", "until" and "operations" with a dict per operation and bucket of
+                        count, errors by code, bytes_in, bytes_out and latency_ms with sum, max
+                        and histogram (upper bound in ms or "inf" to count)
+        """
+        with self._lock:
+            now = time.time()
+            operations = {}
+            for operation, buckets in self._operations.items():
+                operations[operation] = {}
+                for bucket, metric in buckets.items():
+                    latency = metric["latency_ms"]
+                    bounds = [str(bound) for bound in self.LATENCY_BUCKETS_MS] + ["inf"]
+                    operations[operation][bucket] = {
+                        "count": metric["count"], "errors": dict(metric["errors"]),
+                        "bytes_in": metric["bytes_in"], "bytes_out": metric["bytes_out"],
+                        "latency_ms": {"sum": round(latency["sum"], 3), "max": round(latency["max"], 3),
+                                       "histogram": dict(zip(bounds, latency["histogram"]))}}
+            result = {"since": self._since, "until": now, "operations": operations}
+            if reset:
+                self._operations = {}
+                self._since = now
+        return result
+
+    def flush(self, reset=True):
+        """Sends a snapshot to all sinks
+
+        Returns
+        -------
+        dict
+                        The snapshot
+        """
+        snapshot = self.snapshot(reset)
+        for sink in self.sinks:
+            try:
+                sink.emit(snapshot)
+            except Exception as e:
+                logging.getLogger("MetricsRecorder").warning(f"couldn't emit metrics to {sink}, error: {e}")
+        return snapshot
+
+    def _before_request(self, params, context, model, **kwargs):
+        if not self.enabled:
+            return
+        context["metrics_start"] = time.perf_counter()
+        context["metrics_operation"] = f"{model.service_model.service_name}.{model.name}"
+        context["metrics_bucket"] = params.get("Bucket", "")
+        body = params.get("Body")
+        if isinstance(body, (bytes, bytearray)) or hasattr(body, "__len__") and not isinstance(body, str):
+            context["metrics_bytes_out"] = len(body)
+        elif isinstance(body, str):
+            context["metrics_bytes_out"] = len(body.encode("utf-8"))
+        elif hasattr(body, "seekable") and body.seekable():
+            position = body.tell()
+            context["metrics_bytes_out"] = body.seek(0, io.SEEK_END) - position
+            body.seek(position)
+
+    def _after_call(self, http_response, parsed, model, context, **kwargs):
+        start = context.get("metrics_start")
+        if start is None or not self.enabled:
+            return
+        error = (parsed or {}).get("Error", {}).get("Code") or str(http_response.status_code) \
+            if http_response.status_code >= 300 else None
+        bytes_in = int(http_response.headers.get("content-length") or 0) if model.name == "GetObject" else 0
+        self.record(context["metrics_operation"], context.get("metrics_bucket", ""),
+                    time.perf_counter() - start, bytes_in, context.get("metrics_bytes_out", 0), error)
+
+    def _after_call_error(self, exception, context, **kwargs):
+        start = context.get("metrics_start")
+        if start is None or not self.enabled:
+            return
+        self.record(context["metrics_operation"], context.get("metrics_bucket", ""),
+                    time.perf_counter() - start, 0, context.get("metrics_bytes_out", 0), type(exception).__name__)
+
+
+class LogMetricsSink(object):
+    """Writes each snapshot as json to a logger
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("data_utils.metrics")
+        self.level = level
+
+    def emit(self, snapshot):
+        self.logger.log(self.level, json.dumps(snapshot))
+
+
+class JsonFileMetricsSink(object):
+    """Appends each snapshot as a json line to a file
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, snapshot):
+        with open(self.path, "a") as metrics_file:
+            metrics_file.write(json.dumps(snapshot) + "\n")
+
+
+class StatsdMetricsSink(object):
+    """Sends the snapshots as StatsD metrics over UDP
+
+    Counts, errors and bytes are sent as counters and the mean and max latency
+    as gauges, named {prefix}.{operation}.{bucket}.{metric}. The snapshots
+    should be taken with reset, so the counters are the deltas since the last flush.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8125, prefix="data_utils", max_packet_size=512):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.max_packet_size = max_packet_size
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def emit(self, snapshot):
+        lines = []
+        for operation, buckets in snapshot["operations"].items():
+            for bucket, metric in buckets.items():
+                name = ".".join(part.replace(".", "_").replace(":", "_")
+                                for part in (self.prefix, operation.replace(".", "_"), bucket or "none"))
+                lines.append(f"{name}.count:{metric['count']}|c")
+                lines.append(f"{name}.bytes_in:{metric['bytes_in']}|c")
+                lines.append(f"{name}.bytes_out:{metric['bytes_out']}|c")
+                if metric["count"]:
+                    lines.append(f"{name}.latency_ms.mean:{metric['latency_ms']['sum'] / metric['count']:.3f}|g")
+                    lines.append(f"{name}.latency_ms.max:{metric['latency_ms']['max']:.3f}|g")
+                for code, count in metric["errors"].items():
+                    lines.append(f"{name}.errors.{code}:{count}|c")
+        packet = []
+        for line in lines:
+            if packet and len("\n".join(packet + [line])) > self.max_packet_size:
+                self._socket.sendto("\n".join(packet).encode("utf-8"), self.address)
+                packet = []
+            packet.append(line)
+        if packet:
+            self._socket.sendto("\n".join(packet).encode("utf-8"), self.address)
+
+
+metrics = MetricsRecorder(enabled=bool(os.environ.get("DATA_UTILS_METRICS")))
+
+
+class ClientRegistry(object):
+    """Process-wide registry of boto3 sessions, clients and resources
+
+    Sessions are cached per credentials profile and clients per
+    (service, region, profile). Everything is created lazily on first use and
+    reused across instances and threads, so the connection pool of a client is
+    shared by all users. Resources are not thread safe and are therefore cached
+    per thread, but they use the shared client for their requests.
+
+    Attributes
+    ----------
+    client_settings : dict
+                    botocore Config settings for all clients, e.g.
+                    max_pool_connections, tcp_keepalive, connect_timeout
+    service_settings : dict
+                    Settings per service overriding client_settings
+    """
+
+    def __init__(self, **client_settings):
+        self.client_settings = {
+            "max_pool_connections": 50,
+            "tcp_keepalive": True,
+        }
+        self.client_settings.update(client_settings)
+        self.service_settings = {}
+        self._lock = threading.RLock()
+        self._sessions = {}
+        self._clients = {}
+        self._local = threading.local()
+        self.retry_policies = {}
+        self.hooks = []
+
+    def add_hook(self, hook):
+        """Installs a hook like the MetricsRecorder on all clients created afterwards
+        """
+        with self._lock:
+            self.hooks.append(hook)
+            self._clients.clear()
+            self._local = threading.local()
+
+    def set_retry_policy(self, service, policy):
+        """Handles the retries of the clients of a service with a policy instead of botocore
+
+        Parameters
+        ----------
+        service : String
+                        Name of the service, e.g. "s3"
+        policy : AdaptiveRetryPolicy
+                        Policy installed on clients created afterwards, botocore retries if None
+        """
+        with self._lock:
+            if policy is None:
+                self.retry_policies.pop(service, None)
+                self.service_settings.get(service, {}).pop("retries", None)
+            else:
+                self.retry_policies[service] = policy
+                self.service_settings.setdefault(service, {})["retries"] = {"mode": "standard",
+                                                                            "total_max_attempts": 1}
+            self._clients.clear()
+            self._local = threading.local()
+
+    def configure(self, service=None, **settings):
+        """Changes the connection settings for clients created afterwards
+
+        Parameters
+        ----------
+        service : String
+                        Service the settings apply to, all services if None
+        settings : dict
+                        botocore Config settings, e.g. max_pool_connections=100
+        """
+        with self._lock:
+            if service:
+                self.service_settings.setdefault(service, {}).update(settings)
+            else:
+                self.client_settings.update(settings)
+            self._clients.clear()
+            self._local = threading.local()
+
+    def get_session(self, profile_name=None):
+        with self._lock:
+            session = self._sessions.get(profile_name)
+            if session is None:
+                session = boto3.Session(profile_name=profile_name)
+                self._sessions[profile_name] = session
+            return session
+
+    def get_client(self, service, region_name=REGION_NAME, profile_name=None):
+        """Returns the shared client of a service, creating it on first use
+
+        Parameters
+        ----------
+        service : String
+                        Name of the service, e.g. "s3" or "ssm"
+        region_name : String
+                        Region of the client
+        profile_name : String
+                        Credentials profile, the default credential chain if None
+
+        Returns
+        -------
+        botocore client
+                        Thread safe client shared by all callers with the same arguments
+        """
+        key = (service, region_name, profile_name)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    settings = dict(self.client_settings)
+                    settings.update(self.service_settings.get(service, {}))
+                    client = self.get_session(profile_name).client(
+                        service, region_name=region_name, config=botocore.config.Config(**settings))
+                    if service in self.retry_policies:
+                        self.retry_policies[service].register(client)
+                    for hook in self.hooks:
+                        hook.register(client)
+                    self._clients[key] = client
+        return client
+
+    def get_resource(self, service, region_name=REGION_NAME, profile_name=None):
+        """Returns a resource of the current thread which sends its requests with the shared client
+        """
+        key = (service, region_name, profile_name)
+        resources = getattr(self._local, "resources", None)
+        if resources is None:
+            resources = self._local.resources = {}
+        resource = resources.get(key)
+        if resource is None:
+            client = self.get_client(service, region_name, profile_name)
+            resource = self.get_session(profile_name).resource(service, region_name=region_name)
+            resource.meta.client = client
+            resources[key] = resource
+        return resource
+
+    def clear(self):
+        """
+        Drops all cached sessions, clients and resources.
+        """
+        with self._lock:
+            self._sessions.clear()
+            self._clients.clear()
+            self._local = threading.local()
+
+
+client_registry = ClientRegistry()
+client_registry.set_retry_policy("s3", s3_retry_policy)
+client_registry.add_hook(metrics)
+
+
+class ParameterCache(object):
+    """Process-wide TTL cache of ssm parameter values
+
+    Concurrent lookups of the same key are coalesced: while one thread loads
+    a key, the other threads wait for its result instead of sending their own
+    request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._inflight = {}
+
+    def fetch(self, keys, loader, ttl):
+        """Returns the cached values of the keys, loading the missing ones with the loader
+
+        Parameters
+        ----------
+        keys : list
+                        Keys to look up
+        loader : function
+                        Called with the list of missing keys, returns a dict of the found values
+        ttl : float
+                        Seconds a loaded value stays valid
+
+        Returns
+        -------
+        dict
+                        Values of the found keys
+        """
+        result = {}
+        to_load = []
+        to_wait = []
+        with self._lock:
+            now = time.monotonic()
+            for key in OrderedDict.fromkeys(keys):
+                entry = self._values.get(key)
+                if entry is not None and entry[1] > now:
+                    result[key] = entry[0]
+                elif key in self._inflight:
+                    to_wait.append((key, self._inflight[key]))
+                else:
+                    self._inflight[key] = threading.Event()
+                    to_load.append(key)
+
+        if to_load:
+            try:
+                loaded = loader(to_load)
+                self.store(loaded, ttl)
+                result.update(loaded)
+            finally:
+                with self._lock:
+                    for key in to_load:
+                        self._inflight.pop(key).set()
+
+        for key, event in to_wait:
+            event.wait()
+            with self._lock:
+                entry = self._values.get(key)
+            if entry is not None:
+                result[key] = entry[0]
+            else:
+                # the other load failed or didn't find the key, try it ourselves
+                result.update(loader([key]))
+        return result
+
+    def store(self, values, ttl):
+        with self._lock:
+            expires = time.monotonic() + ttl
+            for key, value in values.items():
+                self._values[key] = (value, expires)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+parameter_cache = ParameterCache()
+
+
+class S3DiskCache(object):
+    """Read-through cache of S3 objects on local disk, validated by ETag
+
+    Every object version is stored in its own file {etag}.{encoding} in a
+    directory per key, written to a temporary file and moved in place with
+    os.replace. Files are never changed afterwards, so several processes can
+    share the directory without locks. On each read the cached ETag is
+    validated with a conditional GET (If-None-Match): an unchanged object costs
+    a 304 without body, a changed one is downloaded in the same request. A
+    lookup only lists the directory of its key. The size of the cache is
+    tracked from the files written by this process and recounted on each
+    eviction; files not used for the longest time are removed once it exceeds
+    max_size.
+
+    Attributes
+    ----------
+    stats : dict
+                    "hits", "misses", "changed" (misses of a cached key because of a new ETag),
+                    "saved_bytes" and "evictions" of this process
+    """
+
+    def __init__(self, directory=None, max_size=1024 * 1024 * 1024):
+        """
+        Parameters
+        ----------
+        directory : String
+                        Cache directory, defaults to $DATA_UTILS_CACHE_DIR or ~/.cache/data_utils/s3
+        max_size : int
+                        Size of the cache in bytes above which files are evicted
+        """
+        self.directory = directory or os.environ.get("DATA_UTILS_CACHE_DIR") or \
+            os.path.join(os.path.expanduser("~"), ".cache", "data_utils", "s3")
+        self.max_size = max_size
+        self.stats = {"hits": 0, "misses": 0, "changed": 0, "saved_bytes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._size = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def fetch(self, client, bucket, key):
+        """Returns the path of the current version of an object in the cache, downloading it if needed
+
+        Parameters
+        ----------
+        client : botocore client
+                        S3 client used for the conditional GET
+        bucket : String
+                        Name of the bucket
+        key : String
+                        Key of the object
+
+        Returns
+        -------
+        tuple
+                        Path of the cached file and Content-Encoding of the object,
+                        (None, None) if the object does not exist
+        """
+        cached = self._find(bucket, key)
+        params = {"Bucket": bucket, "Key": key}
+        if cached:
+            params["IfNoneMatch"] = cached[1]
+        try:
+            response = client.get_object(**params)
+        except botocore.exceptions.ClientError as e:
+            code = e.response["Error"]["Code"]
+            if cached and code in ("304", "NotModified"):
+                os.utime(cached[0])
+                self._count(hits=1, saved_bytes=os.path.getsize(cached[0]))
+                return cached[0], cached[2]
+            if code in ("404", "NoSuchKey", "NotFound"):
+                self._remove_key(bucket, key)
+                return None, None
+            raise
+
+        encoding = response.get("ContentEncoding")
+        path = self._path(bucket, key, response["ETag"], encoding)
+        self._write(path, response["Body"])
+        self._count(misses=1, changed=1 if cached else 0)
+        if cached and cached[0] != path:
+            self._remove_key(bucket, key, keep=path)
+        self._grow(os.path.getsize(path), keep=path)
+        return path, encoding
+
+    def materialize(self, path, suffix, writer):
+        """Returns a file derived from a cached file, e.g. an Arrow IPC copy, creating it if needed
+
+        The derived file is written atomically like the cached files, counts
+        towards max_size and is evicted and invalidated together with them.
+
+        Parameters
+        ----------
+        path : String
+                        Path of the cached file as returned by fetch
+        suffix : String
+                        Suffix of the derived file, e.g. ".arrow"
+        writer : function
+                        Called with the path of a temporary file to write the derived file to
+
+        Returns
+        -------
+        String
+                        Path of the derived file
+        """
+        target = path + suffix
+        if os.path.exists(target):
+            os.utime(target)
+            return target
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        os.close(descriptor)
+        try:
+            writer(temporary)
+            self._move(temporary, target)
+        except BaseException:
+            self._remove(temporary)
+            raise
+        self._grow(os.path.getsize(target), keep=target)
+        return target
+
+    def evict(self, keep=None):
+        """Removes the least recently used files until the cache is below max_size
+
+        Walks the whole cache directory, so it is only called when the tracked
+        size exceeds max_size.
+
+        Parameters
+        ----------
+        keep : String
+                        Path which is not removed, e.g. the file just downloaded
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".tmp-") and time.time() - entry.stat().st_mtime > 3600:
+                # left behind by a process which died while downloading
+                self._remove(entry.path)
+        for directory, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(directory, name)
+                if name.startswith(".") or directory == self.directory:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            if self._remove(path):
+                self._count(evictions=1)
+                self._remove_empty_directory(os.path.dirname(path))
+            total -= size
+        with self._lock:
+            self._size = total
+
+    def clear(self):
+        for directory, _, files in os.walk(self.directory, topdown=False):
+            for name in files:
+                self._remove(os.path.join(directory, name))
+            if directory != self.directory:
+                self._remove_empty_directory(directory)
+        with self._lock:
+            self._size = 0
+
+    def _key_hash(self, bucket, key):
+        return hashlib.sha256(f"{bucket}/{key}".encode("utf-8")).hexdigest()[:32]
+
+    def _key_directory(self, bucket, key):
+        key_hash = self._key_hash(bucket, key)
+        return os.path.join(self.directory, key_hash[:2], key_hash)
+
+    def _path(self, bucket, key, etag, encoding):
+        # ETags consist of hex digits and "-", encodings of letters
+        return os.path.join(self._key_directory(bucket, key), f"{etag.strip(chr(34))}.{encoding or 'identity'}")
+
+    def _find(self, bucket, key):
+        """Returns path, ETag and Content-Encoding of the newest cached version of the key"""
+        newest = None
+        try:
+            entries = list(os.scandir(self._key_directory(bucket, key)))
+        except FileNotFoundError:
+            return None
+        for entry in entries:
+            # derived files like {cached file}.arrow are skipped
+            if entry.name.count(".") == 1 and not entry.name.startswith("."):
+                try:
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if newest is None or mtime > newest[0]:
+                    newest = (mtime, entry.path, entry.name)
+        if newest is None:
+            return None
+        etag, encoding = newest[2].split(".")
+        return newest[1], f'"{etag}"', None if encoding == "identity" else encoding
+
+    def _write(self, path, body):
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "wb") as cache_file:
+                for chunk in iter(lambda: body.read(1024 * 1024), b""):
+                    cache_file.write(chunk)
+            self._move(temporary, path)
+        except BaseException:
+            self._remove(temporary)
+            raise
+
+    def _move(self, temporary, path):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temporary, path)
+        except FileNotFoundError:
+            # the key directory was removed as empty by a concurrent eviction
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temporary, path)
+
+    def _grow(self, size, keep=None):
+        """Adds written bytes to the tracked size and evicts once it exceeds max_size"""
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            evict = self._size is None or self._size > self.max_size
+        if evict:
+            self.evict(keep=keep)
+
+    def _remove_empty_directory(self, directory):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _remove_key(self, bucket, key, keep=None):
+        try:
+            entries = list(os.scandir(self._key_directory(bucket, key)))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.path != keep and not entry.name.startswith("."):
+                size = entry.stat().st_size if entry.is_file() else 0
+                if self._remove(entry.path):
+                    with self._lock:
+                        if self._size is not None:
+                            self._size -= size
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self.stats[name] += value
 
 
 class SSMBase(object):
     """SSMBase class to handle the ssm requests
+
+    With a cache_ttl, parameter values are cached process-wide for cache_ttl
+    seconds in the parameter_cache, so start-up lookups of many workers don't
+    get throttled. The cache is off by default, as cached values of rotated
+    parameters are stale until they expire. Values are cached per region,
+    profile and endpoint of the client, so instances share them across
+    client_registry.clear() without the cache holding on to clients. Instances
+    with an external session can't tell its credentials apart and get cache
+    entries of their own.
     """
     ssm_conn = None
     logger = None
+    metrics = metrics
+    cache_ttl = 0
+    parameters_batch_size = 10
+
+    def __init__(self, external_sess=None, region_name=REGION_NAME, profile_name=None, cache_ttl=None):
+        self.region_name = region_name
+        self.profile_name = profile_name
+        if cache_ttl is not None:
+            self.cache_ttl = cache_ttl
+        self.ssm_conn = external_sess if external_sess else self.ssm_connect()
+        self._client_identity = (self.ssm_conn.meta.region_name, self.profile_name, self.ssm_conn.meta.endpoint_url,
+                                 uuid.uuid4().hex if external_sess else None)
+        self.logger = gu.get_logger("SSMBase")
+
+    def ssm_connect(self):
+        return client_registry.get_client("ssm", self.region_name, self.profile_name)
+
+    def get_ssm_parameter(self, name, encoded=False, use_cache=True):
+        """Returns the value of a parameter from ssm using the provided name
+
+        Parameters
+        ----------
+        name : String
+                        Name of the parameter
+        use_cache : bool
+                        Answers from the parameter cache if the value is not older than cache_ttl
+
+        Returns
+        -------
+        String
+                        Value of the parameter
+        """
+        if use_cache and self.cache_ttl:
+            target_name = parameter_cache.fetch(
+                [self._cache_key(name)], self._load_cached_parameters, self.cache_ttl)[self._cache_key(name)]
+        else:
+            target_name = self._load_parameter(name)
+
+        return target_name.encode() if encoded else target_name
+
+    def get_ssm_parameters(self, names, encoded=False, use_cache=True):
+        """Returns the values of several parameters, requesting up to 10 names per call
+
+        Parameters
+        ----------
+        names : list
+                        Names of the parameters
+        use_cache : bool
+                        Answers from the parameter cache if the values are not older than cache_ttl
+
+        Returns
+        -------
+        dict
+                        Values by name, names which don't exist are left out
+        """
+        if use_cache and self.cache_ttl:
+            cached = parameter_cache.fetch(
+                [self._cache_key(name) for name in names], self._load_cached_parameters, self.cache_ttl)
+            values = dict((key[1], value) for key, value in cached.items())
+        else:
+            values = self._load_parameters(names)
+
+        return dict((name, value.encode() if encoded else value) for name, value in values.items())
+
+    def prefetch_ssm_parameters_by_path(self, path, recursive=True):
+        """Loads all parameters of a hierarchy with get_parameters_by_path into the cache
+
+        Parameters
+        ----------
+        path : String
+                        Hierarchy of the parameters, e.g. "/platform/buckets"
+        recursive : bool
+                        Also loads the parameters of all sub hierarchies
+
+        Returns
+        -------
+        dict
+                        Values by name of all loaded parameters
+        """
+        values = {}
+        paginator = self.ssm_conn.get_paginator("get_parameters_by_path")
+        for page in paginator.paginate(Path=path, Recursive=recursive, WithDecryption=False):
+            for parameter in page["Parameters"]:
+                values[parameter["Name"]] = parameter["Value"]
+        if self.cache_ttl:
+            parameter_cache.store(
+                dict((self._cache_key(name), value) for name, value in values.items()), self.cache_ttl)
+        return values
+
+    @staticmethod
+    def clear_ssm_cache():
+        """
+        Drops all cached parameter values.
+        """
+        parameter_cache.clear()
+
+    def _cache_key(self, name):
+        return (self._client_identity, name)
+
+    def _load_cached_parameters(self, keys):
+        names = [key[1] for key in keys]
+        if len(names) == 1:
+            values = {names[0]: self._load_parameter(names[0])}
+        else:
+            values = self._load_parameters(names)
+        return dict((self._cache_key(name), value) for name, value in values.items())
+
+    def _load_parameter(self, name):
+        obj = self.ssm_conn.get_parameter(Name=name, WithDecryption=False)
+        return obj["Parameter"]["Value"]
+
+    def _load_parameters(self, names):
+        values = {}
+        for batch in gu.chunk_iterable(names, self.parameters_batch_size):
+            response = self.ssm_conn.get_parameters(Names=batch, WithDecryption=False)
+            for parameter in response["Parameters"]:
+                values[parameter["Name"]] = parameter["Value"]
+            if response.get("InvalidParameters"):
+                self.logger.warning(f"ssm parameters not found: {response['InvalidParameters']}")
+        return values
+
+
+class S3Base(object):
+
+    """S3Base class to handle the s3 requests
+
+    Attributes
+    ----------
+    s3_conn : boto3 s3 resource
+                    Resource sending its requests with the shared client of the client_registry
+    s3_fs : s3fs.S3FileSystem
+                    File system for s3 URIs, created on first use
+    """
+    s3_conn = None
+    logger = None
+    meta_cache = None
+    meta_cache_size = 1024
+    meta_cache_ttl = 30
+    delete_batch_size = 1000
+    transfer_part_size = 8 * 1024 * 1024
+    transfer_concurrency = 10
+    parquet_writer = None
+    metrics = metrics
+    disk_cache = None
+    compaction_target_size = 128 * 1024 * 1024
+    compaction_small_file_size = 32 * 1024 * 1024
+    compaction_lease = 600
+
+    def __init__(self, region_name=REGION_NAME, profile_name=None):
+        """Initialization of class with needed arguments for s3
+
+        Parameters
+        ----------
+        region_name : String
+                        Region of the s3 client
+        profile_name : String
+                        Credentials profile, the default credential chain if None
+        """
+        self.region_name = region_name
+        self.profile_name = profile_name
+        self._s3_fs = None
+        self.s3_connect()
+        self.logger = gu.get_logger("S3Base")
+        self.meta_cache = OrderedDict()
+        self.meta_cache_lock = threading.Lock()
+        self.report_log_writers = {}
+        self.report_log_lock = threading.Lock()
+        self.upload_stats = {"unchanged_checks": 0, "skipped_uploads": 0, "saved_bytes": 0, "saved_requests": 0}
+        self.upload_stats_lock = threading.Lock()
+
+    def s3_connect(self):
+        """
+        Wrapper to get the s3 resource of the shared session from the client_registry
+        """
+        self.s3_conn = client_registry.get_resource("s3", self.region_name, self.profile_name)
+
+    @property
+    def s3_fs(self):
+        if self._s3_fs is None:
+            self._s3_fs = s3fs.S3FileSystem()
+        return self._s3_fs
+
+    def create_s3_uri(self, bucket, key, tmpFileName, FileType=None):
+        """creates and s3 uri: s3://bucket/key
+
+        Arguments:
+                bucket {string} -- bucket name
+                key {string} -- key path
+        """
+        return gu.get_target_path(["s3://", bucket, key, tmpFileName], FileType)
+
+    def parse_s3_uri(self, s3_uri):
+        """splits an s3 uri s3://bucket/key into bucket and key
+
+        Arguments:
+                s3_uri {string} -- s3 uri
+
+        Returns:
+                [tuple] -- bucket name and key path
+        """
+        path = s3_uri[len("s3://"):] if s3_uri.startswith("s3://") else s3_uri
+        bucket, _, key = path.partition("/")
+        return bucket, key
+
+    def check_if_object_exists(self, bucket, key):
+        """
+        Wrapper for checking whether a given object already exists in a bucket or not.
+        Uses a single HEAD request and answers repeated checks within meta_cache_ttl
+        seconds from the metadata cache.
+        return -- True: object exists
+                          False: object does not exist
+        """
+        return self.get_object_metadata(bucket, key) is not None
+
+    def get_object_metadata(self, bucket, key):
+        """Returns the cached metadata of an object, requesting it with a HEAD if needed
+
+        Cached metadata expires after meta_cache_ttl seconds, so external deletes
+        and overwrites are seen after that at the latest. A meta_cache_ttl of 0
+        disables the cache.
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        key : String
+                        Key of the object
+
+        Returns
+        -------
+        dict
+                        ETag, ContentLength and LastModified of the object,
+                        None if the object does not exist
+        """
+        with self.meta_cache_lock:
+            cached = self.meta_cache.get((bucket, key))
+            if cached is not None:
+                expires, meta = cached
+                if time.monotonic() < expires:
+                    self.meta_cache.move_to_end((bucket, key))
+                    return meta
+                del self.meta_cache[(bucket, key)]
+        try:
+            response = self.s3_conn.meta.client.head_object(Bucket=bucket, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if self._is_not_found(e):
+                return None
+            raise
+        return self._cache_object_metadata(bucket, key, response)
+
+    def invalidate_object_metadata(self, bucket, key=None):
+        """Drops cached metadata for an object, or for a whole bucket if no key is given
+        """
+        with self.meta_cache_lock:
+            if key is not None:
+                self.meta_cache.pop((bucket, key), None)
+            else:
+                for cached in [c for c in self.meta_cache if c[0] == bucket]:
+                    del self.meta_cache[cached]
+
+    def _cache_object_metadata(self, bucket, key, response):
+        meta = {
+            "ETag": response.get("ETag"),
+            "ContentLength": response.get("ContentLength"),
+            "LastModified": response.get("LastModified"),
+            "Metadata": response.get("Metadata", {}),
+        }
+        if self.meta_cache_ttl <= 0:
+            return meta
+        with self.meta_cache_lock:
+            self.meta_cache[(bucket, key)] = (time.monotonic() + self.meta_cache_ttl, meta)
+            self.meta_cache.move_to_end((bucket, key))
+            while len(self.meta_cache) > self.meta_cache_size:
+                self.meta_cache.popitem(last=False)
+        return meta
+
+    @staticmethod
+    def _is_not_found(error):
+        return error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound")
+
+    def read_object_range(self, bucket, key, start, end=None):
+        """Reads a byte range of an object with a ranged GET
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        key : String
+                        Key of the object
+        start : int
+                        First byte, a negative start reads the last -start bytes
+        end : int
+                        Last byte, inclusive, up to the end of the object if None
+
+        Returns
+        -------
+        bytes
+                        Content of the range, None if the object does not exist
+        """
+        response = self._get_range(bucket, key, start, end)
+        return None if response is None else response[0]
+
+    def _get_range(self, bucket, key, start, end=None):
+        if start < 0:
+            byte_range = f"bytes={start}"
+        else:
+            byte_range = f"bytes={start}-{'' if end is None else end}"
+        try:
+            response = self.s3_conn.meta.client.get_object(Bucket=bucket, Key=key, Range=byte_range)
+        except botocore.exceptions.ClientError as e:
+            if self._is_not_found(e):
+                return None
+            if e.response["Error"]["Code"] == "InvalidRange":
+                return b"", 0
+            raise
+        content_range = response.get("ContentRange")
+        size = int(content_range.rsplit("/", 1)[1]) if content_range else response["ContentLength"]
+        return response["Body"].read(), size
+
+    def get_object_from_s3(self, bucket, key):
+        """Fetches an object with a single GET request
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        key : String
+                        Key of the object
+
+        Returns
+        -------
+        dict
+                        Response of the GET request, None if the object does not exist
+
+        Raises
+        ------
+        botocore.exceptions.ClientError
+                        For any error other than a missing object
+        """
+        try:
+            response = self.s3_conn.meta.client.get_object(Bucket=bucket, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if self._is_not_found(e):
+                self.invalidate_object_metadata(bucket, key)
+                return None
+            raise
+        self._cache_object_metadata(bucket, key, response)
+        return response
+
+    def list_buckets(self):
+        """
+        Wrapper to print a list of current buckets.
+        """
+        buckets = []
+        for bucket in self.s3_conn.buckets.all():
+            buckets.append(bucket.name)
+        return buckets
+
+    def list_keys(self, bucket, prefix=None):
+        """
+        Wrapper to print a list of bucket-keys.
+        """
+        if prefix:
+            return [obj["Key"] for obj in self.iter_objects(bucket, prefix)]
+        else:
+            return []
+
+    def iter_objects(self, bucket, prefix="", page_size=1000):
+        """Lazily lists the objects under a prefix with list_objects_v2 pagination
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        prefix : String
+                        Prefix of the keys, the whole bucket is listed if empty
+        page_size : int
+                        Number of keys requested per page
+
+        Returns
+        -------
+        generator
+                        dicts with Key, Size, ETag and LastModified of each object
+        """
+        paginator = self.s3_conn.meta.client.get_paginator("list_objects_v2")
+        pages = paginator.paginate(Bucket=bucket, Prefix=prefix or "",
+                                   PaginationConfig={"PageSize": page_size})
+        for page in pages:
+            for obj in page.get("Contents", []):
+                yield {"Key": obj["Key"], "Size": obj["Size"], "ETag": obj["ETag"],
+                       "LastModified": obj["LastModified"]}
+
+    def list_common_prefixes(self, bucket, prefix="", delimiter="/"):
+        """Lists only the next level below a prefix, e.g. all partition_mandator= prefixes
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        prefix : String
+                        Parent prefix, a trailing delimiter is added if missing
+        delimiter : String
+                        Delimiter between the levels of the key
+
+        Returns
+        -------
+        list
+                        Full prefixes of the next level, each ending with the delimiter
+        """
+        if prefix and not prefix.endswith(delimiter):
+            prefix += delimiter
+        paginator = self.s3_conn.meta.client.get_paginator("list_objects_v2")
+        prefixes = []
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix or "", Delimiter=delimiter):
+            for common_prefix in page.get("CommonPrefixes", []):
+                prefixes.append(common_prefix["Prefix"])
+        return prefixes
+
+    def list_partition_values(self, bucket, prefix=""):
+        """Returns the values of the next Hive style partition level below a prefix
+
+        e.g. ["a", "b"] for the prefixes .../partition_mandator=a/ and .../partition_mandator=b/
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        prefix : String
+                        Parent prefix
+
+        Returns
+        -------
+        list
+                        Values of the partitions, prefixes which are no partitions are skipped
+        """
+        values = []
+        for partition in self.list_common_prefixes(bucket, prefix):
+            name = partition.rstrip("/").rsplit("/", 1)[-1]
+            if "=" in name:
+                values.append(name.split("=", 1)[1])
+        return values
+
+    def iter_objects_in_prefixes(self, bucket, prefixes, max_workers=8):
+        """Lists several sibling prefixes in parallel, e.g. all daily partitions of a year
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        prefixes : list
+                        Prefixes to list
+        max_workers : int
+                        Number of prefixes listed at the same time
+
+        Returns
+        -------
+        generator
+                        dicts as in iter_objects, grouped per prefix in completion order.
+                        At most max_workers prefix listings are held at a time, the next
+                        prefixes are listed as the results are consumed.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            for prefix in prefixes:
+                if len(pending) >= max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+                pending.add(executor.submit(lambda p: list(self.iter_objects(bucket, p)), prefix))
+            for future in as_completed(pending):
+                yield from future.result()
+
+    def load_list_file_from_s3(self, bucket, key):
+        """
+        Wrapper for getting file list with key from S3 bucket.
+        return -- objectlist of file content
+        """
+        try:
+            response = self.get_object_from_s3(bucket, key)
+            if response is None:
+                return None
+            return self._decode_payload(
+                response["Body"].read(), "lines", self._response_compression(key, response))
+        except botocore.exceptions.ClientError as e:
+            self.logger.warning(
+                f"The following error occured while loading {key} from bucket {bucket}: {e}")
+            return []
+
+    def enable_disk_cache(self, directory=None, max_size=1024 * 1024 * 1024):
+        """Caches the objects read by load_file_from_s3, load_json_from_s3 and
+        load_parquet_with_wrangler on local disk, see S3DiskCache
+
+        Returns
+        -------
+        S3DiskCache
+                        The cache, its stats show the hits and misses
+        """
+        self.disk_cache = S3DiskCache(directory, max_size)
+        return self.disk_cache
+
+    def get_cached_file(self, bucket, key):
+        """Returns the path of an object in the disk cache, downloading it if needed
+
+        Returns
+        -------
+        tuple
+                        Path and Content-Encoding, (None, None) if the object does not exist
+        """
+        return self.disk_cache.fetch(self.s3_conn.meta.client, bucket, key)
+
+    def read_arrow_from_cache(self, bucket, key, columns=None, as_pandas=False, materialize_ipc=True):
+        """Reads a parquet or Arrow IPC (.arrow, .feather) object memory-mapped from the disk cache
+
+        Parquet files are converted once into an uncompressed Arrow IPC file next
+        to the cached file. Mapping it gives a table whose buffers are pages of
+        the OS page cache instead of process memory, so all processes on a host
+        reading the same object share one physical copy. With materialize_ipc=False
+        the parquet file is only read through a memory map and decoded into
+        process memory.
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        key : String
+                        Key of the parquet or Arrow IPC object
+        columns : list
+                        Columns to read, all columns if None
+        as_pandas : bool
+                        Convert the table to a Pandas DataFrame, which copies the data
+        materialize_ipc : bool
+                        Convert parquet files to Arrow IPC for zero-copy reads
+
+        Returns
+        -------
+        pyarrow Table or Pandas DataFrame
+                        None if the object does not exist
+
+        Raises
+        ------
+        ValueError
+                        If the disk cache is not enabled
+        """
+        if self.disk_cache is None:
+            raise ValueError("the disk cache is not enabled, see enable_disk_cache")
+        path, _ = self.get_cached_file(bucket, key)
+        if path is None:
+            return None
+        if key.endswith(".parquet"):
+            if not materialize_ipc:
+                table = pq.read_table(path, columns=columns, memory_map=True)
+                return table.to_pandas() if as_pandas else table
+            path = self.disk_cache.materialize(path, ".arrow", lambda target: self.write_ipc_file(path, target))
+        return self.read_ipc_file(path, columns, as_pandas)
+
+    @staticmethod
+    def write_ipc_file(parquet_path, target):
+        """Converts a parquet file row group by row group into an uncompressed Arrow IPC file
+        """
+        parquet_file = pq.ParquetFile(parquet_path)
+        with pa.OSFile(target, "wb") as sink:
+            with pa.ipc.new_file(sink, parquet_file.schema_arrow) as writer:
+                for batch in parquet_file.iter_batches():
+                    writer.write_batch(batch)
+
+    @staticmethod
+    def read_ipc_file(path, columns=None, as_pandas=False):
+        """Reads an Arrow IPC file zero-copy through a memory map
+
+        Returns
+        -------
+        pyarrow Table or Pandas DataFrame
+                        The buffers of the table stay mapped as long as the table is referenced
+        """
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        if columns:
+            table = table.select(columns)
+        return table.to_pandas() if as_pandas else table
+
+    def load_file_from_s3(self, bucket, key, decompress=False, use_cache=True):
+        """
+        Wrapper for loading a file with key from S3 bucket.
+        With decompress=True gzip or zstd compressed objects are decompressed,
+        detected from the Content-Encoding or the suffix of the key.
+        If the disk cache is enabled the file is read through it unless use_cache is False.
+        return -- object of file content
+        """
+        if self.disk_cache is not None and use_cache:
+            try:
+                path, encoding = self.get_cached_file(bucket, key)
+                if path is None:
+                    return None
+                with open(path, "rb") as cache_file:
+                    data = cache_file.read()
+                return gu.decompress_bytes(data, gu.detect_compression(key, encoding)) if decompress else data
+            except FileNotFoundError:
+                # evicted by another process in the meantime
+                pass
+            except botocore.exceptions.ClientError as e:
+                self.logger.warning(
+                    "The following error occured while loading %s from bucket %s: %s" % (key, bucket, e))
+                return None
+        try:
+            response = self.get_object_from_s3(bucket, key)
+            if response is None:
+                return None
+            if decompress:
+                return gu.decompress_bytes(response["Body"].read(), self._response_compression(key, response))
+            return response["Body"].read()
+        except botocore.exceptions.ClientError as e:
+            self.logger.warning(
+                "The following error occured while loading %s from bucket %s: %s" % (key, bucket, e))
+            return None
+
+    def load_json_from_s3(self, bucket, key):
+        """
+        Wrapper for loading a json-file with key form given S3 bucket.
+        return -- object of json file
+        """
+        binary_data = self.load_file_from_s3(bucket, key, decompress=True)
+
+        if binary_data:
+            try:
+                return self._decode_payload(binary_data, "json")
+            except Exception as e:
+                self.logger.critical(
+                    "could not convert %s, Exception: %s" % (key, e))
+        else:
+            return None
+
+    def iter_lines_from_s3(self, bucket, key, parse_json=False, batch_size=None, compression="auto", chunk_size=1024 * 1024):
+        """Streams the lines of a (compressed) jsonp/ndjson object without loading it into memory
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        key : String
+                        Key of the object
+        parse_json : bool
+                        Parses each line to json lazily
+        batch_size : int
+                        Yields lists of up to batch_size records instead of single records
+        compression : String
+                        "gzip", "zstd", None for uncompressed objects or "auto" to detect it
+                        from the Content-Encoding or the suffix of the key
+        chunk_size : int
+                        Number of bytes read from the body at once
+
+        Returns
+        -------
+        generator
+                        Lines as str (or parsed json) with empty lines skipped,
+                        None if the object does not exist
+        """
+        response = self.get_object_from_s3(bucket, key)
+        if response is None:
+            return None
+        if compression == "auto":
+            compression = gu.detect_compression(key, response.get("ContentEncoding"))
+        stream = gu.open_decompressed_stream(response["Body"], compression)
+        if parse_json:
+            records = (gu.json_loads(line) for line in gu.iter_stream_lines(stream, chunk_size))
+        else:
+            records = (line.decode("utf-8") for line in gu.iter_stream_lines(stream, chunk_size))
+        return gu.chunk_iterable(records, batch_size) if batch_size else records
+
+    def load_files_from_s3(self, bucket, keys=None, prefix=None, decode="bytes", max_workers=10, ordered=False):
+        """Loads many objects concurrently over one shared connection pool
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        keys : iterable
+                        Keys to load
+        prefix : String
+                        Loads all objects under this prefix if no keys are given
+        decode : String
+                        "bytes" as load_file_from_s3, "lines" as load_list_file_from_s3
+                        or "json" as load_json_from_s3, compressed objects are
+                        decompressed for "lines" and "json"
+        max_workers : int
+                        Number of objects loaded at the same time, should not exceed
+                        the max_pool_connections of the client
+        ordered : bool
+                        Yields in the order of the keys instead of completion order
+
+        Returns
+        -------
+        generator
+                        (key, payload) tuples, payload is None for a missing object and an
+                        S3ObjectError if loading or decoding the object failed
+        """
+        if keys is None:
+            keys = (obj["Key"] for obj in self.iter_objects(bucket, prefix)) if prefix else []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque() if ordered else set()
+            for key in keys:
+                if len(pending) >= 2 * max_workers:
+                    if ordered:
+                        yield pending.popleft().result()
+                    else:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                future = executor.submit(self._load_and_decode, bucket, key, decode)
+                if ordered:
+                    pending.append(future)
+                else:
+                    pending.add(future)
+            if ordered:
+                while pending:
+                    yield pending.popleft().result()
+            else:
+                for future in as_completed(pending):
+                    yield future.result()
+
+    def _load_and_decode(self, bucket, key, decode):
+        try:
+            response = self.get_object_from_s3(bucket, key)
+            if response is None:
+                return key, None
+            return key, self._decode_payload(
+                response["Body"].read(), decode, self._response_compression(key, response))
+        except Exception as e:
+            return key, S3ObjectError(bucket, key, e)
+
+    @staticmethod
+    def _response_compression(key, response):
+        return gu.detect_compression(key, response.get("ContentEncoding"))
+
+    @staticmethod
+    def _decode_payload(data, decode, compression=None):
+        if decode == "bytes":
+            return data
+        data = gu.decompress_bytes(data, compression)
+        if decode == "lines":
+            return data.decode("utf-8").split("\n")
+        if decode == "json":
+            return gu.json_loads(data)
+        raise ValueError(f"unknown decode mode {decode}")
+
+    def load_parquet_with_wrangler(self, s3_uri, use_cache=True):
+        """Reads a parquet file or dataset with awswrangler
+
+        Single .parquet files are read through the disk cache if it is enabled.
+        """
+        try:
+            if self.disk_cache is not None and use_cache and s3_uri.endswith(".parquet"):
+                path, _ = self.get_cached_file(*self.parse_s3_uri(s3_uri))
+                if path is None:
+                    return None
+                try:
+                    table = pq.read_table(path)
+                except FileNotFoundError:
+                    # evicted by another process in the meantime
+                    pass
+                else:
+                    # converted like wr.s3.read_parquet, so cached reads return the same dtypes
+                    return table.to_pandas(types_mapper=_nullable_pandas_dtype)
+            return wr.s3.read_parquet(s3_uri)
+        except Exception as e:
+            self.logger.critical(
+                f"couldn't read paruqet file {s3_uri}, Exception {e}")
+
+    def create_partition_prefixes(self, bucket, data_type, start_date=None, stop_date=None, mandators=None,
+                                  personal=False, master_data=False):
+        """Returns the prefixes holding the partitions of a data_type for a date range and mandators
+
+        Follows the layouts of create_data_key (one prefix per mandator and day)
+        and, with master_data, of create_data_key_dimension (one prefix per mandator).
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        data_type : String
+                        Transaction, or master data type with master_data
+        start_date : datetime or String %Y-%m-%d
+                        First day, strings and None are resolved with generalutils.check_start_stop_date
+        stop_date : datetime or String %Y-%m-%d
+                        Last day, inclusive
+        mandators : list
+                        Mandators to read, all mandators found in the bucket if None
+        personal : bool
+                        Whether the data is personal
+        master_data : bool
+                        Whether data_type is master data, which is not partitioned by date
+
+        Returns
+        -------
+        list
+                        Prefixes ending with "/"
+        """
+        root = f"personal={personal}/master_data={data_type}/" if master_data else \
+            f"personal={personal}/transaction={data_type}/"
+        if mandators is None:
+            mandators = self.list_partition_values(bucket, root)
+        elif isinstance(mandators, str):
+            mandators = [mandators]
+        if master_data:
+            return [f"{root}partition_mandator={mandator}/" for mandator in mandators]
+
+        if start_date is None or isinstance(start_date, str):
+            start_date, stop_date = gu.check_start_stop_date(start_date, stop_date)
+        days = list(gu.iter_days(start_date, stop_date or start_date))
+        return [self.create_data_key(day, None, data_type, mandator, personal=personal, parquet=True) + "/"
+                for mandator in mandators for day in days]
+
+    def load_partitioned_parquet_from_s3(self, bucket, data_type, start_date=None, stop_date=None, mandators=None,
+                                         personal=False, master_data=False, columns=None, filters=None,
+                                         max_workers=8, as_arrow=False):
+        """Reads the parquet partitions of a data_type for a date range and mandators
+
+        Only the prefixes of create_partition_prefixes are listed. Each file is read
+        with ranged GETs, so only the footer and the column chunks of the requested
+        columns in row groups matching the filters are downloaded. The partition
+        values of the key path (partition_mandator, partition_year, ... as in
+        create_data_key) are added as dictionary encoded string columns unless the
+        file stores them, and schemas which differ between the files are promoted
+        to a common schema (missing columns become null).
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        data_type, start_date, stop_date, mandators, personal, master_data :
+                        Partitions to read, see create_partition_prefixes
+        columns : list
+                        Columns to read including partition columns, all columns if None
+        filters : list
+                        Predicates on the columns of the files in the pyarrow.parquet.read_table
+                        format, e.g. [("amount", ">", 100)], used to skip row groups by their statistics
+        max_workers : int
+                        Number of files listed and read at the same time
+        as_arrow : bool
+                        Return a pyarrow Table instead of a Pandas DataFrame
+
+        Returns
+        -------
+        Pandas DataFrame or pyarrow Table
+                        Rows of all matching files, None if no file matches
+        """
+        prefixes = self.create_partition_prefixes(bucket, data_type, start_date, stop_date, mandators,
+                                                  personal, master_data)
+        objects = self._parquet_data_files(bucket, self.iter_objects_in_prefixes(bucket, prefixes, max_workers))
+        if not objects:
+            return None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            tables = list(executor.map(lambda obj: self._read_partition_file(bucket, obj, columns, filters), objects))
+        table = pa.concat_tables(tables, promote_options="default")
+        return table if as_arrow else table.to_pandas()
+
+    @staticmethod
+    def _partition_values(key):
+        """Returns the partition values of the key path, e.g. {"partition_mandator": "vnr", "partition_day": "11"}"""
+        return dict(segment.split("=", 1) for segment in key.split("/")[:-1]
+                    if segment.startswith("partition_") and "=" in segment)
+
+    def _read_partition_file(self, bucket, obj, columns=None, filters=None):
+        partition = self._partition_values(obj["Key"])
+        table = pq.read_table(
+            _S3ObjectFile(self.s3_conn.meta.client, bucket, obj["Key"], obj["Size"], obj.get("ETag")),
+            columns=[column for column in columns if column not in partition] if columns else None,
+            filters=filters)
+        for name, value in partition.items():
+            if name not in table.column_names and (not columns or name in columns):
+                indices = pa.nulls(table.num_rows, pa.int32()).fill_null(0)
+                table = table.append_column(name, pa.DictionaryArray.from_arrays(indices, pa.array([value])))
+        return table.select(columns) if columns else table
+
+    def iter_parquet_from_s3(self, s3_uri, columns=None, batch_size=65536, batch_bytes=None, prefetch=2,
+                             as_arrow=False, stats=None):
+        """Iterates over a parquet object or all parquet objects below a prefix in bounded batches
+
+        The files are read with ranged GETs, one row group at a time. A background
+        thread reads ahead up to prefetch batches, so downloading and decoding the
+        next row group overlaps with processing the current batch, while the memory
+        in use stays proportional to batch size times prefetch.
+
+        Parameters
+        ----------
+        s3_uri : String
+                        s3://bucket/key of a parquet object, or a prefix ending with "/"
+        columns : list
+                        Columns to read, all columns if None
+        batch_size : int
+                        Maximum number of rows per batch
+        batch_bytes : int
+                        Maximum uncompressed size of a batch in bytes, estimated from the
+                        row group metadata; overrides batch_size if given
+        prefetch : int
+                        Number of batches read ahead
+        as_arrow : bool
+                        Yield pyarrow RecordBatches instead of Pandas DataFrames
+        stats : dict
+                        Filled with "files", "batches", "rows", "peak_buffered_bytes" (bytes of
+                        the batches read ahead) and "peak_arrow_bytes" (pyarrow allocations)
+
+        Yields
+        ------
+        Pandas DataFrame or pyarrow RecordBatch
+                        Batches of at most batch_size rows, a batch never spans two files
+        """
+        bucket, key = self.parse_s3_uri(s3_uri)
+        if key.endswith(".parquet"):
+            meta = self.get_object_metadata(bucket, key)
+            objects = [{"Key": key, "Size": meta["ContentLength"], "ETag": meta["ETag"]}] if meta else []
+        else:
+            objects = self._parquet_data_files(bucket, self.iter_objects(bucket, key))
+        for batch in self._iter_parquet_batches(bucket, objects, columns, batch_size, batch_bytes, prefetch, stats):
+            yield batch if as_arrow else batch.to_pandas()
+
+    def _iter_parquet_batches(self, bucket, objects, columns=None, batch_size=65536, batch_bytes=None, prefetch=2,
+                              stats=None):
+        stats = {} if stats is None else stats
+        stats.update({"files": 0, "batches": 0, "rows": 0, "peak_buffered_bytes": 0, "peak_arrow_bytes": 0})
+
+        batches = queue.Queue(maxsize=max(1, prefetch))
+        stop = threading.Event()
+        buffered = [0]
+        buffered_lock = threading.Lock()
+        done = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def read_ahead():
+            try:
+                client = self.s3_conn.meta.client
+                for obj in objects:
+                    parquet_file = pq.ParquetFile(_S3ObjectFile(client, bucket, obj["Key"], obj["Size"],
+                                                                obj.get("ETag")))
+                    rows = self._parquet_batch_rows(parquet_file.metadata, columns, batch_size, batch_bytes)
+                    stats["files"] += 1
+                    for batch in self._rebatch(parquet_file.iter_batches(batch_size=rows, columns=columns), rows):
+                        with buffered_lock:
+                            buffered[0] += batch.nbytes
+                            stats["peak_buffered_bytes"] = max(stats["peak_buffered_bytes"], buffered[0])
+                        if not put(batch):
+                            return
+                put(done)
+            except Exception as e:
+                put(e)
 
-    def __init__(self, external_sess=None):
-        self.ssm_conn = external_sess if external_sess else self.ssm_connect()
-        self.logger = gu.get_logger("SSMBase")
+        reader = threading.Thread(target=read_ahead, daemon=True)
+        reader.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is done:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                with buffered_lock:
+                    buffered[0] -= batch.nbytes
+                stats["batches"] += 1
+                stats["rows"] += batch.num_rows
+                stats["peak_arrow_bytes"] = max(stats["peak_arrow_bytes"], pa.total_allocated_bytes())
+                yield batch
+        finally:
+            stop.set()
+            reader.join()
 
-    def ssm_connect(self):
-        session = boto3.Session()
-        ssm_conn = session.client("ssm", region_name='eu-central-1')
-        return ssm_conn
+    @staticmethod
+    def _is_parquet_data_file(key):
+        """Whether a key is a parquet data file, files starting with "_" or "." are skipped as Athena does"""
+        return key.endswith(".parquet") and not key.rsplit("/", 1)[-1].startswith(("_", "."))
 
-    def get_ssm_parameter(self, name, encoded=False):
-        """Returns the value of a parameter from ssm using the provided name
+    @staticmethod
+    def _is_compaction_manifest(key):
+        name = key.rsplit("/", 1)[-1]
+        return name.startswith("_compaction_") and name.endswith(".json")
+
+    def _parquet_data_files(self, bucket, objects):
+        """Returns the parquet data files of a listing as the readers of S3Base see them
+
+        Compaction manifests in the listing are honoured, see compact_partition: the
+        inputs of a committed manifest are skipped as long as they have the recorded
+        ETag and its outputs are read from the staged files until they are copied in
+        place, the outputs of a manifest which is rolled back are skipped.
 
         Parameters
         ----------
-        name : String
-                        Name of the parameter
+        bucket : String
+                        Name of the bucket
+        objects : iterable
+                        Listed objects as in iter_objects
 
         Returns
         -------
-        String
-                        Value of the parameter
+        list
+                        Objects of the data files sorted by key
         """
-        obj = self.ssm_conn.get_parameter(Name=name, WithDecryption=False)
-        target_name = obj["Parameter"]["Value"]
+        objects = list(objects)
+        listed = dict((obj["Key"], obj) for obj in objects)
+        superseded = {}
+        hidden = set()
+        staged = []
+        for obj in objects:
+            if not self._is_compaction_manifest(obj["Key"]):
+                continue
+            manifest = self.load_json_from_s3(bucket, obj["Key"])
+            if manifest is None:
+                continue
+            if manifest["state"] == "rolling_back":
+                hidden.update(output["key"] for output in manifest["outputs"])
+            elif manifest["state"] == "committed":
+                superseded.update((item["key"], item["etag"]) for item in manifest["inputs"])
+                for output in manifest["outputs"]:
+                    if output["key"] in listed:
+                        continue
+                    # listed before the output was copied in place
+                    for key in (output["staged"], output["key"]):
+                        self.invalidate_object_metadata(bucket, key)
+                        meta = self.get_object_metadata(bucket, key)
+                        if meta is not None:
+                            staged.append({"Key": key, "Size": meta["ContentLength"], "ETag": meta["ETag"]})
+                            break
+        files = [obj for obj in objects if self._is_parquet_data_file(obj["Key"]) and obj["Key"] not in hidden
+                 and superseded.get(obj["Key"]) != obj["ETag"]]
+        return sorted(files + staged, key=lambda obj: obj["Key"])
 
-        return target_name.encode() if encoded else target_name
+    @staticmethod
+    def _parquet_batch_rows(metadata, columns, batch_size, batch_bytes):
+        if not batch_bytes or not metadata.num_rows:
+            return batch_size
+        names = metadata.schema.names
+        selected = set(columns) if columns else set(names)
+        size = sum(metadata.row_group(i).column(j).total_uncompressed_size
+                   for i in range(metadata.num_row_groups)
+                   for j in range(metadata.num_columns) if names[j] in selected)
+        return max(1, int(batch_bytes // max(1, size / metadata.num_rows)))
 
+    @staticmethod
+    def _rebatch(batches, rows):
+        """Joins the batches, which end at row group boundaries, into batches of rows rows"""
+        pending = []
+        pending_rows = 0
+        for batch in batches:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            while pending_rows >= rows:
+                table = pa.Table.from_batches(pending)
+                for joined in table.slice(0, rows).combine_chunks().to_batches():
+                    yield joined
+                rest = table.slice(rows)
+                pending = rest.combine_chunks().to_batches() if rest.num_rows else []
+                pending_rows = rest.num_rows
+        if pending_rows:
+            for joined in pa.Table.from_batches(pending).combine_chunks().to_batches():
+                yield joined
 
-class S3Base(object):
+    def find_compaction_candidates(self, bucket, prefix="", small_file_size=None, min_files=2):
+        """Finds partitions holding at least min_files parquet files smaller than small_file_size
 
-    """S3Base class to handle the s3 requests
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        prefix : String
+                        Prefix to search, e.g. "personal=False/transaction=order/"
+        small_file_size : int
+                        Files below this size in bytes are compacted, defaults to compaction_small_file_size
+        min_files : int
+                        Minimum number of small files for a partition to be compacted
 
-    Attributes
-    ----------
-    s3_client : TYPE
-                    Description
-    s3_resource : TYPE
-                    Description
-    """
-    s3_conn = None
-    logger = None
-    s3_fs = None
+        Returns
+        -------
+        dict
+                        Small files as in iter_objects by partition prefix
+        """
+        small_file_size = small_file_size or self.compaction_small_file_size
+        partitions = {}
+        for obj in self._parquet_data_files(bucket, self.iter_objects(bucket, prefix)):
+            if obj["Size"] < small_file_size:
+                partitions.setdefault(obj["Key"].rsplit("/", 1)[0] + "/", []).append(obj)
+        return dict((partition, sorted(objects, key=lambda obj: obj["Key"]))
+                    for partition, objects in partitions.items() if len(objects) >= min_files)
 
-    def __init__(self):
-        """Initialization of class with needed arguments for s3
+    def compact_partitions(self, bucket, prefix="", target_size=None, small_file_size=None, min_files=2,
+                           parquet_writer=None, max_workers=4):
+        """Compacts all partitions below a prefix holding too many small parquet files
+
+        Interrupted compactions below the prefix are recovered first, see recover_compactions.
+
+        Returns
+        -------
+        list
+                        Manifests of the compacted partitions, failed partitions are
+                        rolled back, logged and skipped
+        """
+        self.recover_compactions(bucket, prefix)
+        candidates = self.find_compaction_candidates(bucket, prefix, small_file_size, min_files)
+        manifests = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = dict((executor.submit(self.compact_partition, bucket, partition, objects, target_size,
+                                            small_file_size, min_files, parquet_writer), partition)
+                           for partition, objects in candidates.items())
+            for future in as_completed(futures):
+                try:
+                    manifests.append(future.result())
+                except Exception as e:
+                    self.logger.error(f"couldn't compact s3://{bucket}/{futures[future]}, error: {e}")
+        return manifests
+
+    def compact_partition(self, bucket, prefix, objects=None, target_size=None, small_file_size=None, min_files=2,
+                          parquet_writer=None):
+        """Merges the small parquet files of one partition into files of about target_size bytes
+
+        The files are merged batch by batch, so the partition is never loaded as a whole.
+        Only files directly below prefix are merged; the partition_chunk= prefixes of master
+        data are rewritten chunk by chunk by their writers and are not merged with each other.
+        The swap is driven by a manifest {prefix}_compaction_{run_id}.json:
+
+        1. the manifest is stored with state "pending", the ETags of the input files and a
+           lease of compaction_lease seconds, which is renewed while the compaction runs
+        2. the merged files are staged as {prefix}_{run_id}-{n}_{name}.parquet, hidden from
+           Athena and the readers of S3Base by the leading underscore
+        3. the manifest is checked to be still pending, the staged files to exist and row
+           counts and input ETags to match; on any failure the staged files and the
+           manifest are deleted and the partition is unchanged
+        4. the manifest is stored with state "committed". From now on the readers of S3Base
+           skip the inputs with the recorded ETags and read the outputs, see
+           _parquet_data_files. If an input changed, the compaction is rolled back: the
+           manifest is stored with state "rolling_back", which hides the outputs from the
+           readers, before the outputs, the staged files and the manifest are deleted
+        5. the staged files are copied to {prefix}{run_id}-{n}_{name}.parquet and the input
+           files, the staged files and the manifest are deleted. Each input is deleted with
+           a conditional DeleteObject on its ETag; if one changed in the meantime the
+           compaction fails and the manifest is kept for a manual look
+
+        If the run dies, recover_compactions rolls a pending manifest back once its lease
+        expired and a committed one forward. Readers of S3Base never see duplicate or
+        missing rows; readers which don't honour the manifests, e.g. Athena, see the rows
+        of the inputs and the outputs between the copy and the deletion of the inputs.
 
         Parameters
         ----------
-        """
-        self.s3_connect()
-        self.logger = gu.get_logger("S3Base")
+        bucket : String
+                        Name of the bucket
+        prefix : String
+                        Partition prefix, e.g. create_data_key(..., parquet=True)
+        objects : list
+                        Files to merge as in iter_objects, the small files directly below prefix if None
+        target_size : int
+                        Size of the merged files in bytes, defaults to compaction_target_size
+        small_file_size : int
+                        Files below this size are merged, defaults to compaction_small_file_size
+        min_files : int
+                        Minimum number of small files to compact the partition
+        parquet_writer : String or dict
+                        Writer configuration of the merged files, see resolve_parquet_writer
 
-    def s3_connect(self):
-        """
-        Wrapper to create a session at AWS S3 with given authorization-key
+        Returns
+        -------
+        dict
+                        Committed manifest, None if the partition has too few small files
+
+        Raises
+        ------
+        ValueError
+                        If an input file changed or the row counts differ, after the rollback
+                        if the partition could be rolled back
         """
-        session = boto3.Session()
-        self.s3_conn = session.resource("s3", region_name='eu-central-1')
-        self.s3_fs = S3FileSystem()
+        prefix = prefix if prefix.endswith("/") else prefix + "/"
+        if objects is None:
+            small_file_size = small_file_size or self.compaction_small_file_size
+            objects = [obj for obj in self._parquet_data_files(bucket, self.iter_objects(bucket, prefix))
+                       if "/" not in obj["Key"][len(prefix):] and obj["Size"] < small_file_size]
+        if len(objects) < max(min_files, 1):
+            return None
 
-    def create_s3_uri(self, bucket, key, tmpFileName, FileType=None):
-        """creates and s3 uri: s3://bucket/key
+        run_id = f"{time.strftime('%Y%m%d%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+        manifest_key = f"{prefix}_compaction_{run_id}.json"
+        manifest = {"run_id": run_id, "prefix": prefix, "state": "pending",
+                    "owner": f"{socket.gethostname()}:{os.getpid()}", "lease_expires": 0,
+                    "inputs": [{"key": obj["Key"], "etag": obj["ETag"]} for obj in objects], "outputs": []}
+        self._renew_compaction_lease(bucket, manifest_key, manifest)
+        try:
+            manifest["outputs"] = self._write_compacted_files(
+                bucket, prefix, objects, run_id, target_size or self.compaction_target_size, parquet_writer,
+                lambda: self._renew_compaction_lease(bucket, manifest_key, manifest))
+            self._verify_compaction(bucket, manifest_key, manifest)
+        except Exception:
+            self._rollback_compaction(bucket, manifest_key, manifest)
+            raise
+        manifest["state"] = "committed"
+        self.upload_as_json_to_s3(manifest, bucket, manifest_key)
+        self._finish_compaction(bucket, manifest_key, manifest)
+        return manifest
 
-        Arguments:
-                bucket {string} -- bucket name
-                key {string} -- key path
-        """
-        return gu.get_target_path(["s3://", bucket, key, tmpFileName], FileType)
+    def recover_compactions(self, bucket, prefix="", stale_after=3600):
+        """Finishes or rolls back compactions interrupted by a failure
 
-    def check_if_object_exists(self, bucket, key):
-        """
-        Wrapper for checking whether a given object already exists in a bucket or not.
-        return -- True: object exists
-                          False: object does not exist
-        """
-        bucket = self.s3_conn.Bucket(bucket)
-        objs = list(bucket.objects.filter(Prefix=key))
-        if len(objs) > 0 and objs[0].key == key:
-            return True
-        else:
-            return False
+        Committed manifests are rolled forward, interrupted rollbacks are finished and
+        pending manifests are rolled back once their lease expired. Pending manifests
+        with a valid lease belong to a running compaction and are left alone. Manifests
+        without a lease are rolled back stale_after seconds after they were stored.
 
-    def list_buckets(self):
-        """
-        Wrapper to print a list of current buckets.
+        Returns
+        -------
+        dict
+                        "rolled_forward" and "rolled_back" manifest keys
         """
-        buckets = []
-        for bucket in self.s3_conn.buckets.all():
-            buckets.append(bucket.name)
-        return buckets
+        result = {"rolled_forward": [], "rolled_back": []}
+        for obj in list(self.iter_objects(bucket, prefix)):
+            if not self._is_compaction_manifest(obj["Key"]):
+                continue
+            manifest = self.load_json_from_s3(bucket, obj["Key"])
+            if manifest is None:
+                continue
+            if manifest["state"] == "committed":
+                self._finish_compaction(bucket, obj["Key"], manifest)
+                result["rolled_forward"].append(obj["Key"])
+            elif manifest["state"] == "rolling_back" or time.time() >= manifest.get("lease_expires", obj["LastModified"].timestamp() + stale_after):
+                self._rollback_compaction(bucket, obj["Key"], manifest)
+                result["rolled_back"].append(obj["Key"])
+        return result
 
-    def list_keys(self, bucket, prefix=None):
-        """
-        Wrapper to print a list of bucket-keys.
-        """
-        bucket = self.s3_conn.Bucket(bucket)
-        keys_list = []
-        if prefix:
-            for obj in bucket.objects.filter(Prefix=prefix):
-                keys_list.append(obj.key)
-            return keys_list
-        else:
-            return []
+    def _renew_compaction_lease(self, bucket, manifest_key, manifest, force=False):
+        # renewed once a third of the lease is used up, so a running compaction is never recovered
+        if force or manifest["lease_expires"] - time.time() < self.compaction_lease * 2 / 3:
+            manifest["lease_expires"] = time.time() + self.compaction_lease
+            self.upload_as_json_to_s3(manifest, bucket, manifest_key)
 
-    def load_list_file_from_s3(self, bucket, key):
-        """
-        Wrapper for getting file list with key from S3 bucket.
-        return -- objectlist of file content
+    def _write_compacted_files(self, bucket, prefix, objects, run_id, target_size, parquet_writer, heartbeat):
+        name = objects[0]["Key"].rsplit("/", 1)[-1].split("_", 1)[-1]
+        kwargs = self.parquet_write_kwargs(pq.ParquetFile(
+            _S3ObjectFile(self.s3_conn.meta.client, bucket, objects[0]["Key"], objects[0]["Size"],
+                          objects[0].get("ETag"))
+        ).schema_arrow.names, parquet_writer)
+        row_group_size = kwargs.pop("row_group_size", None) or 1024 * 1024
+        outputs = []
+        state = {"writer": None, "sink": None, "rows": 0}
+        schema = None
+        pending = []
+
+        def write_row_group():
+            table = pa.concat_tables(pending)
+            del pending[:]
+            if state["writer"] is None:
+                # spooled to disk, so a file of target_size is not held in memory
+                state["sink"] = tempfile.SpooledTemporaryFile(max_size=self.transfer_part_size)
+                state["writer"] = pq.ParquetWriter(state["sink"], schema, allow_truncated_timestamps=True, **kwargs)
+                state["rows"] = 0
+            state["writer"].write_table(table, row_group_size=row_group_size)
+            state["rows"] += table.num_rows
+            if state["sink"].tell() >= target_size:
+                close_file()
+
+        def close_file():
+            state["writer"].close()
+            sink = state["sink"]
+            size = sink.tell()
+            sink.seek(0)
+            staged = f"{prefix}_{run_id}-{len(outputs)}_{name}"
+            try:
+                self.upload_object_to_s3(sink, bucket, staged)
+            finally:
+                sink.close()
+            outputs.append({"staged": staged, "key": f"{prefix}{run_id}-{len(outputs)}_{name}",
+                            "rows": state["rows"], "bytes": size})
+            state["writer"] = None
+
+        for batch in self._iter_parquet_batches(bucket, objects, batch_size=row_group_size):
+            heartbeat()
+            table = pa.Table.from_batches([batch])
+            if schema is None:
+                schema = table.schema
+            pending.append(table if table.schema.equals(schema) else table.cast(schema))
+            if sum(t.num_rows for t in pending) >= row_group_size or sum(t.nbytes for t in pending) >= target_size:
+                write_row_group()
+        if pending:
+            write_row_group()
+        if state["writer"] is not None:
+            close_file()
+        return outputs
+
+    def _verify_compaction(self, bucket, manifest_key, manifest):
+        client = self.s3_conn.meta.client
+        stored = self.load_json_from_s3(bucket, manifest_key)
+        if stored is None or stored.get("run_id") != manifest["run_id"] or stored.get("state") != "pending":
+            raise ValueError(f"compaction {manifest_key} was recovered by another process")
+        for output in manifest["outputs"]:
+            self.invalidate_object_metadata(bucket, output["staged"])
+            meta = self.get_object_metadata(bucket, output["staged"])
+            if meta is None or meta["ContentLength"] != output["bytes"]:
+                raise ValueError(f"staged file s3://{bucket}/{output['staged']} is missing")
+        input_rows = 0
+        for item in manifest["inputs"]:
+            self.invalidate_object_metadata(bucket, item["key"])
+            meta = self.get_object_metadata(bucket, item["key"])
+            if meta is None or meta["ETag"] != item["etag"]:
+                raise ValueError(f"s3://{bucket}/{item['key']} changed during the compaction")
+            input_rows += pq.ParquetFile(
+                _S3ObjectFile(client, bucket, item["key"], meta["ContentLength"], item["etag"])).metadata.num_rows
+        output_rows = sum(output["rows"] for output in manifest["outputs"])
+        if input_rows != output_rows:
+            raise ValueError(f"compaction of s3://{bucket}/{manifest['prefix']} wrote {output_rows} "
+                             f"instead of {input_rows} rows")
+        # a fresh lease, so the commit can't race with recover_compactions
+        self._renew_compaction_lease(bucket, manifest_key, manifest, force=True)
+
+    def _changed_compaction_inputs(self, bucket, manifest):
+        """Returns the inputs which changed and the inputs which are deleted since the manifest was stored"""
+        changed = []
+        deleted = []
+        for item in manifest["inputs"]:
+            self.invalidate_object_metadata(bucket, item["key"])
+            meta = self.get_object_metadata(bucket, item["key"])
+            if meta is None:
+                deleted.append(item["key"])
+            elif meta["ETag"] != item["etag"]:
+                changed.append(item["key"])
+        return changed, deleted
+
+    def _delete_compaction_input(self, bucket, item):
+        """Deletes an input file if its ETag is unchanged
+
+        Returns
+        -------
+        bool
+                        False if the file was changed and is kept
         """
+        client = self.s3_conn.meta.client
+        self.invalidate_object_metadata(bucket, item["key"])
+        meta = self.get_object_metadata(bucket, item["key"])
+        if meta is None:
+            return True
+        if meta["ETag"] != item["etag"]:
+            return False
         try:
-            if self.check_if_object_exists(bucket, key):
-                bucket = self.s3_conn.Bucket(bucket)
-                object = bucket.Object(key)
-                return object.get()["Body"].read().decode("utf-8").split("\n")
-            else:
-                return None
+            client.delete_object(Bucket=bucket, Key=item["key"], IfMatch=item["etag"])
         except botocore.exceptions.ClientError as e:
-            self.logger.warning(
-                f"The following error occured while loading {key} from bucket {bucket}: {e}")
-            if e.response["Error"]["Code"] == "404":
-                self.logger.warning("The object does not exist.")
-            return []
+            code = e.response["Error"]["Code"]
+            if code in ("PreconditionFailed", "412"):
+                return False
+            if code not in ("NotImplemented", "InvalidArgument"):
+                raise
+            # conditional deletes are not supported by the bucket, the ETag was checked just before
+            client.delete_object(Bucket=bucket, Key=item["key"])
+        self.invalidate_object_metadata(bucket, item["key"])
+        return True
 
-    def load_file_from_s3(self, bucket, key):
-        """
-        Wrapper for loading a file with key from S3 bucket.
-        return -- object of file content
+    def _rollback_compaction(self, bucket, manifest_key, manifest):
+        if manifest["state"] == "committed":
+            # the readers go back to the inputs before the outputs are deleted
+            manifest["state"] = "rolling_back"
+            self.upload_as_json_to_s3(manifest, bucket, manifest_key)
+        staged = [obj["Key"] for obj in self.iter_objects(bucket, f"{manifest['prefix']}_{manifest['run_id']}-")]
+        self.delete_keys_in_batches(bucket, staged + [output["key"] for output in manifest["outputs"]])
+        self.delete_keys_in_batches(bucket, [manifest_key])
+        self.logger.warning(f"rolled back compaction {manifest_key}")
+
+    def _finish_compaction(self, bucket, manifest_key, manifest):
+        client = self.s3_conn.meta.client
+        changed, deleted = self._changed_compaction_inputs(bucket, manifest)
+        if changed and not deleted:
+            self._rollback_compaction(bucket, manifest_key, manifest)
+            raise ValueError(f"{changed} changed after compaction {manifest_key} was committed, "
+                             f"the compaction was rolled back")
+        if changed:
+            # some inputs are already deleted, the manifest is kept and the partition needs a manual look
+            raise ValueError(f"{changed} changed while compaction {manifest_key} deleted its inputs")
+        for output in manifest["outputs"]:
+            self.invalidate_object_metadata(bucket, output["key"])
+            if self.get_object_metadata(bucket, output["key"]) is not None:
+                continue
+            if self.get_object_metadata(bucket, output["staged"]) is None:
+                # the manifest is kept, the partition needs a manual look
+                raise ValueError(f"staged file {output['staged']} of compaction {manifest_key} is missing")
+            client.copy({"Bucket": bucket, "Key": output["staged"]}, bucket, output["key"])
+            self.invalidate_object_metadata(bucket, output["key"])
+        errors = []
+        kept = []
+        for item in manifest["inputs"]:
+            try:
+                if not self._delete_compaction_input(bucket, item):
+                    kept.append(item["key"])
+            except botocore.exceptions.ClientError as e:
+                errors.append(e)
+        if kept:
+            raise ValueError(f"{kept} changed while compaction {manifest_key} deleted its inputs")
+        result = self.delete_keys_in_batches(bucket, [output["staged"] for output in manifest["outputs"]])
+        if errors or result["errors"]:
+            # the manifest is kept, so recover_compactions retries the deletion
+            raise ValueError(f"couldn't delete {len(errors) + len(result['errors'])} files of compaction "
+                             f"{manifest_key}")
+        self.delete_keys_in_batches(bucket, [manifest_key])
+
+    def get_parquet_metadata(self, bucket, key, footer_size=64 * 1024):
+        """Reads schema, row counts and row group statistics of a parquet object from its footer
+
+        The footer is read with a suffix range GET of footer_size bytes, which
+        also returns the object size; only footers larger than that need a
+        second ranged GET for the rest. The data pages are never read.
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        key : String
+                        Key of the parquet object
+        footer_size : int
+                        Bytes read from the end of the object in the first request
+
+        Returns
+        -------
+        dict
+                        "key", "size", "num_rows", "schema" (pyarrow Schema) and "row_groups" with
+                        num_rows, total_byte_size and per column compression, null_count, min and max;
+                        None if the object does not exist
         """
-        try:
-            if self.check_if_object_exists(bucket, key):
-                bucket = self.s3_conn.Bucket(bucket)
-                object = bucket.Object(key)
-                return object.get()["Body"].read()
-            else:
-                return None
-        except botocore.exceptions.ClientError as e:
-            self.logger.warning(
-                "The following error occured while loading %s from bucket %s: %s" % (key, bucket, e))
-            if e.response["Error"]["Code"] == "404":
-                self.logger.warning("The object does not exist.")
+        response = self._get_range(bucket, key, -footer_size)
+        if response is None:
             return None
+        tail, size = response
+        if tail[-4:] != b"PAR1":
+            raise ValueError(f"s3://{bucket}/{key} is no parquet file")
+        # the file ends with the footer, its length as 4 byte little endian integer and b"PAR1"
+        footer_length = int.from_bytes(tail[-8:-4], "little") + 8
+        if footer_length > len(tail):
+            tail = self.read_object_range(bucket, key, size - footer_length, size - len(tail) - 1) + tail
+        parquet_file = pq.ParquetFile(pa.BufferReader(tail[-footer_length:]))
+        metadata = parquet_file.metadata
+        row_groups = []
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            columns = {}
+            for j in range(row_group.num_columns):
+                column = row_group.column(j)
+                statistics = column.statistics
+                has_min_max = statistics is not None and statistics.has_min_max
+                columns[column.path_in_schema] = {
+                    "compression": column.compression,
+                    "null_count": statistics.null_count if statistics is not None else None,
+                    "min": statistics.min if has_min_max else None,
+                    "max": statistics.max if has_min_max else None,
+                }
+            row_groups.append({"num_rows": row_group.num_rows, "total_byte_size": row_group.total_byte_size,
+                               "columns": columns})
+        return {"key": key, "size": size, "num_rows": metadata.num_rows, "schema": parquet_file.schema_arrow,
+                "row_groups": row_groups}
 
-    def load_json_from_s3(self, bucket, key):
-        """
-        Wrapper for loading a json-file with key form given S3 bucket.
-        return -- object of json file
+    def get_parquet_metadata_for_prefix(self, bucket, prefix, max_workers=16, footer_size=64 * 1024):
+        """Reads the footers of all parquet objects below a prefix in parallel, see get_parquet_metadata
+
+        Returns
+        -------
+        dict
+                        Metadata by key
         """
-        if self.check_if_object_exists(bucket, key):
-            binary_data = self.load_file_from_s3(bucket, key)
-        else:
-            return None
+        keys = [obj["Key"] for obj in self._parquet_data_files(bucket, self.iter_objects(bucket, prefix))]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            metadata = executor.map(lambda key: self.get_parquet_metadata(bucket, key, footer_size), keys)
+            return dict((key, meta) for key, meta in zip(keys, metadata) if meta is not None)
 
-        if binary_data:
-            try:
-                return json.loads(binary_data.decode("utf-8"))
-            except Exception as e:
-                self.logger.critical(
-                    "could not convert %s, Exception: %s" % (key, e))
-        else:
-            return None
+    def count_parquet_rows(self, bucket, prefix, max_workers=16):
+        """Counts the rows of all parquet objects below a prefix from their footers
 
-    def load_parquet_with_wrangler(self, s3_uri):
-        try:
-            return wr.s3.read_parquet(s3_uri)
-        except Exception as e:
-            self.logger.critical(
-                f"couldn't read paruqet file {s3_uri}, Exception {e}")
+        Returns
+        -------
+        int
+                        Number of rows
+        """
+        return sum(meta["num_rows"] for meta in
+                   self.get_parquet_metadata_for_prefix(bucket, prefix, max_workers, footer_size=16 * 1024).values())
 
-    def upload_parquet_with_wrangler(self, s3_uri, context):
+    def upload_parquet_with_wrangler(self, s3_uri, context, parquet_writer=None):
+        """Saves the provided Pandas Dataframe with awswrangler
+
+        The compression and the pyarrow writer options of parquet_writer are
+        passed on, row_group_size is not supported by awswrangler. awswrangler
+        sets one compression for the whole file, so per-column compression
+        codecs are not applied either, per-column levels and options are.
+        """
+        options = self.resolve_parquet_writer(parquet_writer)
+        column_options = options.pop("columns", {})
+        options.pop("row_group_size", None)
+        compression = options.pop("compression", "snappy")
+        pyarrow_kwargs = self._parquet_column_kwargs(options, column_options, list(context.columns))
+        if isinstance(pyarrow_kwargs.pop("compression", None), dict):
+            self.logger.warning(f"per-column compression is not supported by awswrangler, "
+                                f"{s3_uri} is written with {compression}")
         try:
             wr.s3.to_parquet(
                 df=context,
-                path=s3_uri
+                path=s3_uri,
+                compression=compression,
+                pyarrow_additional_kwargs=pyarrow_kwargs or None
             )
             print(f"---- File uploaded to {s3_uri} ----")
         except botocore.exceptions.ClientError as e:
             self.logger.critical(f"couldn't upload to {s3_uri}, error: {e}")
 
-    def upload_parquet_to_s3(self, s3_uri, parquet_context, use_deprecated_int96_timestamps=False):
+    def upload_parquet_to_s3(self, s3_uri, parquet_context, use_deprecated_int96_timestamps=False, parquet_writer=None,
+                             skip_unchanged=False):
         """Saves the provided Pandas Dataframe to the provided s3 URI in parquet format
 
+        The file is encoded in memory with pyarrow and uploaded with the managed
+        transfer of upload_object_to_s3.
+
         Parameters
         ----------
         s3_uri : String
                         S3 URI for parquet file
-        parquet_context : Pandas DataFrame
+        parquet_context : Pandas DataFrame or pyarrow Table
                         Data to be put in the file
+        parquet_writer : String or dict
+                        Writer configuration, see resolve_parquet_writer
+        skip_unchanged : bool
+                        Skip the upload if the stored file has the same content, see upload_object_to_s3
 
         Returns
         -------
         String
                         Description
         """
+        bucket, key = self.parse_s3_uri(s3_uri)
         try:
-            parquet_context.to_parquet(s3_uri, allow_truncated_timestamps=True,
-                                       use_deprecated_int96_timestamps=use_deprecated_int96_timestamps)
+            body = self.encode_parquet(parquet_context, use_deprecated_int96_timestamps, parquet_writer)
+            if not self.upload_object_to_s3(pa.BufferReader(body), bucket, key, skip_unchanged=skip_unchanged):
+                return f"file unchanged at {s3_uri}"
             return f"file uploaded to {s3_uri}"
         except botocore.exceptions.ClientError as e:
             return f"couldn\"t upload to {s3_uri}, error: {e}"
 
-    def upload_as_jsonp_to_s3(self, json_context, bucket, key):
+    def encode_parquet(self, parquet_context, use_deprecated_int96_timestamps=False, parquet_writer=None):
+        """Encodes a DataFrame or pyarrow Table to parquet in memory
+
+        Returns
+        -------
+        pyarrow Buffer
+                        Content of the parquet file
+        """
+        with self.metrics.timer("encode.parquet") as sizes:
+            table = parquet_context if isinstance(parquet_context, pa.Table) else pa.Table.from_pandas(parquet_context)
+            sink = pa.BufferOutputStream()
+            pq.write_table(table, sink, allow_truncated_timestamps=True,
+                           use_deprecated_int96_timestamps=use_deprecated_int96_timestamps,
+                           **self.parquet_write_kwargs(table.column_names, parquet_writer))
+            body = sink.getvalue()
+            sizes["bytes_in"] = table.nbytes
+            sizes["bytes_out"] = body.size
+        return body
+
+    def resolve_parquet_writer(self, parquet_writer=None):
+        """Resolves a parquet writer configuration to a dict of options
+
+        Parameters
+        ----------
+        parquet_writer : String or dict
+                        Name of one of the PARQUET_WRITER_PRESETS, or a dict of options which
+                        can be based on a preset with the key "preset". Options are
+                        row_group_size, compression, compression_level, use_dictionary,
+                        write_statistics, data_page_size and "columns" with a dict of
+                        compression, compression_level, use_dictionary and write_statistics
+                        per column. Defaults to the parquet_writer of the instance.
+
+        Returns
+        -------
+        dict
+                        Options of the configuration
+        """
+        parquet_writer = parquet_writer if parquet_writer is not None else self.parquet_writer
+        if parquet_writer is None:
+            return {}
+        if isinstance(parquet_writer, str):
+            parquet_writer = {"preset": parquet_writer}
+        options = dict(parquet_writer)
+        preset = options.pop("preset", None)
+        if preset is not None:
+            if preset not in PARQUET_WRITER_PRESETS:
+                raise ValueError(f"unknown parquet writer preset {preset}, "
+                                 f"available: {', '.join(PARQUET_WRITER_PRESETS)}")
+            options = dict(PARQUET_WRITER_PRESETS[preset], **options)
+        return options
+
+    def parquet_write_kwargs(self, columns, parquet_writer=None):
+        """Returns the keyword arguments of pyarrow.parquet.write_table for a writer configuration
+
+        Parameters
+        ----------
+        columns : list
+                        Column names of the table, needed to expand per column options
+        parquet_writer : String or dict
+                        Writer configuration, see resolve_parquet_writer
+
+        Returns
+        -------
+        dict
+        """
+        options = self.resolve_parquet_writer(parquet_writer)
+        column_options = options.pop("columns", {})
+        return self._parquet_column_kwargs(options, column_options, columns)
+
+    @staticmethod
+    def _parquet_column_kwargs(options, column_options, columns):
+        kwargs = dict(options)
+        if not column_options:
+            return kwargs
+        defaults = {"compression": "snappy", "compression_level": None,
+                    "use_dictionary": True, "write_statistics": True}
+        for option in PARQUET_COLUMN_OPTIONS:
+            if not any(option in column_options.get(column, {}) for column in columns):
+                continue
+            default = options.get(option, defaults[option])
+            values = dict((column, column_options.get(column, {}).get(option, default)) for column in columns)
+            if option in ("use_dictionary", "write_statistics"):
+                kwargs[option] = [column for column, value in values.items() if value]
+            else:
+                kwargs[option] = dict((column, value) for column, value in values.items() if value is not None)
+        return kwargs
+
+    def upload_as_jsonp_to_s3(self, json_context, bucket, key, compression=None, compression_level=None, skip_unchanged=False):
         """
         Wrapper to upload a jsonp-file with key to S3 bucket.
+        json_context can be a string, bytes, a file object or an iterator of
+        str/bytes chunks, which is streamed while it is produced.
+        With compression "gzip" or "zstd" the chunks are compressed incrementally
+        during the upload and the Content-Encoding of the object is set.
         """
-        # Uploads the given file using a managed uploader, which will split up large
-        # files automatically and upload parts in parallel.
-        # self.s3_conn.Object(bucket, key).put(Body=json_context, "rb")
-        self.upload_object_to_s3(json_context, bucket, key)
+        extra_args = None
+        if compression:
+            json_context = gu.compress_chunks(self._iter_chunks(json_context), compression, compression_level)
+            extra_args = {"ContentEncoding": compression}
+        return self.upload_object_to_s3(json_context, bucket, key, extra_args=extra_args, skip_unchanged=skip_unchanged)
 
-    def upload_as_json_to_s3(self, json_context, bucket, key):
+    def upload_as_json_to_s3(self, json_context, bucket, key, skip_unchanged=False):
         """
         Wrapper to upload json-file with key to S3 bucket.
         """
-        # converting json object to string
-        json_string = json.dumps(json_context)
-        self.upload_object_to_s3(json_string, bucket, key)
+        # serialising the json object to bytes
+        with self.metrics.timer("encode.json") as sizes:
+            body = gu.json_dumps(json_context)
+            sizes["bytes_out"] = len(body)
+        return self.upload_object_to_s3(body, bucket, key, skip_unchanged=skip_unchanged)
 
     def upload_as_csv_to_s3(self, csv_context, bucket, key):
         """
         Wrapper to upload a csv-file with key to a S3 bucket.
+        csv_context can be a string, bytes, a file object or an iterator of
+        str/bytes chunks (e.g. csv rows), which is streamed while it is produced.
         """
-        # converting json object to string
-
         self.upload_object_to_s3(csv_context, bucket, key)
 
-    def upload_object_to_s3(self, body, bucket, key):
-        """
-        Wrapper to upload an unspecified file with key to a S3 bucket.
+    def upload_object_to_s3(self, body, bucket, key, part_size=None, max_concurrency=None, extra_args=None,
+                            skip_unchanged=False):
+        """Uploads an unspecified file with key to a S3 bucket using the managed transfer
+
+        Bodies larger than part_size are split up and the parts are uploaded in
+        parallel. Streams are read part by part, so at most part_size * max_concurrency
+        bytes of the body are held in memory.
+
+        With skip_unchanged the body is hashed first and compared with the
+        content-sha256 metadata or the ETag of the stored object from one HEAD
+        request; if they match, the upload is skipped and counted in upload_stats.
+        Uploaded objects get the content-sha256 metadata. Non-seekable bodies are
+        spooled to a temporary file while hashing, keeping at most part_size bytes
+        in memory.
+
+        Parameters
+        ----------
+        body : String, bytes, file object or iterator
+                        Content of the object, iterators have to yield str or bytes chunks
+        bucket : String
+                        Name of the bucket
+        key : String
+                        Key of the object
+        part_size : int
+                        Size of the multipart parts, defaults to transfer_part_size
+        max_concurrency : int
+                        Number of parts uploaded at the same time, defaults to transfer_concurrency
+        extra_args : dict
+                        Additional arguments for the PutObject/CreateMultipartUpload requests,
+                        e.g. ContentType or ContentEncoding
+        skip_unchanged : bool
+                        Skip the upload if the stored object has the same content
+
+        Returns
+        -------
+        bool
+                        Whether the body was uploaded
         """
-        # Uploads the given file using a managed uploader, which will split up large
-        # files automatically and upload parts in parallel.
+        part_size = part_size or self.transfer_part_size
+        max_concurrency = max_concurrency or self.transfer_concurrency
+        spool = None
+        if skip_unchanged:
+            body, spool, content_hash = self._hash_body(body, part_size)
+            if self._is_unchanged(bucket, key, content_hash):
+                if spool is not None:
+                    spool.close()
+                return False
+            extra_args = dict(extra_args or {})
+            extra_args["Metadata"] = dict(extra_args.get("Metadata", {}), **{"content-sha256": content_hash.sha256})
+        config = s3transfer.TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                                           max_concurrency=max_concurrency)
+        # bounds the parts read from non-seekable streams before they are uploaded
+        config.max_in_memory_upload_chunks = max_concurrency
+        try:
+            self.s3_conn.meta.client.upload_fileobj(
+                self._as_readable(body), bucket, key, ExtraArgs=extra_args, Config=config)
+        finally:
+            if spool is not None:
+                spool.close()
+        self.invalidate_object_metadata(bucket, key)
+        return True
+
+    def _hash_body(self, body, part_size):
+        content_hash = gu.ContentHash(part_size)
+        if isinstance(body, (str, bytes, bytearray, memoryview)):
+            content_hash.update(body)
+            return body, None, content_hash
+        if hasattr(body, "seekable") and body.seekable():
+            start = body.tell()
+            for chunk in self._iter_chunks(body):
+                content_hash.update(chunk)
+            body.seek(start)
+            return body, None, content_hash
+        spool = tempfile.SpooledTemporaryFile(max_size=part_size)
+        for chunk in self._iter_chunks(body):
+            chunk = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            content_hash.update(chunk)
+            spool.write(chunk)
+        spool.seek(0)
+        return spool, spool, content_hash
+
+    def _is_unchanged(self, bucket, key, content_hash):
+        self.invalidate_object_metadata(bucket, key)
+        meta = self.get_object_metadata(bucket, key)
+        with self.upload_stats_lock:
+            self.upload_stats["unchanged_checks"] += 1
+        if meta is None or meta["ContentLength"] != content_hash.size:
+            return False
+        stored_sha256 = (meta.get("Metadata") or {}).get("content-sha256")
+        if stored_sha256:
+            unchanged = stored_sha256 == content_hash.sha256
+        else:
+            unchanged = meta["ETag"] in (content_hash.etag, f'"{content_hash.md5}"')
+        if unchanged:
+            with self.upload_stats_lock:
+                self.upload_stats["skipped_uploads"] += 1
+                self.upload_stats["saved_bytes"] += content_hash.size
+                # PutObject, or CreateMultipartUpload, the UploadParts and CompleteMultipartUpload
+                self.upload_stats["saved_requests"] += content_hash.parts + 2 if content_hash.parts else 1
+        return unchanged
+
+    @staticmethod
+    def _iter_chunks(body, chunk_size=1024 * 1024):
+        if isinstance(body, (str, bytes, bytearray, memoryview)):
+            yield body
+        elif hasattr(body, "read"):
+            chunk = body.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = body.read(chunk_size)
+        else:
+            for chunk in body:
+                yield chunk
 
-    #self.s3_conn.meta.client.upload_fileobj(data, bucket, key)
-        self.s3_conn.Object(bucket, key).put(Body=body)
+    @staticmethod
+    def _as_readable(body):
+        if isinstance(body, str):
+            return io.BytesIO(body.encode("utf-8"))
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            return io.BytesIO(body)
+        if hasattr(body, "read"):
+            return body
+        return gu.IterableStream(body)
 
     def delete_file_from_s3(self, bucket, key):
         """
         Wrapper for deleteing a file with key from given S3 bucket.
         """
         self.s3_conn.Object(bucket, key).delete()
+        self.invalidate_object_metadata(bucket, key)
 
-    def delete_all_keys_from_list(self, bucket, prefix):
+    def delete_all_keys_from_list(self, bucket, prefix, bulk=False, max_workers=4, dry_run=False):
         """
         Wrapper for deleteing file from list of keys for given S3 bucket.
+        With bulk=True the keys are deleted with batched DeleteObjects requests
+        while the listing is still paging in, see delete_keys_in_batches.
         """
+        if bulk:
+            if not prefix:
+                print("Master data for this data type is empty")
+                return {"deleted": [], "errors": []}
+            result = self.delete_keys_in_batches(
+                bucket, (obj["Key"] for obj in self.iter_objects(bucket, prefix)),
+                max_workers=max_workers, dry_run=dry_run)
+            if dry_run:
+                print("Dry run: %s keys would be deleted" % len(result["deleted"]))
+            elif result["deleted"] or result["errors"]:
+                print("Master data for this data type is deleted: %s keys, %s errors" % (
+                    len(result["deleted"]), len(result["errors"])))
+            else:
+                print("Master data for this data type is empty")
+            return result
+
         key_list = self.list_keys(bucket, prefix=prefix)
         if key_list:
             for key in key_list:
@@ -271,6 +2864,69 @@ class S3Base(object):
         else:
             print("Master data for this data type is empty")
 
+    def delete_keys_in_batches(self, bucket, keys, max_workers=4, dry_run=False):
+        """Deletes keys with DeleteObjects requests of up to delete_batch_size keys
+
+        Batches are sent as soon as they are filled, so a lazy iterable of keys
+        (e.g. a paginated listing) is deleted while it is still being produced.
+        At most max_workers batches are in flight at the same time.
+
+        Parameters
+        ----------
+        bucket : String
+                        Name of the bucket
+        keys : iterable
+                        Keys to delete
+        max_workers : int
+                        Number of concurrent DeleteObjects requests
+        dry_run : bool
+                        Only collect the keys without deleting them
+
+        Returns
+        -------
+        dict
+                        "deleted": list of deleted keys,
+                        "errors": list of dicts with Key, Code and Message of failed keys
+        """
+        result = {"deleted": [], "errors": []}
+        batches = gu.chunk_iterable(keys, self.delete_batch_size)
+        if dry_run:
+            for batch in batches:
+                result["deleted"].extend(batch)
+            return result
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            for batch in batches:
+                if len(pending) >= max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect_delete_results(done, result)
+                pending.add(executor.submit(self._delete_batch, bucket, batch))
+            self._collect_delete_results(wait(pending).done, result)
+        return result
+
+    def _delete_batch(self, bucket, batch):
+        try:
+            response = self.s3_conn.meta.client.delete_objects(
+                Bucket=bucket, Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True})
+            errors = response.get("Errors", [])
+        except botocore.exceptions.ClientError as e:
+            errors = [{"Key": key, "Code": e.response["Error"]["Code"],
+                       "Message": e.response["Error"].get("Message")} for key in batch]
+        failed = set(error["Key"] for error in errors)
+        for key in batch:
+            self.invalidate_object_metadata(bucket, key)
+        return [key for key in batch if key not in failed], errors
+
+    def _collect_delete_results(self, futures, result):
+        for future in futures:
+            deleted, errors = future.result()
+            result["deleted"].extend(deleted)
+            for error in errors:
+                self.logger.warning(
+                    f"couldn't delete {error['Key']}, error: {error.get('Code')} {error.get('Message')}")
+            result["errors"].extend(errors)
+
     def create_data_key(self, partition_date, file_name, data_type, mandator, personal=False,  parquet=None, month=False, report=False):
         """
         Creates entire Filename with for given partition_date and data_type including path.
@@ -288,9 +2944,11 @@ class S3Base(object):
             time_partition = gu.create_time_partition(partition_date, month)
             return gu.get_target_path([f"personal={personal}", f"transaction={data_type}", f"partition_mandator={mandator}", time_partition, file_name])
 
-    def store_raw_data_in_s3(self, partition_date, data_type, data, personal, mandator, export_bucket, parquet=False, chunk=0, chunk_name=False, use_deprecated_int96_timestamps=False):
+    def store_raw_data_in_s3(self, partition_date, data_type, data, personal, mandator, export_bucket, parquet=False, chunk=0, chunk_name=False, use_deprecated_int96_timestamps=False, compression=None, compression_level=None, parquet_writer=None):
         """
         Uploads for given data_type and partition_date corresponding data as raw json or parquet file_name in S3 bucket.
+        With compression "gzip" or "zstd" the raw json is stored compressed as .jsonp.gz or .jsonp.zst.
+        parquet_writer selects the parquet writer configuration, see resolve_parquet_writer.
         """
         if parquet:
             file_name = str(data_type)
@@ -300,11 +2958,127 @@ class S3Base(object):
                 file_name = f"{str(chunk)}_{file_name}"
             s3_uri = self.create_s3_uri(
                 export_bucket, data_key, file_name, FileType="parquet")
-            self.upload_parquet_to_s3(s3_uri, data, use_deprecated_int96_timestamps)
+            self.upload_parquet_to_s3(s3_uri, data, use_deprecated_int96_timestamps, parquet_writer)
         else:
             data_key = self.create_data_key(
-                partition_date, f"{str(data_type)}.jsonp", data_type, mandator, personal=personal)
-            self.upload_as_jsonp_to_s3(data, export_bucket, data_key)
+                partition_date, self._jsonp_file_name(data_type, compression), data_type, mandator, personal=personal)
+            self.upload_as_jsonp_to_s3(data, export_bucket, data_key, compression, compression_level)
+
+    def store_partitioned_data_in_s3(self, data, data_type, personal, export_bucket, date_column, mandator_column,
+                                     max_file_size=128 * 1024 * 1024, parquet_writer=None, max_workers=8,
+                                     manifest_key=None, use_deprecated_int96_timestamps=False):
+        """Writes a DataFrame spanning several dates and mandators as parquet partitions in one pass
+
+        The rows are grouped by mandator and day into the
+        personal=/transaction=/partition_mandator=/partition_year=/partition_month=/partition_day=
+        layout of create_data_key, each partition is split into files of at most
+        max_file_size bytes named {chunk}_{data_type}.parquet, and all files are
+        encoded and uploaded in parallel. The written partitions are replaced:
+        files of an earlier write which are not overwritten, e.g. higher chunks
+        or compacted files, are deleted once the new files are uploaded.
+
+        Parameters
+        ----------
+        data : Pandas DataFrame or pyarrow Table
+                        Data with a date and a mandator column
+        data_type : String
+                        Transaction of the data
+        personal : bool
+                        Whether the data is personal
+        export_bucket : String
+                        Bucket the partitions are written to
+        date_column : String
+                        Column with the date (datetime, date or "%Y-%m-%d" string) of the rows
+        mandator_column : String
+                        Column with the mandator of the rows
+        max_file_size : int
+                        Maximum size of a parquet file in bytes
+        parquet_writer : String or dict
+                        Writer configuration, see resolve_parquet_writer
+        max_workers : int
+                        Number of files encoded and uploaded at the same time
+        manifest_key : String
+                        If given, the manifest is also uploaded as json to this key
+
+        Returns
+        -------
+        dict
+                        Manifest with "files" (key, mandator, partition_date, rows and bytes
+                        of each written file), total "rows" and total "bytes"
+
+        Raises
+        ------
+        ValueError
+                        If the date or the mandator of a row is null, as the row has no partition,
+                        or if files of an earlier write couldn't be deleted
+        """
+        df = data.to_pandas() if isinstance(data, pa.Table) else data
+        partition_dates = pd.to_datetime(df[date_column]).dt.normalize()
+        null_keys = int((partition_dates.isna() | df[mandator_column].isna()).sum())
+        if null_keys:
+            raise ValueError(f"{null_keys} rows have a null {date_column} or {mandator_column}, "
+                             f"they can't be assigned to a partition")
+        tasks = []
+        for (mandator, partition_date), group in df.groupby([df[mandator_column], partition_dates], sort=True,
+                                                             dropna=False):
+            data_key = self.create_data_key(partition_date, str(data_type), data_type, mandator,
+                                            personal=personal, parquet=True)
+            tasks.append((mandator, partition_date, data_key, group))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._store_partition, export_bucket, data_type, mandator, partition_date,
+                                       data_key, group, max_file_size, parquet_writer,
+                                       use_deprecated_int96_timestamps)
+                       for mandator, partition_date, data_key, group in tasks]
+            files = [entry for future in futures for entry in future.result()]
+
+        manifest = {"files": files, "rows": sum(entry["rows"] for entry in files),
+                    "bytes": sum(entry["bytes"] for entry in files)}
+        if manifest_key:
+            self.upload_as_json_to_s3(manifest, export_bucket, manifest_key)
+        return manifest
+
+    def _store_partition(self, export_bucket, data_type, mandator, partition_date, data_key, group,
+                         max_file_size, parquet_writer, use_deprecated_int96_timestamps):
+        table = pa.Table.from_pandas(group, preserve_index=False)
+        bytes_per_row = max(1, table.nbytes // max(1, table.num_rows))
+        rows_per_file = max(1, int(max_file_size // bytes_per_row))
+        bodies = []
+        for offset in range(0, table.num_rows, rows_per_file):
+            bodies.extend(self._encode_within_size(
+                table.slice(offset, rows_per_file), max_file_size, parquet_writer, use_deprecated_int96_timestamps))
+
+        entries = []
+        for chunk, (rows, body) in enumerate(bodies):
+            key = gu.get_target_path([data_key, f"{chunk}_{data_type}"], "parquet")
+            self.upload_object_to_s3(pa.BufferReader(body), export_bucket, key)
+            entries.append({"key": key, "mandator": str(mandator),
+                            "partition_date": partition_date.strftime("%Y-%m-%d"),
+                            "rows": rows, "bytes": body.size})
+
+        # files of an earlier write, read together with the new ones they would duplicate rows
+        written = set(entry["key"] for entry in entries)
+        prefix = data_key + "/"
+        stale = [obj["Key"] for obj in self.iter_objects(export_bucket, prefix)
+                 if "/" not in obj["Key"][len(prefix):] and obj["Key"] not in written
+                 and self._is_parquet_data_file(obj["Key"]) and obj["Key"].endswith(f"_{data_type}.parquet")]
+        if stale and self.delete_keys_in_batches(export_bucket, stale)["errors"]:
+            raise ValueError(f"couldn't delete the files of an earlier write of s3://{export_bucket}/{prefix}")
+        return entries
+
+    def _encode_within_size(self, table, max_file_size, parquet_writer, use_deprecated_int96_timestamps):
+        body = self.encode_parquet(table, use_deprecated_int96_timestamps, parquet_writer)
+        if body.size <= max_file_size or table.num_rows <= 1:
+            return [(table.num_rows, body)]
+        half = table.num_rows // 2
+        return (self._encode_within_size(table.slice(0, half), max_file_size, parquet_writer,
+                                         use_deprecated_int96_timestamps) +
+                self._encode_within_size(table.slice(half), max_file_size, parquet_writer,
+                                         use_deprecated_int96_timestamps))
+
+    @staticmethod
+    def _jsonp_file_name(name, compression=None):
+        return f"{str(name)}.jsonp{gu.COMPRESSION_EXTENSIONS[compression] if compression else ''}"
 
     def create_report_log_key(self, process_start_date, export_type, index, data_type, mandator):
         '''
@@ -315,17 +3089,48 @@ class S3Base(object):
         time_partition = gu.create_time_partition(process_start_date)
         return gu.get_target_path([f"type={export_type}", time_partition, f"{data_type}_{mandator}_{str(index)}_{process_start_date.strftime('%H%M%S')}.json"])
 
-    def store_report_log_in_s3(self, export_type, data, process_start_date, index, data_type, mandator, log_bucket=None):
+    def store_report_log_in_s3(self, export_type, data, process_start_date, index, data_type, mandator, log_bucket=None, buffered=False):
         '''
         Uploads the corresponding report-log for the data-type in S3 log-bucket.
+        With buffered=True the record is handed to the ReportLogWriter of the log-bucket,
+        which uploads it with other records in a background thread.
         '''
-        if log_bucket:
+        if log_bucket and buffered:
+            self.get_report_log_writer(log_bucket).write(
+                export_type, data, process_start_date, index, data_type, mandator)
+        elif log_bucket:
             report_log_key = self.create_report_log_key(
                 process_start_date, export_type, index, str(data_type), mandator)
             self.upload_as_json_to_s3(data, log_bucket, report_log_key)
         else:
             print('No log-bucket defined')
 
+    @staticmethod
+    def get_retry_state():
+        """Returns the state of the retry policy shared by all S3Base instances
+
+        Returns
+        -------
+        dict
+                        Current rate, retries and throttles per prefix and in total, see AdaptiveRetryPolicy.state
+        """
+        return s3_retry_policy.state()
+
+    def get_report_log_writer(self, log_bucket, **settings):
+        '''
+        Returns the ReportLogWriter of the log-bucket, created with settings on first use.
+        Raises a ValueError if settings differ from those of the existing writer.
+        '''
+        with self.report_log_lock:
+            writer = self.report_log_writers.get(log_bucket)
+            if writer is None or writer.closed:
+                writer = self.report_log_writers[log_bucket] = ReportLogWriter(self, log_bucket, **settings)
+            conflicting = dict((name, value) for name, value in settings.items() if getattr(writer, name) != value)
+            if conflicting:
+                raise ValueError(f"the report log writer of {log_bucket} already exists with other settings "
+                                 f"than {conflicting}")
+            return writer
+
     def create_partial_data_key_deletion(self, data_type, mandantor, personal=False, parquet=None):
         '''
         Creates entire partial Filename for given data_type including path.
@@ -334,20 +3139,21 @@ class S3Base(object):
         '''
         return gu.get_target_path([f"personal={str(personal)}", f"master_data={data_type}", f"partition_mandator={mandantor}"])
 
-    def delete_raw_master_data_in_s3(self, data_type, personal, export_bucket, mandantor, parquet=None):
+    def delete_raw_master_data_in_s3(self, data_type, personal, export_bucket, mandantor, parquet=None, bulk=False, dry_run=False):
         '''
         delete for given data_type corresponding master data as raw file_name in S3 bucket.
+        With bulk=True the keys are removed with batched, parallel DeleteObjects requests.
         '''
         if parquet:
             partial_data_key_deletion = self.create_partial_data_key_deletion(
                 data_type, mandantor, personal=personal, parquet=parquet)
-            self.delete_all_keys_from_list(
-                export_bucket, partial_data_key_deletion)
+            return self.delete_all_keys_from_list(
+                export_bucket, partial_data_key_deletion, bulk=bulk, dry_run=dry_run)
         else:
             partial_data_key_deletion = self.create_partial_data_key_deletion(
                 data_type, mandantor, personal=personal)
-            self.delete_all_keys_from_list(
-                export_bucket, partial_data_key_deletion)
+            return self.delete_all_keys_from_list(
+                export_bucket, partial_data_key_deletion, bulk=bulk, dry_run=dry_run)
 
     def create_data_key_dimension(self, file_name, data_type, chunk, mandator, personal=False, parquet=False):
         '''
@@ -360,23 +3166,190 @@ class S3Base(object):
         else:
             return gu.get_target_path([f"personal={str(personal)}", f"master_data={data_type}", f"partition_mandator={mandator}", f"partition_chunk={chunk}", file_name])
 
-    def store_raw_master_data_in_s3(self, data_type, file_name, data, personal, chunk, export_bucket, mandator, parquet=None, use_deprecated_int96_timestamps=False):
+    def store_raw_master_data_in_s3(self, data_type, file_name, data, personal, chunk, export_bucket, mandator, parquet=None, use_deprecated_int96_timestamps=False, compression=None, compression_level=None, parquet_writer=None, skip_unchanged=False):
         '''
         Uploads for given data_type corresponding master data as raw json or parquet file_name in S3 bucket.
+        With compression "gzip" or "zstd" the raw json is stored compressed as .jsonp.gz or .jsonp.zst.
+        parquet_writer selects the parquet writer configuration, see resolve_parquet_writer.
+        With skip_unchanged the upload is skipped if the stored file has the same content.
         '''
         if parquet:
             data_key = self.create_data_key_dimension(
                 f"{str(file_name)}.parquet", data_type, chunk, mandator, personal=personal, parquet=True)
             s3_uri = self.create_s3_uri(
                 export_bucket, data_key, str(file_name), FileType='parquet')
-            self.upload_parquet_to_s3(s3_uri, data, use_deprecated_int96_timestamps)
+            self.upload_parquet_to_s3(s3_uri, data, use_deprecated_int96_timestamps, parquet_writer, skip_unchanged)
         else:
             data_key = self.create_data_key_dimension(
-                "{str(file_name)}.jsonp", data_type, chunk, mandator, personal=personal)
-            self.upload_as_jsonp_to_s3(data, export_bucket, data_key)
+                self._jsonp_file_name(file_name, compression), data_type, chunk, mandator, personal=personal)
+            self.upload_as_jsonp_to_s3(data, export_bucket, data_key, compression, compression_level, skip_unchanged)
 
     def store_custom_data_in_s3_csv(self, export_bucket, key, data):
         '''
         Uploads for given fact_type corresponding data as csv file_name in S3 bucket.
+        data can also be an iterator of csv rows, which is streamed while it is produced.
         '''
         self.upload_as_csv_to_s3(data, export_bucket, key)
+
+
+class ReportLogWriter(object):
+    """Buffered report log sink, uploading batches of records from a background thread
+
+    Records are collected in memory and written as NDJSON (.jsonp) objects to
+    type={export_type}/partition_year=.../partition_month=.../partition_day=.../
+    of the log bucket, one object per export type and day of a batch. A batch is
+    flushed when max_records or max_bytes are reached, every flush_interval
+    seconds and on interpreter exit. write never waits for S3: if uploads fail,
+    the records are kept for the next flush, and beyond max_buffer_records the
+    oldest records are dropped.
+
+    Attributes
+    ----------
+    dropped : int
+                    Number of records dropped because the buffer was full or
+                    because they couldn't be uploaded on close
+    """
+
+    def __init__(self, s3_base, log_bucket, max_records=500, max_bytes=5 * 1024 * 1024, flush_interval=30,
+                 max_buffer_records=100000):
+        """
+        Parameters
+        ----------
+        s3_base : S3Base
+                        Connection used for the uploads
+        log_bucket : String
+                        Bucket of the report logs
+        max_records : int
+                        Number of buffered records triggering a flush
+        max_bytes : int
+                        Size of the buffered records in bytes triggering a flush
+        flush_interval : float
+                        Seconds after which buffered records are flushed at the latest
+        max_buffer_records : int
+                        Maximum number of buffered records
+        """
+        self.s3_base = s3_base
+        self.log_bucket = log_bucket
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.max_buffer_records = max_buffer_records
+        self.logger = gu.get_logger("ReportLogWriter")
+        self.dropped = 0
+        self.closed = False
+        self._records = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flushed = threading.Condition(self._lock)
+        self._flush_requests = 0
+        self._flush_count = 0
+        self._failed_records = 0
+        self._thread = threading.Thread(target=self._run, name=f"ReportLogWriter-{log_bucket}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, export_type, data, process_start_date, index, data_type, mandator):
+        """Buffers a report record, see S3Base.store_report_log_in_s3 for the parameters
+        """
+        line = gu.json_dumps({"data_type": str(data_type), "mandator": mandator, "index": index,
+                              "process_start_date": process_start_date.isoformat(), "report": data},
+                             default=str) + b"\n"
+        with self._lock:
+            if self.closed:
+                raise ValueError("write to closed ReportLogWriter")
+            self._records.append((export_type, process_start_date, line))
+            self._bytes += len(line)
+            while len(self._records) > self.max_buffer_records:
+                self._bytes -= len(self._records.popleft()[2])
+                self.dropped += 1
+            full = len(self._records) >= self.max_records or self._bytes >= self.max_bytes
+        if full:
+            self._wakeup.set()
+
+    def flush(self, timeout=None):
+        """Uploads all buffered records and waits for the upload
+
+        Returns
+        -------
+        bool
+                        Whether the flush finished within timeout and all records were
+                        uploaded; records of failed uploads stay buffered for the next flush
+        """
+        with self._lock:
+            self._flush_requests += 1
+            request = self._flush_requests
+        self._wakeup.set()
+        with self._flushed:
+            finished = self._flushed.wait_for(
+                lambda: self._flush_count >= request or not self._thread.is_alive(), timeout)
+            return finished and self._flush_count >= request and not self._failed_records
+
+    def close(self, timeout=None):
+        """Flushes the buffered records and stops the background thread
+
+        Records which still couldn't be uploaded are dropped and logged.
+
+        Returns
+        -------
+        bool
+                        Whether all records were uploaded
+        """
+        with self._lock:
+            if self.closed:
+                return not self._records
+            self.closed = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+        atexit.unregister(self.close)
+        if self._thread.is_alive():
+            self.logger.error(f"report logs of {self.log_bucket} not flushed within {timeout}s")
+            return False
+        with self._lock:
+            remaining = len(self._records)
+            self._records.clear()
+            self._bytes = 0
+            self.dropped += remaining
+        if remaining:
+            self.logger.error(f"dropped {remaining} report logs of {self.log_bucket}, they couldn't be uploaded")
+        return not remaining
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            with self._lock:
+                closed = self.closed
+                request = self._flush_requests
+            failed = self._upload_buffered()
+            with self._flushed:
+                self._flush_count = request
+                self._failed_records = failed
+                self._flushed.notify_all()
+            if closed:
+                return
+
+    def _upload_buffered(self):
+        with self._lock:
+            records = self._records
+            self._records = deque()
+            self._bytes = 0
+        batches = OrderedDict()
+        for record in records:
+            export_type, process_start_date, line = record
+            batches.setdefault((export_type, process_start_date.date() if hasattr(process_start_date, "date")
+                                else process_start_date), []).append(record)
+        failed = 0
+        for (export_type, partition_date), batch in batches.items():
+            key = gu.get_target_path([f"type={export_type}", gu.create_time_partition(partition_date),
+                                      f"report_{batch[0][1].strftime('%H%M%S')}_{uuid.uuid4().hex[:8]}.jsonp"])
+            try:
+                self.s3_base.upload_object_to_s3(b"".join(line for _, _, line in batch),
+                                                 self.log_bucket, key)
+            except Exception as e:
+                self.logger.warning(f"couldn't upload {len(batch)} report logs to {key}, error: {e}")
+                failed += len(batch)
+                with self._lock:
+                    self._records.extendleft(reversed(batch))
+                    self._bytes += sum(len(line) for _, _, line in batch)
+        return failed
@@ -1,9 +1,11 @@
 import os
 import json
+from functools import lru_cache
 
 conf_folder = os.path.dirname(os.path.abspath(__file__))
 conf_file_loc = os.path.join(conf_folder, 'config.json')
 
+@lru_cache(maxsize=1)
 def load_config():
     with open(conf_file_loc) as config_file:
         data = json.load(config_file)
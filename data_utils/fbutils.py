@@ -2,8 +2,8 @@
 
 Attributes
 ----------
-config : TYPE
-    Loads configuration from config file
+config : dict
+    Configuration from the config file, read once for all modules
 """
 import json
 from datetime import datetime
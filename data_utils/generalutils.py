@@ -1,8 +1,12 @@
 """A library containing commonly used utils for general purposes
 """
 import os
+import io
+import gzip
+import math
+import zlib
 import logging
-import pandas as pd
+import importlib
 from datetime import datetime
 import hashlib
 import sys
@@ -16,6 +20,55 @@ if sys.version_info[0] >= 3:
 from .config import load_config
 
 
+class LazyModule(object):
+    """Placeholder for a module which is imported on first attribute access
+
+    Keeps heavy dependencies like pandas or boto3 out of the import time of
+    the data_utils modules. Submodules which are not imported by their
+    package are imported on access as well, e.g. lazy_import('botocore').exceptions.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        module = self._load()
+        try:
+            return getattr(module, attr)
+        except AttributeError:
+            try:
+                return importlib.import_module(f'{self._name}.{attr}')
+            except ImportError:
+                raise AttributeError(f"module '{self._name}' has no attribute '{attr}'")
+
+    def __repr__(self):
+        return f'<lazy module {self._name}>'
+
+
+def lazy_import(name):
+    """Returns the module if it is already imported, otherwise a LazyModule for it
+
+    Parameters
+    ----------
+    name : String
+        Full name of the module
+
+    Returns
+    -------
+    module or LazyModule
+    """
+    return sys.modules.get(name) or LazyModule(name)
+
+
+pd = lazy_import('pandas')
+
+
 def get_logger(name):
     """Gets logger
 
@@ -380,9 +433,395 @@ def check_required_fields(params, fields):
             return None
 
 
+def chunk_iterable(iterable, size):
+    """Lazily splits an iterable into lists of at most size elements
+
+    Parameters
+    ----------
+    iterable : iterable
+        Elements to split, consumed only as far as the chunks are requested
+    size : int
+        Maximum number of elements per chunk
+
+    Returns
+    -------
+    generator
+        Lists of consecutive elements
+    """
+    chunk = []
+    for element in iterable:
+        chunk.append(element)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class IterableStream(io.RawIOBase):
+    """Read-only file-like object over an iterator of bytes or str chunks
+
+    Lets producers of data (e.g. a generator of jsonp lines) be consumed by
+    APIs expecting a file object, without joining the chunks in memory.
+    str chunks are encoded as utf-8.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        # unlike a raw stream, fill the requested size unless the iterator is exhausted
+        if size is None or size < 0:
+            return self.readall()
+        parts = []
+        remaining = size
+        while remaining > 0:
+            part = super(IterableStream, self).read(remaining)
+            if not part:
+                break
+            parts.append(part)
+            remaining -= len(part)
+        return b"".join(parts)
+
+    def readinto(self, target):
+        while not self._buffer:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                return 0
+            self._buffer = chunk.encode("utf-8") if isinstance(chunk, str) else bytes(chunk)
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+class ContentHash(object):
+    """Incremental md5, sha256 and S3 ETag of a body fed in chunks
+
+    The ETag is the md5 of the body for a single PUT, and for a multipart
+    upload with parts of part_size bytes the md5 of the concatenated part
+    md5s followed by "-" and the number of parts.
+    """
+
+    def __init__(self, part_size=None):
+        self.part_size = part_size
+        self.size = 0
+        self._md5 = hashlib.md5()
+        self._sha256 = hashlib.sha256()
+        self._part = hashlib.md5()
+        self._part_fill = 0
+        self._part_digests = []
+
+    def update(self, data):
+        data = memoryview(data.encode('utf-8') if isinstance(data, str) else data).cast('B')
+        self._md5.update(data)
+        self._sha256.update(data)
+        self.size += len(data)
+        while self.part_size and len(data):
+            take = min(len(data), self.part_size - self._part_fill)
+            self._part.update(data[:take])
+            self._part_fill += take
+            data = data[take:]
+            if self._part_fill == self.part_size:
+                self._part_digests.append(self._part.digest())
+                self._part = hashlib.md5()
+                self._part_fill = 0
+
+    @property
+    def md5(self):
+        return self._md5.hexdigest()
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    @property
+    def parts(self):
+        """Number of parts of a multipart upload, 0 for a single PUT"""
+        if not self.part_size or self.size < self.part_size:
+            return 0
+        return len(self._part_digests) + (1 if self._part_fill else 0)
+
+    @property
+    def etag(self):
+        if not self.parts:
+            return f'"{self.md5}"'
+        digests = self._part_digests + ([self._part.digest()] if self._part_fill else [])
+        return f'"{hashlib.md5(b"".join(digests)).hexdigest()}-{len(digests)}"'
+
+
+COMPRESSION_SUFFIXES = {
+    '.gz': 'gzip',
+    '.gzip': 'gzip',
+    '.zst': 'zstd',
+    '.zstd': 'zstd',
+}
+
+
+COMPRESSION_EXTENSIONS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+
+def detect_compression(key, content_encoding=None):
+    """Detects the compression of a file from its Content-Encoding or its suffix
+
+    Parameters
+    ----------
+    key : String
+        Name or key of the file
+    content_encoding : String
+        Content-Encoding of the file, takes precedence over the suffix
+
+    Returns
+    -------
+    String
+        'gzip', 'zstd' or None for uncompressed files
+    """
+    if content_encoding:
+        encoding = content_encoding.lower()
+        if encoding in ('gzip', 'x-gzip'):
+            return 'gzip'
+        if encoding in ('zstd', 'zstandard'):
+            return 'zstd'
+    for suffix, compression in COMPRESSION_SUFFIXES.items():
+        if key.endswith(suffix):
+            return compression
+    return None
+
+
+def import_zstandard():
+    """Imports the optional zstandard package
+
+    Raises
+    ------
+    ImportError
+        If zstandard is not installed
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression needs the zstandard package: pip install data_utils[zstd]")
+    return zstandard
+
+
+def open_decompressed_stream(fileobj, compression):
+    """Wraps a binary file object so reads return the decompressed data
+
+    Parameters
+    ----------
+    fileobj : file object
+        Compressed binary stream, it is only read sequentially
+    compression : String
+        'gzip', 'zstd' or None to return the stream unchanged
+
+    Returns
+    -------
+    file object
+        Stream of the decompressed data
+    """
+    if compression is None:
+        return fileobj
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if compression == 'zstd':
+        return import_zstandard().ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+    raise ValueError(f'unknown compression {compression}')
+
+
+def compress_chunks(chunks, compression, level=None):
+    """Incrementally compresses a stream of chunks
+
+    Parameters
+    ----------
+    chunks : iterable
+        str or bytes chunks, str is encoded as utf-8
+    compression : String
+        'gzip' or 'zstd'
+    level : int
+        Compression level, the default level of the codec if None
+
+    Returns
+    -------
+    generator
+        Compressed bytes, produced while the chunks are consumed
+    """
+    if compression == 'gzip':
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level,
+                                      zlib.DEFLATED, 31)
+    elif compression == 'zstd':
+        zstandard = import_zstandard()
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+    else:
+        raise ValueError(f'unknown compression {compression}')
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def decompress_bytes(data, compression):
+    """Decompresses a complete gzip or zstd payload
+
+    Parameters
+    ----------
+    data : bytes
+        Compressed data
+    compression : String
+        'gzip', 'zstd' or None to return the data unchanged
+
+    Returns
+    -------
+    bytes
+    """
+    if compression is None:
+        return data
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    if compression == 'zstd':
+        # decompressobj stops after the first frame, objects can consist of several frames
+        return import_zstandard().ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True).read()
+    raise ValueError(f'unknown compression {compression}')
+
+
+def iter_stream_lines(fileobj, chunk_size=1024 * 1024):
+    """Lazily splits a binary stream into lines, skipping empty lines
+
+    Parameters
+    ----------
+    fileobj : file object
+        Binary stream
+    chunk_size : int
+        Number of bytes read at once
+
+    Returns
+    -------
+    generator
+        Lines as bytes without the line break
+    """
+    pending = b''
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+_json_backend = None
+
+
+def json_backend():
+    """Returns the name of the json backend used by json_loads and json_dumps
+
+    orjson is used if it is installed, otherwise the json module of the
+    standard library. DATA_UTILS_JSON_BACKEND=json forces the standard library.
+
+    Returns
+    -------
+    String
+        "orjson" or "json"
+    """
+    global _json_backend
+    if _json_backend is None:
+        backend = json
+        if os.environ.get('DATA_UTILS_JSON_BACKEND', 'orjson') == 'orjson':
+            try:
+                import orjson as backend
+            except ImportError:
+                pass
+        _json_backend = backend
+    return _json_backend.__name__
+
+
+def json_loads(data):
+    """Parses a json document directly from bytes without decoding it to str first
+
+    Documents the fast backend rejects, e.g. with NaN values, are parsed by the
+    standard library, so invalid documents raise json.JSONDecodeError with
+    every backend.
+
+    Parameters
+    ----------
+    data : bytes, bytearray, memoryview or String
+        json document
+
+    Returns
+    -------
+    object
+    """
+    if json_backend() != 'json':
+        try:
+            return _json_backend.loads(data)
+        except ValueError:
+            pass
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def json_dumps(obj, default=None):
+    """Serialises an object to compact utf-8 encoded json bytes
+
+    Objects the fast backend can't serialise, e.g. integers beyond 64 bit,
+    are serialised by the standard library with the same compact separators.
+    Both backends write NaN and infinity as null and pass datetimes to default
+    if it is given.
+
+    Parameters
+    ----------
+    obj : object
+        Object to serialise
+    default : callable
+        Called for objects which aren't serialisable otherwise, e.g. str
+
+    Returns
+    -------
+    bytes
+    """
+    if json_backend() != 'json':
+        option = _json_backend.OPT_NON_STR_KEYS | _json_backend.OPT_SERIALIZE_NUMPY
+        if default is not None:
+            # like the standard library, which has no own datetime format
+            option |= _json_backend.OPT_PASSTHROUGH_DATETIME
+        try:
+            return _json_backend.dumps(obj, default=default, option=option)
+        except TypeError:
+            pass
+    try:
+        return json.dumps(obj, default=default, separators=(',', ':'), ensure_ascii=False,
+                          allow_nan=False).encode('utf-8')
+    except ValueError:
+        # orjson writes NaN and infinity as null, the json module as invalid NaN and Infinity
+        return json.dumps(_replace_non_finite(obj), default=default, separators=(',', ':'),
+                          ensure_ascii=False).encode('utf-8')
+
+
+def _replace_non_finite(obj):
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return dict((key, _replace_non_finite(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return [_replace_non_finite(value) for value in obj]
+    return obj
+
+
 def parse_file_to_json(raw_events):
     if raw_events:
-        return [json.loads(i) for i in raw_events]
+        return [json_loads(i) for i in raw_events]
     else:
         return None
 
@@ -452,6 +891,20 @@ def check_start_stop_date(start_date=None, stop_date=None, today=False, shift_in
         return start_date, stop_date
 
 
+def iter_days(start_date, stop_date):
+	'''
+	Yields every day from start_date up to and including stop_date,
+	e.g. for the pair returned by check_start_stop_date.
+
+	return -- generator of datetime.date
+	'''
+	day = start_date.date() if isinstance(start_date, datetime) else start_date
+	stop = stop_date.date() if isinstance(stop_date, datetime) else stop_date
+	while day <= stop:
+		yield day
+		day += dt.timedelta(days=1)
+
+
 def create_time_partition(partition_date, month=False):
 	'''
 	Formats partition_date for use as path in buckets.
@@ -2,8 +2,8 @@
 
 Attributes
 ----------
-config : TYPE
-    Loads configuration from config file
+config : dict
+    Configuration from the config file, read once for all modules
 """
 from .config import load_config
 config = load_config()
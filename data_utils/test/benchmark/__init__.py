@@ -0,0 +1,6 @@
+"""Benchmarks for data_utils
+
+Each benchmark is a module which can be run on its own, e.g.::
+
+    >>> python -m data_utils.test.benchmark.import_time
+"""
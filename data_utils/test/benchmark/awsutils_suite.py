@@ -0,0 +1,290 @@
+"""Benchmark suite of S3Base against a local S3 stand-in
+
+Runs the main S3Base operations against moto, either mocked in-process or as
+a local moto server speaking HTTP, and measures their latency and
+throughput: listing 10k and 100k keys, bulk loads, store_raw_data_in_s3 as
+parquet and jsonp at several sizes, existence checks and bulk deletes. The
+results are stored as a json baseline, which later runs on the same machine
+are compared against. Run it with::
+
+    >>> python -m data_utils.test.benchmark.awsutils_suite --output baseline.json
+    >>> python -m data_utils.test.benchmark.awsutils_suite --compare baseline.json
+
+Use --quick for smaller sizes and --server to run against a moto server.
+The exit code of a comparison is 1 if a scenario got slower than the threshold.
+
+Attributes
+----------
+SIZES : dict
+    Sizes of the scenarios for the full and the quick run
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+import platform
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from data_utils import awsutils as awsu
+from data_utils.test.benchmark.parquet_presets import create_transactions
+from data_utils.test.benchmark.compression import create_raw_events
+
+BUCKET = 'benchmark'
+MOTO_PORT = 5124
+
+SIZES = {
+    'full': {
+        'list_keys': [10000, 100000],
+        'load_files': [1000],
+        'store_parquet': [10000, 100000, 1000000],
+        'store_jsonp': [10000, 100000],
+        'exists': [1000],
+        'delete': [10000],
+    },
+    'quick': {
+        'list_keys': [1000, 10000],
+        'load_files': [200],
+        'store_parquet': [10000, 100000],
+        'store_jsonp': [10000],
+        'exists': [200],
+        'delete': [2000],
+    },
+}
+
+
+def put_objects(s3_base, prefix, count, body=b'{"id": 1}', max_workers=32):
+    """Creates count small objects below the prefix
+
+    Returns
+    -------
+    list
+        Keys of the objects
+    """
+    client = s3_base.s3_conn.meta.client
+    keys = [f'{prefix}/{i:07d}.json' for i in range(count)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda key: client.put_object(Bucket=BUCKET, Key=key, Body=body), keys))
+    return keys
+
+
+def bench_list_keys(s3_base, size):
+    prefix = f'list/{size}'
+    if not s3_base.check_if_object_exists(BUCKET, f'{prefix}/{size - 1:07d}.json'):
+        put_objects(s3_base, prefix, size)
+
+    def run():
+        assert len(s3_base.list_keys(BUCKET, prefix)) == size
+    return run, size, 0
+
+
+def bench_load_files(s3_base, size):
+    prefix = f'load/{size}'
+    keys = put_objects(s3_base, prefix, size)
+
+    def run():
+        loaded = sum(1 for _ in s3_base.load_files_from_s3(BUCKET, keys=keys, decode='json'))
+        assert loaded == size
+    return run, size, 0
+
+
+def bench_store_parquet(s3_base, size):
+    df = create_transactions(size)
+    partition_date = datetime.date(2020, 5, 11)
+
+    def run():
+        s3_base.store_raw_data_in_s3(partition_date, 'order', df, False, 'vnr', BUCKET, parquet=True)
+    return run, size, int(df.memory_usage(deep=True).sum())
+
+
+def bench_store_jsonp(s3_base, size):
+    lines = create_raw_events(size)
+    partition_date = datetime.date(2020, 5, 11)
+
+    def run():
+        s3_base.store_raw_data_in_s3(partition_date, 'order', iter(lines), False, 'vnr', BUCKET)
+    return run, size, sum(len(line) for line in lines)
+
+
+def bench_exists(s3_base, size):
+    keys = put_objects(s3_base, f'exists/{size}', size)
+
+    def run():
+        # drop the metadata cache, so every check is a HEAD request
+        s3_base.invalidate_object_metadata(BUCKET)
+        assert all(s3_base.check_if_object_exists(BUCKET, key) for key in keys)
+    return run, size, 0
+
+
+def bench_delete(s3_base, size):
+    prefix = f'delete/{size}'
+
+    def run():
+        s3_base.delete_all_keys_from_list(BUCKET, prefix, bulk=True)
+
+    def setup():
+        put_objects(s3_base, prefix, size)
+    return run, size, 0, setup
+
+
+SCENARIOS = [
+    ('list_keys', bench_list_keys),
+    ('load_files', bench_load_files),
+    ('store_parquet', bench_store_parquet),
+    ('store_jsonp', bench_store_jsonp),
+    ('exists', bench_exists),
+    ('delete', bench_delete),
+]
+
+
+def run_scenario(s3_base, name, factory, size, repeat):
+    """Prepares a scenario and measures repeat runs of it
+
+    Returns
+    -------
+    dict
+        Median and min seconds, operations per second and MB per second
+    """
+    prepared = factory(s3_base, size)
+    run, operations, number_of_bytes = prepared[:3]
+    setup = prepared[3] if len(prepared) > 3 else None
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    result = {'scenario': f'{name}[{size}]', 'median_s': round(median, 4), 'min_s': round(min(timings), 4),
+              'ops_s': round(operations / median, 1)}
+    if number_of_bytes:
+        result['mb_s'] = round(number_of_bytes / median / 1e6, 2)
+    return result
+
+
+def describe_environment(backend):
+    """Returns the machine and code version of a run, stored with the results
+
+    Returns
+    -------
+    dict
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'backend': backend, 'python': platform.python_version(),
+            'machine': platform.node(), 'processor': platform.processor() or platform.machine(),
+            'created': datetime.datetime.now().isoformat(timespec='seconds')}
+
+
+def compare(results, baseline, threshold=0.1):
+    """Compares the median times of a run with a baseline
+
+    Parameters
+    ----------
+    results : dict
+        Results of the current run
+    baseline : dict
+        Results of the baseline run
+    threshold : float
+        Relative slowdown counted as regression
+
+    Returns
+    -------
+    list
+        Per scenario of both runs the baseline and current median and their ratio
+    """
+    previous = dict((result['scenario'], result) for result in baseline['results'])
+    comparison = []
+    for result in results['results']:
+        before = previous.get(result['scenario'])
+        if before is None:
+            continue
+        ratio = result['median_s'] / before['median_s'] if before['median_s'] else float('inf')
+        comparison.append({'scenario': result['scenario'], 'baseline_s': before['median_s'],
+                           'current_s': result['median_s'], 'ratio': round(ratio, 3),
+                           'regression': ratio > 1 + threshold})
+    return comparison
+
+
+def run_suite(quick=False, server=False, repeat=3, only=None):
+    """Runs all scenarios against moto
+
+    Returns
+    -------
+    dict
+        "environment" and "results" of the run
+    """
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_REQUEST_CHECKSUM_CALCULATION', 'when_required')
+    if server:
+        from moto.server import ThreadedMotoServer
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        backend = ThreadedMotoServer(ip_address='127.0.0.1', port=MOTO_PORT, verbose=False)
+        backend.start()
+        os.environ['AWS_ENDPOINT_URL_S3'] = f'http://127.0.0.1:{MOTO_PORT}'
+        stop = backend.stop
+    else:
+        from moto import mock_s3
+        backend = mock_s3()
+        backend.start()
+        stop = backend.stop
+    awsu.client_registry.clear()
+    try:
+        s3_base = awsu.S3Base()
+        s3_base.s3_conn.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={'LocationConstraint': awsu.REGION_NAME})
+        sizes = SIZES['quick' if quick else 'full']
+        results = []
+        for name, factory in SCENARIOS:
+            if only and name not in only:
+                continue
+            for size in sizes[name]:
+                result = run_scenario(s3_base, name, factory, size, repeat)
+                print(json.dumps(result), file=sys.stderr)
+                results.append(result)
+    finally:
+        stop()
+        os.environ.pop('AWS_ENDPOINT_URL_S3', None)
+        awsu.client_registry.clear()
+    return {'environment': describe_environment('server' if server else 'in-process'), 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark suite of S3Base against moto')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, e.g. for a quick check')
+    parser.add_argument('--server', action='store_true', help='run against a local moto server over HTTP')
+    parser.add_argument('--repeat', type=int, default=3, help='measured runs per scenario')
+    parser.add_argument('--only', nargs='*', help='scenarios to run, e.g. list_keys store_parquet')
+    parser.add_argument('--output', help='store the results as json baseline')
+    parser.add_argument('--compare', help='json baseline to compare the results with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown counted as regression')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.quick, args.server, args.repeat, args.only)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if not args.compare:
+        print(json.dumps(results, indent=2))
+        return 0
+    with open(args.compare) as baseline_file:
+        baseline = json.load(baseline_file)
+    for name in ('backend', 'machine'):
+        if baseline['environment'][name] != results['environment'][name]:
+            print(f"warning: the {name} differs from the baseline ({baseline['environment'][name]}), "
+                  f"the timings are not comparable", file=sys.stderr)
+    comparison = compare(results, baseline, args.threshold)
+    print(json.dumps(comparison, indent=2))
+    return 1 if any(item['regression'] for item in comparison) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
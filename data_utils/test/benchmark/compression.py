@@ -0,0 +1,103 @@
+"""Compression benchmark for the jsonp output of store_raw_data_in_s3
+
+Compares throughput and size of each codec and level on synthetic raw
+events, compressed incrementally with generalutils.compress_chunks as
+during an upload. Run it with::
+
+    >>> python -m data_utils.test.benchmark.compression [number_of_events]
+
+Attributes
+----------
+CODECS : list
+    (compression, level) pairs to compare
+"""
+import sys
+import json
+import time
+import random
+
+from data_utils import generalutils as gu
+
+CODECS = [
+    ('gzip', 1),
+    ('gzip', 6),
+    ('gzip', 9),
+    ('zstd', 1),
+    ('zstd', 3),
+    ('zstd', 10),
+    ('zstd', 19),
+]
+
+
+def create_raw_events(number_of_events, seed=42):
+    """Creates jsonp lines resembling raw transaction events
+
+    Returns
+    -------
+    list
+        jsonp lines, each ending with a line break
+    """
+    rnd = random.Random(seed)
+    events = []
+    for i in range(number_of_events):
+        event = {
+            'event_id': f'{rnd.getrandbits(64):016x}',
+            'transaction': rnd.choice(['order', 'subscription', 'cancellation']),
+            'mandator': rnd.choice(['vnr', 'oct', 'abc']),
+            'created': f'2020-05-{rnd.randint(1, 28):02d}T{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:00',
+            'customer_id': rnd.randint(1, 10 ** 6),
+            'amount': round(rnd.uniform(1, 500), 2),
+            'currency': 'EUR',
+            'items': [{'sku': f'SKU-{rnd.randint(1, 500)}', 'quantity': rnd.randint(1, 5)}
+                      for _ in range(rnd.randint(1, 4))],
+            'source': rnd.choice(['web', 'app', 'mail', None]),
+        }
+        events.append(json.dumps(event) + '\n')
+    return events
+
+
+def run_codec(lines, compression, level, chunk_lines=1000):
+    """Compresses the lines incrementally and decompresses them again
+
+    Returns
+    -------
+    dict
+        Sizes, ratio and throughput in MB/s of the codec
+    """
+    raw_size = sum(len(line) for line in lines)
+    chunks = [''.join(lines[i:i + chunk_lines]).encode('utf-8') for i in range(0, len(lines), chunk_lines)]
+
+    start = time.perf_counter()
+    compressed = b''.join(gu.compress_chunks(chunks, compression, level))
+    compress_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    restored = gu.decompress_bytes(compressed, compression)
+    decompress_seconds = time.perf_counter() - start
+    assert len(restored) == raw_size
+
+    return {
+        'compression': compression,
+        'level': level,
+        'raw_bytes': raw_size,
+        'compressed_bytes': len(compressed),
+        'ratio': round(raw_size / len(compressed), 2),
+        'compress_mb_s': round(raw_size / compress_seconds / 1e6, 1),
+        'decompress_mb_s': round(raw_size / decompress_seconds / 1e6, 1),
+    }
+
+
+def main(number_of_events=100000):
+    lines = create_raw_events(number_of_events)
+    results = []
+    for compression, level in CODECS:
+        try:
+            results.append(run_codec(lines, compression, level))
+        except ImportError as e:
+            results.append({'compression': compression, 'level': level, 'skipped': str(e)})
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
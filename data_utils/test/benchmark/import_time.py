@@ -0,0 +1,90 @@
+"""Import-time benchmark for the data_utils modules
+
+Measures the cost of `import data_utils.<module>` in a fresh interpreter for
+each module and compares it against the budget of the module. Run it with::
+
+    >>> python -m data_utils.test.benchmark.import_time
+
+The exit code is 1 if a module is over its budget.
+
+Attributes
+----------
+IMPORT_BUDGETS : dict
+    Maximum import time in seconds per module
+PACKAGE_ROOT : String
+    Folder containing the data_utils package
+"""
+import os
+import sys
+import json
+import subprocess
+
+import data_utils
+
+IMPORT_BUDGETS = {
+    'generalutils': 0.25,
+    'awsutils': 0.3,
+    'aioawsutils': 0.5,
+    'apiutils': 0.4,
+    'fbutils': 0.1,
+    'matomoutils': 0.1,
+    'epi_utils': 0.1,
+}
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(data_utils.__file__)))
+
+MEASURE_SCRIPT = (
+    'import time; start = time.perf_counter(); import data_utils.{module}; '
+    'print(time.perf_counter() - start)'
+)
+
+
+def measure_import_time(module, repeat=3):
+    """Measures the import time of a data_utils module in fresh interpreters
+
+    Parameters
+    ----------
+    module : String
+        Name of the module in data_utils
+    repeat : int
+        Number of measurements, the fastest one is returned
+
+    Returns
+    -------
+    float
+        Import time in seconds
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [PACKAGE_ROOT, env.get('PYTHONPATH')]))
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, '-c', MEASURE_SCRIPT.format(module=module)], env=env)
+        timings.append(float(output.decode('utf-8').strip().splitlines()[-1]))
+    return min(timings)
+
+
+def check_import_budgets(budgets=None, repeat=3):
+    """Measures all modules of the budgets
+
+    Returns
+    -------
+    dict
+        Per module the measured time, its budget and whether it is within the budget
+    """
+    budgets = budgets or IMPORT_BUDGETS
+    results = {}
+    for module, budget in budgets.items():
+        seconds = measure_import_time(module, repeat)
+        results[module] = {'seconds': round(seconds, 4), 'budget': budget, 'ok': seconds <= budget}
+    return results
+
+
+def main():
+    results = check_import_budgets()
+    print(json.dumps(results, indent=2))
+    return 0 if all(result['ok'] for result in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Benchmark of the json codec of generalutils on typical payloads
+
+Compares the previous decode-then-parse path of the standard library,
+json.loads(data.decode('utf-8')) and json.dumps(obj).encode('utf-8'), with
+generalutils.json_loads and json_dumps on each installed backend. The payloads
+resemble Graph API page insights (built from test/res/test_impressions.json),
+epi campaign listings and jsonp raw events parsed line by line as in
+parse_file_to_json. Run it with::
+
+    >>> python -m data_utils.test.benchmark.json_codec [repeat]
+
+Attributes
+----------
+BACKENDS : list
+    Backends of generalutils.json_loads and json_dumps to compare
+"""
+import os
+import sys
+import json
+import time
+import random
+
+from data_utils import generalutils as gu
+from data_utils.test.benchmark.compression import create_raw_events
+
+BACKENDS = ['orjson', 'json']
+RES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'res')
+
+
+def create_graph_insights(number_of_pages=200):
+    """Creates a Graph API insights response with the metrics of test_impressions.json for many pages
+
+    Returns
+    -------
+    bytes
+    """
+    with open(os.path.join(RES_DIR, 'test_impressions.json'), 'rb') as impressions:
+        metrics = json.load(impressions)['data']
+    data = [dict(metric, id=f'{page}/insights/{metric["name"]}/day') for page in range(number_of_pages)
+            for metric in metrics]
+    return json.dumps({'data': data, 'paging': {'previous': '', 'next': ''}}, indent=4).encode('utf-8')
+
+
+def create_epi_campaigns(number_of_campaigns=2000, seed=42):
+    """Creates an epi campaign listing with messages, recipient lists and links
+
+    Returns
+    -------
+    bytes
+    """
+    rnd = random.Random(seed)
+    elements = []
+    for i in range(number_of_campaigns):
+        link = {'rel': 'self', 'href': f'https://api.campaign.example/rest/campaigns/{i}'}
+        elements.append({
+            'id': 10 ** 9 + i,
+            'name': f'Newsletter KW{rnd.randint(1, 52)} – Ausgabe {i}',
+            'status': rnd.choice(['SENT', 'SCHEDULED', 'DRAFT']),
+            'created': f'2020-05-{rnd.randint(1, 28):02d}T{rnd.randint(0, 23):02d}:00:00.000Z',
+            'recipientLists': {'id': rnd.randint(1, 50), 'name': 'Abonnenten', 'links': [link],
+                               'gridLocation': {'folderId': rnd.randint(1, 20)}},
+            'targetGroups': [{'id': rnd.randint(1, 500)} for _ in range(rnd.randint(0, 3))],
+            'messages': [{'id': rnd.getrandbits(40), 'subject': f'Angebote der Woche {j}',
+                          'sent': rnd.randint(0, 10 ** 5), 'opened': rnd.randint(0, 10 ** 4),
+                          'clicked': rnd.randint(0, 10 ** 3), 'links': [link],
+                          'gridLocation': {'folderId': rnd.randint(1, 20)}} for j in range(rnd.randint(1, 4))],
+            'links': [link],
+        })
+    return json.dumps({'elements': elements}).encode('utf-8')
+
+
+def run_codec(name, body, backend, repeat):
+    """Parses and serialises the payload with the backend, keeping the fastest of repeat runs
+
+    Returns
+    -------
+    dict
+        Parse and serialise throughput in MB/s
+    """
+    lines = body.split(b'\n') if name == 'raw_events_jsonp' else [body]
+    if backend == 'stdlib decode':
+        loads, dumps = (lambda data: json.loads(data.decode('utf-8'))), (lambda obj: json.dumps(obj).encode('utf-8'))
+    else:
+        os.environ['DATA_UTILS_JSON_BACKEND'] = backend
+        gu._json_backend = None
+        if gu.json_backend() != backend:
+            return {'payload': name, 'backend': backend, 'skipped': f'{backend} is not installed'}
+        loads, dumps = gu.json_loads, gu.json_dumps
+    objects = [loads(line) for line in lines]
+    parse_seconds = serialise_seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            loads(line)
+        parse_seconds = min(parse_seconds, time.perf_counter() - start)
+        start = time.perf_counter()
+        for obj in objects:
+            dumps(obj)
+        serialise_seconds = min(serialise_seconds, time.perf_counter() - start)
+    return {'payload': name, 'backend': backend, 'bytes': len(body), 'documents': len(lines),
+            'parse_mb_s': round(len(body) / parse_seconds / 1e6, 1),
+            'serialise_mb_s': round(len(body) / serialise_seconds / 1e6, 1)}
+
+
+def main(repeat=5):
+    payloads = {
+        'graph_insights': create_graph_insights(),
+        'epi_campaigns': create_epi_campaigns(),
+        'raw_events_jsonp': ''.join(create_raw_events(50000)).strip().encode('utf-8'),
+    }
+    configured = os.environ.get('DATA_UTILS_JSON_BACKEND')
+    try:
+        results = [run_codec(name, body, backend, repeat) for name, body in payloads.items()
+                   for backend in ['stdlib decode'] + BACKENDS]
+    finally:
+        if configured is None:
+            os.environ.pop('DATA_UTILS_JSON_BACKEND', None)
+        else:
+            os.environ['DATA_UTILS_JSON_BACKEND'] = configured
+        gu._json_backend = None
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,112 @@
+"""Memory benchmark of memory-mapped reads from the disk cache of S3Base
+
+Caches a synthetic master data parquet file from a mocked S3 bucket and
+starts several worker processes which each read it and keep the table, once
+decoded into process memory and once memory-mapped from the Arrow IPC copy
+of S3Base.read_arrow_from_cache. For each mode the private (anonymous) and
+the file backed resident memory per worker is reported; with the mapped mode
+the table lives in file backed pages shared by all workers. Linux only. Run
+it with::
+
+    >>> python -m data_utils.test.benchmark.mmap_rss [number_of_rows] [number_of_workers]
+"""
+import os
+import sys
+import json
+import tempfile
+import multiprocessing
+
+import numpy as np
+import pyarrow.parquet as pq
+from moto import mock_s3
+
+from data_utils import awsutils as awsu
+from data_utils.test.benchmark.parquet_presets import create_transactions
+
+BUCKET = 'benchmark'
+KEY = 'personal=False/master_data=sku/partition_mandator=vnr/partition_chunk=0/sku.parquet'
+
+
+def read_rss():
+    """Returns the resident memory of the current process in MB
+
+    Returns
+    -------
+    dict
+        Anonymous (private) and file backed resident memory
+    """
+    rss = {}
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(('RssAnon:', 'RssFile:')):
+                name, value = line.split(':')
+                rss[name] = round(int(value.split()[0]) / 1024, 1)
+    return {'anon_mb': rss.get('RssAnon'), 'file_mb': rss.get('RssFile')}
+
+
+def worker(mode, path, ready, results):
+    """Reads the cached file in the given mode, touches all data and reports its RSS
+    """
+    before = read_rss()
+    if mode == 'mapped':
+        table = awsu.S3Base.read_ipc_file(path)
+    else:
+        table = pq.read_table(path)
+    # read every buffer once, so all pages of the table are resident
+    buffers = dict((buffer.address, buffer) for column in table.columns for chunk in column.chunks
+                   for buffer in chunk.buffers() if buffer is not None)
+    total = 0
+    for buffer in buffers.values():
+        np.frombuffer(buffer, dtype=np.uint8).sum()
+        total += buffer.size
+    after = read_rss()
+    results.put({'mode': mode, 'bytes': total,
+                 'anon_mb': round(after['anon_mb'] - before['anon_mb'], 1),
+                 'file_mb': round(after['file_mb'] - before['file_mb'], 1)})
+    ready.wait()
+
+
+def run_mode(mode, path, number_of_workers):
+    """Starts the workers of one mode and collects their RSS while all of them hold the table
+
+    Returns
+    -------
+    dict
+        Mean anonymous and file backed RSS growth per worker
+    """
+    context = multiprocessing.get_context('spawn')
+    ready = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, path, ready, results)) for _ in range(number_of_workers)]
+    for process in processes:
+        process.start()
+    measurements = [results.get() for _ in processes]
+    ready.set()
+    for process in processes:
+        process.join()
+    return {'mode': mode, 'workers': number_of_workers,
+            'anon_mb_per_worker': round(sum(m['anon_mb'] for m in measurements) / number_of_workers, 1),
+            'file_mb_per_worker': round(sum(m['file_mb'] for m in measurements) / number_of_workers, 1),
+            'table_mb': round(measurements[0]['bytes'] / 1e6, 1)}
+
+
+def main(number_of_rows=2000000, number_of_workers=4):
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_REQUEST_CHECKSUM_CALCULATION', 'when_required')
+    with tempfile.TemporaryDirectory() as directory, mock_s3():
+        s3_base = awsu.S3Base()
+        s3_base.s3_conn.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={'LocationConstraint': awsu.REGION_NAME})
+        s3_base.upload_parquet_to_s3(f's3://{BUCKET}/{KEY}', create_transactions(number_of_rows))
+        cache = s3_base.enable_disk_cache(directory)
+        s3_base.read_arrow_from_cache(BUCKET, KEY)
+        parquet_path, _ = s3_base.get_cached_file(BUCKET, KEY)
+        ipc_path = cache.materialize(parquet_path, '.arrow', None)
+        results = [run_mode('decoded', parquet_path, number_of_workers),
+                   run_mode('mapped', ipc_path, number_of_workers)]
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,89 @@
+"""Memory benchmark of S3Base.iter_parquet_from_s3 against a full read
+
+Uploads a synthetic transaction partition to a mocked S3 bucket and compares
+the peak pyarrow allocation and the duration of reading it at once with
+iterating over it in batches of different sizes. The peak of the iteration
+should grow with the batch size, not with the size of the object. Run it
+with::
+
+    >>> python -m data_utils.test.benchmark.parquet_iteration [number_of_rows]
+
+Attributes
+----------
+BATCH_SIZES : list
+    Number of rows per batch to compare
+"""
+import os
+import sys
+import json
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from moto import mock_s3
+
+from data_utils import awsutils as awsu
+from data_utils.test.benchmark.parquet_presets import create_transactions
+
+BATCH_SIZES = [10000, 100000]
+BUCKET = 'benchmark'
+KEY = 'personal=False/transaction=order/0_order.parquet'
+
+
+def run_full_read(s3_base):
+    """Reads the whole object into one table
+
+    Returns
+    -------
+    dict
+        Duration and peak pyarrow allocation of the read
+    """
+    pool = pa.default_memory_pool()
+    start_bytes = pa.total_allocated_bytes()
+    start = time.perf_counter()
+    body = s3_base.load_file_from_s3(BUCKET, KEY)
+    table = pq.read_table(pa.BufferReader(body))
+    seconds = time.perf_counter() - start
+    result = {'mode': 'full', 'rows': table.num_rows, 'seconds': round(seconds, 3),
+              'peak_arrow_mb': round((pa.total_allocated_bytes() - start_bytes) / 1e6, 1)}
+    del table, body
+    pool.release_unused()
+    return result
+
+
+def run_iteration(s3_base, batch_size):
+    """Iterates over the object in batches and discards them
+
+    Returns
+    -------
+    dict
+        Duration and peak pyarrow allocation of the iteration
+    """
+    stats = {}
+    start_bytes = pa.total_allocated_bytes()
+    start = time.perf_counter()
+    for _ in s3_base.iter_parquet_from_s3(f's3://{BUCKET}/{KEY}', batch_size=batch_size, as_arrow=True,
+                                          stats=stats):
+        pass
+    seconds = time.perf_counter() - start
+    return {'mode': f'batches of {batch_size}', 'rows': stats['rows'], 'seconds': round(seconds, 3),
+            'peak_arrow_mb': round((stats['peak_arrow_bytes'] - start_bytes) / 1e6, 1),
+            'peak_buffered_mb': round(stats['peak_buffered_bytes'] / 1e6, 1)}
+
+
+def main(number_of_rows=2000000):
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_REQUEST_CHECKSUM_CALCULATION', 'when_required')
+    with mock_s3():
+        s3_base = awsu.S3Base()
+        s3_base.s3_conn.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={'LocationConstraint': awsu.REGION_NAME})
+        s3_base.upload_parquet_to_s3(f's3://{BUCKET}/{KEY}', create_transactions(number_of_rows),
+                                     parquet_writer={'row_group_size': 50000})
+        results = [run_full_read(s3_base)] + [run_iteration(s3_base, batch_size) for batch_size in BATCH_SIZES]
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,91 @@
+"""Benchmark of the parquet writer presets of S3Base
+
+For each preset of awsutils.PARQUET_WRITER_PRESETS the benchmark encodes a
+synthetic transaction table in memory and reports write throughput and file
+size. It then reads a selective range of one column with a predicate on the
+sorted date column and reports how many row groups had to be read. Run it
+with::
+
+    >>> python -m data_utils.test.benchmark.parquet_presets [number_of_rows]
+"""
+import sys
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_utils import awsutils as awsu
+
+
+def create_transactions(number_of_rows, seed=42):
+    """Creates a DataFrame resembling a day of raw transactions sorted by time
+
+    Returns
+    -------
+    Pandas DataFrame
+    """
+    rnd = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'created': pd.date_range('2020-05-11', periods=number_of_rows, freq='100ms'),
+        'customer_id': rnd.integers(1, 10 ** 6, number_of_rows),
+        'mandator': rnd.choice(['vnr', 'oct', 'abc'], number_of_rows),
+        'transaction': rnd.choice(['order', 'subscription', 'cancellation'], number_of_rows),
+        'amount': rnd.uniform(1, 500, number_of_rows).round(2),
+        'sku': [f'SKU-{i}' for i in rnd.integers(1, 500, number_of_rows)],
+    })
+
+
+def run_preset(s3_base, df, preset, selectivity=0.01):
+    """Encodes the DataFrame with the preset and reads a selective range
+
+    Returns
+    -------
+    dict
+        Size, write throughput and read statistics of the preset
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    start = time.perf_counter()
+    body = s3_base.encode_parquet(table, parquet_writer=preset)
+    write_seconds = time.perf_counter() - start
+
+    low = df['created'].iloc[len(df) // 2]
+    high = df['created'].iloc[min(len(df) - 1, len(df) // 2 + int(len(df) * selectivity))]
+    metadata = pq.ParquetFile(pa.BufferReader(body)).metadata
+    created = metadata.schema.names.index('created')
+    row_groups_read = 0
+    for i in range(metadata.num_row_groups):
+        statistics = metadata.row_group(i).column(created).statistics
+        if statistics is None or not statistics.has_min_max or \
+                (statistics.max >= low and statistics.min <= high):
+            row_groups_read += 1
+
+    start = time.perf_counter()
+    selected = pq.read_table(pa.BufferReader(body), columns=['amount'],
+                             filters=[('created', '>=', low), ('created', '<=', high)])
+    read_seconds = time.perf_counter() - start
+
+    return {
+        'preset': preset,
+        'bytes': body.size,
+        'write_rows_s': int(len(df) / write_seconds),
+        'write_mb_s': round(table.nbytes / write_seconds / 1e6, 1),
+        'row_groups': metadata.num_row_groups,
+        'row_groups_read': row_groups_read,
+        'selected_rows': selected.num_rows,
+        'selective_read_ms': round(read_seconds * 1000, 2),
+    }
+
+
+def main(number_of_rows=1000000):
+    s3_base = awsu.S3Base()
+    df = create_transactions(number_of_rows)
+    results = [run_preset(s3_base, df, preset) for preset in awsu.PARQUET_WRITER_PRESETS]
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,191 @@
+"""Test Cases for aioawsutils library, running against a local moto server
+
+Attributes
+----------
+MOTO_PORT : int
+    Port of the local moto server
+"""
+import pytest
+import asyncio
+import io
+import json
+import boto3
+
+pytest.importorskip('aiobotocore')
+from moto.server import ThreadedMotoServer
+from data_utils import aioawsutils as aawsu
+
+MOTO_PORT = 5123
+ENDPOINT_URL = f'http://127.0.0.1:{MOTO_PORT}'
+BUCKET = 'input'
+
+
+@pytest.fixture(scope='module')
+def moto_server():
+    """Starts a local moto server with fake credentials
+
+    Yields
+    ------
+    String
+        Endpoint url of the server
+    """
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+        monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+        # moto can't decode the aws-chunked bodies newer botocore sends with checksums
+        monkeypatch.setenv('AWS_REQUEST_CHECKSUM_CALCULATION', 'when_required')
+        server = ThreadedMotoServer(ip_address='127.0.0.1', port=MOTO_PORT, verbose=False)
+        server.start()
+        yield ENDPOINT_URL
+        server.stop()
+
+
+@pytest.fixture(scope='function')
+def s3(moto_server):
+    """Creates a testing bucket with two objects on the moto server
+
+    Yields
+    ------
+    boto3 s3 resource
+        Resource connected to the moto server
+    """
+    s3 = boto3.resource('s3', region_name='eu-central-1', endpoint_url=moto_server)
+    bucket = s3.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={'LocationConstraint': 'eu-central-1'})
+    s3.Object(BUCKET, 'TestKey/somefile.txt').put(Body=b'Here we have some data\nand this is a new line')
+    s3.Object(BUCKET, 'TestKey/data.json').put(Body=json.dumps({'id': 1}))
+    yield s3
+    bucket.objects.all().delete()
+    bucket.delete()
+
+
+def test_get_ssm_parameter(moto_server):
+    """Test function for get_ssm_parameter() function in aioawsutils
+    """
+    ssm = boto3.client('ssm', region_name='eu-central-1', endpoint_url=moto_server)
+    ssm.put_parameter(Name='ExternalBucketName', Value='OUTPUT', Type='String', Overwrite=True)
+
+    async def run():
+        async with aawsu.AsyncSSMBase(endpoint_url=moto_server) as ssm_base:
+            return await ssm_base.get_ssm_parameter('ExternalBucketName')
+
+    assert asyncio.run(run()) == 'OUTPUT'
+
+
+def test_load_from_s3(s3, moto_server):
+    """Test function for the load functions in aioawsutils
+    """
+    async def run():
+        async with aawsu.AsyncS3Base(endpoint_url=moto_server) as s3_base:
+            return (await s3_base.check_if_object_exists(BUCKET, 'TestKey/somefile.txt'),
+                    await s3_base.check_if_object_exists(BUCKET, 'TestKey/missing.txt'),
+                    await s3_base.load_file_from_s3(BUCKET, 'TestKey/somefile.txt'),
+                    await s3_base.load_list_file_from_s3(BUCKET, 'TestKey/somefile.txt'),
+                    await s3_base.load_json_from_s3(BUCKET, 'TestKey/data.json'),
+                    await s3_base.load_file_from_s3(BUCKET, 'TestKey/missing.txt'),
+                    await s3_base.list_keys(BUCKET, 'TestKey'))
+
+    exists, missing, content, lines, data, missing_content, keys = asyncio.run(run())
+    assert exists is True
+    assert missing is False
+    assert content == b'Here we have some data\nand this is a new line'
+    assert lines == ['Here we have some data', 'and this is a new line']
+    assert data == {'id': 1}
+    assert missing_content is None
+    assert sorted(keys) == ['TestKey/data.json', 'TestKey/somefile.txt']
+
+
+def test_upload_load_and_delete_many(s3, moto_server):
+    """Test function for concurrent uploads, loads and deletes in aioawsutils
+    """
+    keys = [f'Many/{i}.json' for i in range(50)]
+
+    async def run():
+        async with aawsu.AsyncS3Base(endpoint_url=moto_server, max_concurrency=8) as s3_base:
+            await asyncio.gather(*[s3_base.upload_as_json_to_s3({'id': i}, BUCKET, key)
+                                   for i, key in enumerate(keys)])
+            loaded = dict([item async for item in s3_base.load_files_from_s3(BUCKET, prefix='Many', decode='json')])
+            s3_base.delete_batch_size = 7
+            deleted = await s3_base.delete_all_keys_from_list(BUCKET, 'Many', max_batches_in_flight=2)
+            return loaded, deleted, await s3_base.list_keys(BUCKET, 'Many')
+
+    loaded, deleted, remaining = asyncio.run(run())
+    assert len(loaded) == 50
+    assert loaded['Many/7.json'] == {'id': 7}
+    assert sorted(deleted['deleted']) == sorted(keys)
+    assert remaining == []
+
+
+def test_load_files_from_s3_bounded():
+    """Test function for the bounded window of load_files_from_s3() function in aioawsutils
+    """
+    started = []
+
+    async def load(bucket, key, decode):
+        started.append(key)
+        return key, b''
+
+    async def run():
+        s3_base = aawsu.AsyncS3Base(max_concurrency=2)
+        s3_base._load_and_decode = load
+        loads = s3_base.load_files_from_s3(BUCKET, keys=[f'Bounded/{i}' for i in range(20)])
+        first = await loads.__anext__()
+        ahead = len(started)
+        return [first] + [item async for item in loads], ahead
+
+    loaded, ahead = asyncio.run(run())
+    assert ahead == 4
+    assert sorted(key for key, _ in loaded) == sorted(f'Bounded/{i}' for i in range(20))
+
+
+def test_upload_object_to_s3_multipart(s3, moto_server):
+    """Test function for multipart uploads with upload_object_to_s3() function in aioawsutils
+    """
+    line = 'x' * 99 + '\n'
+    chunks = (line * 1000 for _ in range(120))
+
+    in_flight = [0, 0]
+
+    async def run():
+        async with aawsu.AsyncS3Base(endpoint_url=moto_server, max_concurrency=8) as s3_base:
+            s3_base.part_size = 5 * 1024 * 1024
+            s3_base.max_parts_in_flight = 1
+            upload_part = s3_base._upload_part
+
+            async def counted_upload_part(*args):
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+                try:
+                    return await upload_part(*args)
+                finally:
+                    in_flight[0] -= 1
+            s3_base._upload_part = counted_upload_part
+            await s3_base.upload_object_to_s3(chunks, BUCKET, 'Large/file.txt')
+
+    asyncio.run(run())
+    obj = s3.Object(BUCKET, 'Large/file.txt')
+    assert in_flight[1] == 1
+    assert obj.e_tag.endswith('-3"')
+    assert obj.get()['Body'].read().decode('utf-8') == line * 120000
+
+
+def test_upload_object_to_s3_async_iterable(s3, moto_server):
+    """Test function for uploads of async iterables and file objects with upload_object_to_s3() in aioawsutils
+    """
+    line = 'x' * 99 + '\n'
+
+    async def chunks():
+        for _ in range(60):
+            yield line * 1000
+            await asyncio.sleep(0)
+
+    async def run():
+        async with aawsu.AsyncS3Base(endpoint_url=moto_server, max_concurrency=2) as s3_base:
+            s3_base.part_size = 5 * 1024 * 1024
+            await s3_base.upload_object_to_s3(chunks(), BUCKET, 'Large/async.txt')
+            await s3_base.upload_object_to_s3(io.BytesIO(b'file body'), BUCKET, 'Small/file.txt')
+
+    asyncio.run(run())
+    obj = s3.Object(BUCKET, 'Large/async.txt')
+    assert obj.e_tag.endswith('-2"')
+    assert obj.get()['Body'].read().decode('utf-8') == line * 60000
+    assert s3.Object(BUCKET, 'Small/file.txt').get()['Body'].read() == b'file body'
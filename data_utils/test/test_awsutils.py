@@ -8,14 +8,22 @@ EXPORT_BUCKET : str
 import pytest
 from data_utils import awsutils as awsu
 import boto3
+import botocore
 from moto import mock_s3, mock_ssm
 import pandas as pd
 import os
 import IPython
+import pyarrow as pa
 import pyarrow.parquet as pq
 import s3fs
 import json
 import csv
+import gzip
+import socket
+import io
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 CONFIG_BUCKET= 'CONF'
 INPUT_BUCKET= 'INPUT'
@@ -23,13 +31,15 @@ EXPORT_BUCKET= 'OUTPUT'
 LOG_BUCKET =  'LOG'
 
 @pytest.fixture(scope='function')
-def aws_credentials():
+def aws_credentials(monkeypatch):
     """Mocks AWS Credentials for moto.
     """
-    os.environ['CONFIG_BUCKET'] = CONFIG_BUCKET
-    os.environ['INPUT_BUCKET'] = INPUT_BUCKET
-    os.environ['EXPORT_BUCKET'] = EXPORT_BUCKET
-    os.environ['LOG_BUCKET'] = LOG_BUCKET
+    monkeypatch.setenv('CONFIG_BUCKET', CONFIG_BUCKET)
+    monkeypatch.setenv('INPUT_BUCKET', INPUT_BUCKET)
+    monkeypatch.setenv('EXPORT_BUCKET', EXPORT_BUCKET)
+    monkeypatch.setenv('LOG_BUCKET', LOG_BUCKET)
+    # moto can't decode the aws-chunked bodies newer botocore sends with checksums
+    monkeypatch.setenv('AWS_REQUEST_CHECKSUM_CALCULATION', 'when_required')
 
 @pytest.fixture(scope='function')
 def ssm(aws_credentials):
@@ -67,6 +77,88 @@ def test_get_ssm_parameter(ssm):
     assert bucket == 'OUTPUT'
 
 
+def test_get_ssm_parameters_cached(ssm):
+    """Test function for the cached get_ssm_parameters() and prefetch_ssm_parameters_by_path()
+    functions in awsutils
+    
+    Parameters
+    ----------
+    ssm : Mocked SSM service
+        Description
+    """
+    awsu.SSMBase.clear_ssm_cache()
+    ssm_base = awsu.SSMBase(region_name=ssm.meta.region_name, cache_ttl=300)
+    names = [f'Param{i}' for i in range(12)]
+    for i, name in enumerate(names):
+        ssm.put_parameter(Name=name, Value=f'value{i}', Type='String')
+    
+    values = ssm_base.get_ssm_parameters(names + ['Missing'])
+    assert len(values) == 12
+    assert values['Param11'] == 'value11'
+    
+    ssm.put_parameter(Name='Param3', Value='changed', Type='String', Overwrite=True)
+    assert ssm_base.get_ssm_parameter('Param3') == 'value3'
+    assert ssm_base.get_ssm_parameter('Param3', use_cache=False) == 'changed'
+    assert awsu.SSMBase(region_name=ssm.meta.region_name).get_ssm_parameter('Param3') == 'changed'
+    
+    other_region = boto3.client('ssm', region_name='us-west-2')
+    other_region.put_parameter(Name='Param3', Value='other', Type='String')
+    other_ssm_base = awsu.SSMBase(external_sess=other_region, region_name=ssm.meta.region_name, cache_ttl=300)
+    assert other_ssm_base.get_ssm_parameter('Param3') == 'other'
+    assert ssm_base.get_ssm_parameter('Param3') == 'value3'
+    awsu.client_registry.clear()
+    assert awsu.SSMBase(region_name=ssm.meta.region_name, cache_ttl=300).get_ssm_parameter('Param3') == 'value3'
+    assert all(isinstance(part, (str, type(None))) for key in awsu.parameter_cache._values for part in key[0])
+    
+    ssm.put_parameter(Name='/platform/buckets/export', Value='OUTPUT', Type='String')
+    ssm.put_parameter(Name='/platform/buckets/log/main', Value='LOG', Type='String')
+    values = ssm_base.prefetch_ssm_parameters_by_path('/platform/buckets')
+    assert values == {'/platform/buckets/export': 'OUTPUT', '/platform/buckets/log/main': 'LOG'}
+    ssm.delete_parameter(Name='/platform/buckets/export')
+    assert ssm_base.get_ssm_parameter('/platform/buckets/export') == 'OUTPUT'
+    awsu.SSMBase.clear_ssm_cache()
+
+def test_parameter_cache_coalesces_lookups():
+    """Test that concurrent lookups of the same key in ParameterCache send a single request
+    """
+    cache = awsu.ParameterCache()
+    calls = []
+    
+    def loader(keys):
+        calls.append(keys)
+        time.sleep(0.2)
+        return dict((key, key.upper()) for key in keys)
+    
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(executor.map(lambda _: cache.fetch(['a'], loader, 60), range(5)))
+    
+    assert calls == [['a']]
+    assert all(result == {'a': 'A'} for result in results)
+
+def test_client_registry(ssm):
+    """Test function for the shared clients of the client_registry in awsutils
+    
+    Parameters
+    ----------
+    ssm : Mocked SSM service
+        Description
+    """
+    registry = awsu.ClientRegistry(max_pool_connections=20)
+    client = registry.get_client('ssm')
+    
+    assert registry.get_client('ssm') is client
+    assert registry.get_client('ssm', region_name='us-east-1') is not client
+    assert client.meta.config.max_pool_connections == 20
+    assert registry.get_resource('s3').meta.client is registry.get_client('s3')
+    
+    registry.configure('ssm', max_pool_connections=30)
+    assert registry.get_client('ssm').meta.config.max_pool_connections == 30
+    assert registry.get_client('s3').meta.config.max_pool_connections == 20
+    
+    assert awsu.SSMBase().ssm_conn is awsu.SSMBase().ssm_conn
+    assert awsu.S3Base().s3_conn.meta.client is awsu.client_registry.get_client('s3')
+
+
 @pytest.fixture(scope='function')
 def s3(aws_credentials):
     """Mocks a S3 instace for moto with a testing bucket
@@ -141,6 +233,45 @@ def test_check_if_object_exists(s3, ssm):
     assert exists is True
     assert doesnt_exist is False
 
+def test_get_object_metadata(s3):
+    """Test function for get_object_metadata() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    
+    bucket = 'INPUT'
+    true_key = 'TestKey/somefile.txt'
+    fake_key = 'TestKey/missing.txt'
+    
+    meta = s3_base.get_object_metadata(bucket, true_key)
+    assert meta['ContentLength'] == 45
+    assert meta['ETag']
+    assert (bucket, true_key) in s3_base.meta_cache
+    assert s3_base.get_object_metadata(bucket, fake_key) is None
+    
+    s3.Object(bucket, true_key).delete()
+    assert s3_base.check_if_object_exists(bucket, true_key) is True
+    s3_base.invalidate_object_metadata(bucket, true_key)
+    assert s3_base.check_if_object_exists(bucket, true_key) is False
+    
+    s3.Object(bucket, true_key).put(Body=b'new')
+    s3_base.meta_cache_ttl = 0.2
+    assert s3_base.get_object_metadata(bucket, true_key)['ContentLength'] == 3
+    s3.Object(bucket, true_key).delete()
+    assert s3_base.check_if_object_exists(bucket, true_key) is True
+    time.sleep(0.3)
+    assert s3_base.check_if_object_exists(bucket, true_key) is False
+    assert (bucket, true_key) not in s3_base.meta_cache
+    
+    s3_base.meta_cache_ttl = 0
+    s3.Object(bucket, true_key).put(Body=b'new')
+    assert s3_base.check_if_object_exists(bucket, true_key) is True
+    assert (bucket, true_key) not in s3_base.meta_cache
+
 def test_list_buckets(s3):
     """Test function for list_buckets() function in awsutils
     
@@ -173,6 +304,59 @@ def test_list_keys(s3):
     assert 'TestKey/somefile.txt' in keys
     assert 'TestKey/anotherfile.txt' in keys
 
+def test_iter_objects(s3):
+    """Test function for iter_objects() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    bucket = 'INPUT'
+    
+    objs = list(s3_base.iter_objects(bucket, 'TestKey', page_size=1))
+    
+    assert sorted(obj['Key'] for obj in objs) == ['TestKey/anotherfile.txt', 'TestKey/somefile.txt']
+    assert all(obj['Size'] > 0 and obj['ETag'] for obj in objs)
+
+def test_list_partition_values(s3):
+    """Test function for list_partition_values() and iter_objects_in_prefixes() functions in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    bucket = 'INPUT'
+    prefix = 'transaction=order'
+    for mandator in ['a', 'b']:
+        for day in [1, 2]:
+            key = f'{prefix}/partition_mandator={mandator}/partition_day={day}/order.parquet'
+            s3.Object(bucket, key).put(Body=b'data')
+    
+    assert s3_base.list_partition_values(bucket, prefix) == ['a', 'b']
+    assert s3_base.list_common_prefixes(bucket, prefix) == [
+        f'{prefix}/partition_mandator=a/', f'{prefix}/partition_mandator=b/']
+    
+    prefixes = s3_base.list_common_prefixes(bucket, f'{prefix}/partition_mandator=a')
+    keys = [obj['Key'] for obj in s3_base.iter_objects_in_prefixes(bucket, prefixes)]
+    assert sorted(keys) == [
+        f'{prefix}/partition_mandator=a/partition_day=1/order.parquet',
+        f'{prefix}/partition_mandator=a/partition_day=2/order.parquet']
+    
+    submitted = []
+    def lazy_prefixes():
+        for mandator in ['a', 'b'] * 5:
+            submitted.append(mandator)
+            yield f'{prefix}/partition_mandator={mandator}/'
+    objects = s3_base.iter_objects_in_prefixes(bucket, lazy_prefixes(), max_workers=2)
+    next(objects)
+    assert len(submitted) <= 3
+    assert len(list(objects)) == 19
+    assert len(submitted) == 10
+
 def test_load_list_file_from_s3(s3):
     """Test function for load_list_file_from_s3() function in awsutils
     
@@ -207,6 +391,22 @@ def test_load_file_from_s3(s3):
     
     assert content == b'Here we have some data\nand this is a new line'
 
+def test_load_missing_file_from_s3(s3):
+    """Test that the load functions return None for a missing key
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    bucket = 'INPUT'
+    target_key = 'TestKey/missing.txt'
+    
+    assert s3_base.load_file_from_s3(bucket, target_key) is None
+    assert s3_base.load_list_file_from_s3(bucket, target_key) is None
+    assert s3_base.load_json_from_s3(bucket, target_key) is None
+
 def test_load_json_from_s3(s3):
     """Test function for load_json_from_s3() function in awsutils
     
@@ -233,6 +433,75 @@ def test_load_json_from_s3(s3):
     assert content['2']['col1'] == 2
     assert content['3']['col2'] == 'mno'
 
+def test_iter_lines_from_s3(s3):
+    """Test function for iter_lines_from_s3() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    bucket = 'INPUT'
+    body = ''.join(json.dumps({'id': i}) + '\n' for i in range(5)).encode('utf-8')
+    s3.Object(bucket, 'Events/raw.jsonp').put(Body=body)
+    s3.Object(bucket, 'Events/raw.jsonp.gz').put(Body=gzip.compress(body))
+    s3.Object(bucket, 'Events/raw_encoded.jsonp').put(Body=gzip.compress(body), ContentEncoding='gzip')
+    
+    lines = list(s3_base.iter_lines_from_s3(bucket, 'Events/raw.jsonp', chunk_size=7))
+    assert lines == [json.dumps({'id': i}) for i in range(5)]
+    
+    for key in ['Events/raw.jsonp.gz', 'Events/raw_encoded.jsonp']:
+        batches = list(s3_base.iter_lines_from_s3(bucket, key, parse_json=True, batch_size=2))
+        assert batches == [[{'id': 0}, {'id': 1}], [{'id': 2}, {'id': 3}], [{'id': 4}]]
+    
+    assert s3_base.iter_lines_from_s3(bucket, 'Events/missing.jsonp') is None
+
+def test_iter_lines_from_s3_zstd(s3):
+    """Test function for zstd compressed objects in iter_lines_from_s3() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    zstandard = pytest.importorskip('zstandard')
+    s3_base = awsu.S3Base()
+    bucket = 'INPUT'
+    body = ''.join(json.dumps({'id': i}) + '\n' for i in range(5)).encode('utf-8')
+    s3.Object(bucket, 'Events/raw.jsonp.zst').put(Body=zstandard.ZstdCompressor().compress(body))
+    
+    records = list(s3_base.iter_lines_from_s3(bucket, 'Events/raw.jsonp.zst', parse_json=True))
+    assert records == [{'id': i} for i in range(5)]
+
+def test_load_files_from_s3(s3):
+    """Test function for load_files_from_s3() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    bucket = 'INPUT'
+    keys = [f'JsonKey/{i}.json' for i in range(6)]
+    for i, key in enumerate(keys):
+        s3.Object(bucket, key).put(Body=json.dumps({'id': i}))
+    s3.Object(bucket, 'JsonKey/broken.json').put(Body=b'{no json')
+    
+    results = list(s3_base.load_files_from_s3(bucket, keys, decode='json', max_workers=2, ordered=True))
+    assert [key for key, _ in results] == keys
+    assert [payload['id'] for _, payload in results] == list(range(6))
+    
+    results = dict(s3_base.load_files_from_s3(bucket, prefix='JsonKey', decode='json'))
+    assert len(results) == 7
+    assert results['JsonKey/3.json'] == {'id': 3}
+    assert isinstance(results['JsonKey/broken.json'], awsu.S3ObjectError)
+    
+    results = dict(s3_base.load_files_from_s3(bucket, ['TestKey/somefile.txt', 'TestKey/missing.txt'], decode='lines'))
+    assert results['TestKey/somefile.txt'] == ['Here we have some data', 'and this is a new line']
+    assert results['TestKey/missing.txt'] is None
+
 def test_upload_parquet_to_s3(s3):
     """Test function for upload_parquet_to_s3() function in awsutils
     
@@ -261,6 +530,641 @@ def test_upload_parquet_to_s3(s3):
     assert df['col1'][0] == 1
     assert df['col2'][1] == 'def'
 
+def test_upload_parquet_to_s3_with_writer(s3):
+    """Test function for parquet writer configurations in upload_parquet_to_s3() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    
+    bucket = 'INPUT'
+    target_key = 'TestKey/1111111111.parquet'
+    s3_uri = os.path.join(f's3://{bucket}',target_key)
+    parquet_context = pd.DataFrame({'col1': list(range(1000)), 'col2': ['abc', 'def'] * 500})
+    parquet_writer = {'preset': 'scan-optimised', 'row_group_size': 300,
+                      'columns': {'col2': {'compression': 'gzip', 'use_dictionary': False}}}
+    
+    result = s3_base.upload_parquet_to_s3(s3_uri, parquet_context, parquet_writer=parquet_writer)
+    
+    body = s3.Object(bucket, target_key).get()['Body'].read()
+    parquet_file = pq.ParquetFile(pa.BufferReader(body))
+    row_group = parquet_file.metadata.row_group(0)
+    assert result == f'file uploaded to {s3_uri}'
+    assert parquet_file.metadata.num_row_groups == 4
+    assert row_group.column(0).compression == 'ZSTD'
+    assert row_group.column(1).compression == 'GZIP'
+    assert 'RLE_DICTIONARY' not in row_group.column(1).encodings
+    assert parquet_file.read().to_pandas().equals(parquet_context)
+
+def test_store_partitioned_data_in_s3(s3):
+    """Test function for store_partitioned_data_in_s3() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    df = pd.DataFrame({'created': pd.date_range('2020-05-10 12:00', periods=600, freq='10min'),
+                       'mandator': ['vnr', 'oct', 'abc'] * 200,
+                       'payload': [os.urandom(50).hex() for i in range(600)]})
+    
+    manifest = s3_base.store_partitioned_data_in_s3(df, 'order', False, EXPORT_BUCKET, 'created', 'mandator',
+                                                    max_file_size=4096, manifest_key='manifest/order.json')
+    
+    keys = [entry['key'] for entry in manifest['files']]
+    first_day = [entry for entry in manifest['files']
+                 if entry['mandator'] == 'vnr' and entry['partition_date'] == '2020-05-11']
+    stored = pd.concat([pd.read_parquet(pa.BufferReader(s3.Object(EXPORT_BUCKET, entry['key']).get()['Body'].read()))
+                        for entry in first_day])
+    assert manifest['rows'] == 600
+    assert len(set(keys)) == len(keys)
+    assert len(first_day) > 1
+    assert all(entry['bytes'] <= 4096 for entry in manifest['files'])
+    assert first_day[0]['key'] == ('personal=False/transaction=order/partition_mandator=vnr/partition_year=2020/'
+                                   'partition_month=5/partition_day=11/0_order.parquet')
+    assert sorted(stored['created'].dt.day.unique()) == [11]
+    assert len(stored) == df[
+        (df['mandator'] == 'vnr') & (df['created'].dt.day == 11)].shape[0]
+    assert s3_base.load_json_from_s3(EXPORT_BUCKET, 'manifest/order.json') == manifest
+    
+    prefix = first_day[0]['key'].rsplit('/', 1)[0] + '/'
+    s3.Object(EXPORT_BUCKET, f'{prefix}20200512-0_order.parquet').put(Body=b'compacted')
+    s3.Object(EXPORT_BUCKET, f'{prefix}0_other.parquet').put(Body=b'other data type')
+    s3_base.store_partitioned_data_in_s3(df[(df['mandator'] == 'vnr') & (df['created'].dt.day == 11)].iloc[:5],
+                                         'order', False, EXPORT_BUCKET, 'created', 'mandator')
+    assert sorted(obj['Key'] for obj in s3_base.iter_objects(EXPORT_BUCKET, prefix)) == [
+        f'{prefix}0_order.parquet', f'{prefix}0_other.parquet']
+    assert s3_base.count_parquet_rows(EXPORT_BUCKET, f'{prefix}0_order') == 5
+    
+    df.loc[3, 'created'] = pd.NaT
+    df.loc[4, 'mandator'] = None
+    with pytest.raises(ValueError, match='2 rows'):
+        s3_base.store_partitioned_data_in_s3(df, 'order', False, EXPORT_BUCKET, 'created', 'mandator')
+
+def test_load_partitioned_parquet_from_s3(s3):
+    """Test function for load_partitioned_parquet_from_s3() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    df = pd.DataFrame({'created': pd.date_range('2020-05-10', periods=720, freq='10min'),
+                       'mandator': ['vnr', 'oct', 'abc'] * 240,
+                       'amount': list(range(720)),
+                       'payload': ['x'] * 720})
+    s3_base.store_partitioned_data_in_s3(df, 'order', False, EXPORT_BUCKET, 'created', 'mandator')
+    
+    prefixes = s3_base.create_partition_prefixes(EXPORT_BUCKET, 'order', datetime.datetime(2020, 5, 11),
+                                                 datetime.datetime(2020, 5, 12), mandators=['vnr'])
+    result = s3_base.load_partitioned_parquet_from_s3(EXPORT_BUCKET, 'order', '2020-05-11', '2020-05-12',
+                                                      mandators=['vnr', 'oct'], columns=['mandator', 'amount'],
+                                                      filters=[('amount', '>=', 400)])
+    expected = df[(df['created'] >= '2020-05-11') & (df['created'] < '2020-05-13') &
+                  df['mandator'].isin(['vnr', 'oct']) & (df['amount'] >= 400)]
+    assert prefixes == ['personal=False/transaction=order/partition_mandator=vnr/partition_year=2020/'
+                        'partition_month=5/partition_day=11/',
+                        'personal=False/transaction=order/partition_mandator=vnr/partition_year=2020/'
+                        'partition_month=5/partition_day=12/']
+    assert sorted(s3_base.create_partition_prefixes(EXPORT_BUCKET, 'order', '2020-05-11')) == [
+        f'personal=False/transaction=order/partition_mandator={mandator}/partition_year=2020/'
+        'partition_month=5/partition_day=11/' for mandator in ['abc', 'oct', 'vnr']]
+    assert list(result.columns) == ['mandator', 'amount']
+    assert sorted(result['amount']) == sorted(expected['amount'])
+    assert s3_base.load_partitioned_parquet_from_s3(EXPORT_BUCKET, 'order', '2021-01-01') is None
+
+def test_load_partitioned_parquet_from_s3_partition_columns(s3):
+    """Test function for partition columns, schema promotion and pinned reads of load_partitioned_parquet_from_s3()
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    for day, df in ((11, pd.DataFrame({'amount': [1, 2]})), (12, pd.DataFrame({'amount': [3], 'extra': ['x']}))):
+        s3_base.store_raw_data_in_s3(datetime.date(2020, 5, day), 'order', df, False, 'vnr', EXPORT_BUCKET,
+                                     parquet=True)
+    
+    result = s3_base.load_partitioned_parquet_from_s3(EXPORT_BUCKET, 'order', '2020-05-11', '2020-05-12')
+    selected = s3_base.load_partitioned_parquet_from_s3(EXPORT_BUCKET, 'order', '2020-05-11', '2020-05-12',
+                                                        columns=['partition_day', 'amount'], as_arrow=True)
+    assert list(result.columns) == ['amount', 'partition_mandator', 'partition_year', 'partition_month',
+                                    'partition_day', 'extra']
+    assert result['amount'].tolist() == [1, 2, 3]
+    assert result['partition_day'].astype(str).tolist() == ['11', '11', '12']
+    assert set(result['partition_mandator']) == {'vnr'}
+    assert result['extra'].isna().tolist() == [True, True, False]
+    assert selected.column_names == ['partition_day', 'amount']
+    
+    key = s3_base.create_data_key(datetime.date(2020, 5, 11), None, 'order', 'vnr', parquet=True) + '/order.parquet'
+    meta = s3_base.get_object_metadata(EXPORT_BUCKET, key)
+    object_file = awsu._S3ObjectFile(s3.meta.client, EXPORT_BUCKET, key, meta['ContentLength'])
+    object_file.read(4)
+    s3_base.upload_parquet_to_s3(f's3://{EXPORT_BUCKET}/{key}', pd.DataFrame({'amount': [5]}))
+    with pytest.raises(botocore.exceptions.ClientError, match='PreconditionFailed'):
+        object_file.read(4)
+
+def test_iter_parquet_from_s3(s3):
+    """Test function for iter_parquet_from_s3() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    df = pd.DataFrame({'col1': list(range(1000)), 'col2': ['abc', 'def'] * 500})
+    for i in range(2):
+        s3_base.upload_parquet_to_s3(f's3://{EXPORT_BUCKET}/Chunks/{i}_order.parquet', df,
+                                     parquet_writer={'row_group_size': 128})
+    
+    stats = {}
+    batches = list(s3_base.iter_parquet_from_s3(f's3://{EXPORT_BUCKET}/Chunks/', batch_size=300, stats=stats))
+    arrow_batches = list(s3_base.iter_parquet_from_s3(f's3://{EXPORT_BUCKET}/Chunks/0_order.parquet',
+                                                      columns=['col1'], batch_bytes=800, as_arrow=True))
+    first = next(s3_base.iter_parquet_from_s3(f's3://{EXPORT_BUCKET}/Chunks/', batch_size=10, prefetch=1))
+    
+    assert [len(batch) for batch in batches] == [300, 300, 300, 100] * 2
+    assert pd.concat(batches[:4], ignore_index=True).equals(df)
+    assert stats['files'] == 2
+    assert stats['rows'] == 2000
+    assert 0 < stats['peak_buffered_bytes'] < 2000 * 20
+    assert arrow_batches[0].schema.names == ['col1']
+    assert 50 < arrow_batches[0].num_rows <= 100
+    assert sum(batch.num_rows for batch in arrow_batches) == 1000
+    assert first['col1'].tolist() == list(range(10))
+
+def test_compact_partition(s3, monkeypatch):
+    """Test function for compact_partition() and recover_compactions() functions in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    partition_date = datetime.date(2020, 5, 11)
+    prefix = s3_base.create_data_key(partition_date, None, 'order', 'vnr', parquet=True) + '/'
+    df = pd.DataFrame({'col1': list(range(3000)), 'col2': [os.urandom(8).hex() for _ in range(3000)]})
+    for chunk in range(6):
+        s3_base.store_raw_data_in_s3(partition_date, 'order', df.iloc[chunk * 500:(chunk + 1) * 500], False, 'vnr',
+                                     EXPORT_BUCKET, parquet=True, chunk=chunk, chunk_name=True)
+    
+    def fail(*args):
+        raise ValueError('rows differ')
+    monkeypatch.setattr(s3_base, '_verify_compaction', fail)
+    with pytest.raises(ValueError):
+        s3_base.compact_partition(EXPORT_BUCKET, prefix)
+    unchanged = sorted(obj['Key'] for obj in s3_base.iter_objects(EXPORT_BUCKET, prefix))
+    monkeypatch.undo()
+    
+    monkeypatch.setattr(s3_base, '_finish_compaction', fail)
+    with pytest.raises(ValueError):
+        s3_base.compact_partition(EXPORT_BUCKET, prefix, target_size=20000)
+    interrupted = sorted(obj['Key'] for obj in s3_base.iter_objects(EXPORT_BUCKET, prefix))
+    monkeypatch.undo()
+    during = s3_base.load_partitioned_parquet_from_s3(EXPORT_BUCKET, 'order', '2020-05-11', mandators=['vnr'])
+    recovered = s3_base.recover_compactions(EXPORT_BUCKET, 'personal=False/')
+    
+    keys = sorted(obj['Key'] for obj in s3_base.iter_objects(EXPORT_BUCKET, prefix))
+    result = s3_base.load_partitioned_parquet_from_s3(EXPORT_BUCKET, 'order', '2020-05-11', mandators=['vnr'])
+    assert unchanged == [f'{prefix}{chunk}_order.parquet' for chunk in range(6)]
+    assert len(interrupted) > 7
+    assert sorted(during['col1']) == list(range(3000))
+    assert len(recovered['rolled_forward']) == 1
+    assert len(keys) > 1
+    assert all(key.rsplit('/', 1)[-1][0] != '_' and key.endswith('_order.parquet') for key in keys)
+    assert sorted(result['col1']) == list(range(3000))
+    assert s3_base.compact_partition(EXPORT_BUCKET, prefix, small_file_size=1) is None
+    assert s3_base.find_compaction_candidates(EXPORT_BUCKET, 'personal=False/', small_file_size=1) == {}
+
+def test_compact_partition_lease_and_changed_inputs(s3, monkeypatch):
+    """Test function for the lease, staged file and input checks of compact_partition() in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    partition_date = datetime.date(2020, 5, 11)
+    prefix = s3_base.create_data_key(partition_date, None, 'order', 'vnr', parquet=True) + '/'
+    df = pd.DataFrame({'col1': list(range(1000))})
+    for chunk in range(4):
+        s3_base.store_raw_data_in_s3(partition_date, 'order', df.iloc[chunk * 250:(chunk + 1) * 250], False, 'vnr',
+                                     EXPORT_BUCKET, parquet=True, chunk=chunk, chunk_name=True)
+    inputs = sorted(obj['Key'] for obj in s3_base.iter_objects(EXPORT_BUCKET, prefix))
+    verify = s3_base._verify_compaction
+    recovered = []
+    
+    def recover_then_verify(bucket, manifest_key, manifest):
+        recovered.append(s3_base.recover_compactions(bucket, prefix, stale_after=0))
+        verify(bucket, manifest_key, manifest)
+    monkeypatch.setattr(s3_base, '_verify_compaction', recover_then_verify)
+    monkeypatch.setattr(s3_base, 'compaction_lease', 0)
+    with pytest.raises(ValueError, match='recovered by another process'):
+        s3_base.compact_partition(EXPORT_BUCKET, prefix)
+    assert len(recovered[-1]['rolled_back']) == 1
+    monkeypatch.setattr(s3_base, 'compaction_lease', 600)
+    
+    def delete_staged_then_verify(bucket, manifest_key, manifest):
+        s3.Object(bucket, manifest['outputs'][0]['staged']).delete()
+        verify(bucket, manifest_key, manifest)
+    monkeypatch.setattr(s3_base, '_verify_compaction', delete_staged_then_verify)
+    with pytest.raises(ValueError, match='is missing'):
+        s3_base.compact_partition(EXPORT_BUCKET, prefix)
+    
+    def verify_then_overwrite(bucket, manifest_key, manifest):
+        recovered.append(s3_base.recover_compactions(bucket, prefix, stale_after=0))
+        verify(bucket, manifest_key, manifest)
+        s3_base.upload_parquet_to_s3(f's3://{bucket}/{inputs[0]}', df.iloc[:10])
+    monkeypatch.setattr(s3_base, '_verify_compaction', verify_then_overwrite)
+    with pytest.raises(ValueError, match='was rolled back'):
+        s3_base.compact_partition(EXPORT_BUCKET, prefix)
+    monkeypatch.undo()
+    
+    assert recovered[-1] == {'rolled_forward': [], 'rolled_back': []}
+    assert sorted(obj['Key'] for obj in s3_base.iter_objects(EXPORT_BUCKET, prefix)) == inputs
+    item = {'key': inputs[1], 'etag': s3_base.get_object_metadata(EXPORT_BUCKET, inputs[1])['ETag']}
+    s3_base.upload_parquet_to_s3(f's3://{EXPORT_BUCKET}/{inputs[1]}', df.iloc[:20])
+    assert s3_base._delete_compaction_input(EXPORT_BUCKET, item) is False
+    assert s3_base.check_if_object_exists(EXPORT_BUCKET, inputs[1])
+    
+    def interrupt(*args):
+        raise ValueError('interrupted')
+    monkeypatch.setattr(s3_base, '_finish_compaction', interrupt)
+    with pytest.raises(ValueError, match='interrupted'):
+        s3_base.compact_partition(EXPORT_BUCKET, prefix)
+    monkeypatch.undo()
+    manifest_key = next(obj['Key'] for obj in s3_base.iter_objects(EXPORT_BUCKET, prefix) if '_compaction_' in obj['Key'])
+    output = s3_base.load_json_from_s3(EXPORT_BUCKET, manifest_key)['outputs'][0]
+    s3.meta.client.copy({'Bucket': EXPORT_BUCKET, 'Key': output['staged']}, EXPORT_BUCKET, output['key'])
+    committed = s3_base.count_parquet_rows(EXPORT_BUCKET, prefix)
+    s3_base.upload_parquet_to_s3(f's3://{EXPORT_BUCKET}/{inputs[2]}', df.iloc[:30])
+    with pytest.raises(ValueError, match='was rolled back'):
+        s3_base.recover_compactions(EXPORT_BUCKET, prefix)
+    assert committed == 10 + 20 + 250 + 250
+    assert sorted(obj['Key'] for obj in s3_base.iter_objects(EXPORT_BUCKET, prefix)) == inputs
+    assert s3_base.count_parquet_rows(EXPORT_BUCKET, prefix) == 10 + 20 + 30 + 250
+
+def test_store_report_log_in_s3_buffered(s3):
+    """Test function for buffered report logs with store_report_log_in_s3() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    process_start_date = datetime.datetime(2020, 5, 11, 8, 30, 0)
+    writer = s3_base.get_report_log_writer(EXPORT_BUCKET, max_records=3, flush_interval=60)
+    
+    for index in range(5):
+        s3_base.store_report_log_in_s3('raw', {'rows': index}, process_start_date, index, 'order', 'vnr',
+                                       log_bucket=EXPORT_BUCKET, buffered=True)
+    assert writer.flush(timeout=10)
+    writer.close()
+    
+    keys = [obj['Key'] for obj in s3_base.iter_objects(EXPORT_BUCKET, 'type=raw/')]
+    records = [record for key in keys for record in s3_base.iter_lines_from_s3(EXPORT_BUCKET, key, parse_json=True)]
+    assert all(key.startswith('type=raw/partition_year=2020/partition_month=5/partition_day=11/report_083000_')
+               and key.endswith('.jsonp') for key in keys)
+    assert 1 <= len(keys) <= 2
+    assert sorted(record['report']['rows'] for record in records) == list(range(5))
+    assert records[0]['data_type'] == 'order'
+    assert records[0]['mandator'] == 'vnr'
+    assert s3_base.get_report_log_writer(EXPORT_BUCKET) is not writer
+    with pytest.raises(ValueError):
+        writer.write('raw', {}, process_start_date, 0, 'order', 'vnr')
+
+def test_report_log_writer_failed_uploads(s3, monkeypatch):
+    """Test function for flush() and close() of ReportLogWriter in awsutils with failing uploads
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    process_start_date = datetime.datetime(2020, 5, 11, 8, 30, 0)
+    writer = s3_base.get_report_log_writer(EXPORT_BUCKET, max_records=100, flush_interval=60)
+    assert s3_base.get_report_log_writer(EXPORT_BUCKET, max_records=100) is writer
+    with pytest.raises(ValueError):
+        s3_base.get_report_log_writer(EXPORT_BUCKET, max_records=10)
+    
+    def fail(*args, **kwargs):
+        raise ValueError('upload failed')
+    monkeypatch.setattr(s3_base, 'upload_object_to_s3', fail)
+    writer.write('raw', {'rows': 1}, process_start_date, 0, 'order', 'vnr')
+    assert writer.flush(timeout=10) is False
+    monkeypatch.undo()
+    assert writer.flush(timeout=10) is True
+    
+    monkeypatch.setattr(s3_base, 'upload_object_to_s3', fail)
+    writer.write('raw', {'rows': 2}, process_start_date, 1, 'order', 'vnr')
+    assert writer.close(timeout=10) is False
+    assert writer.dropped == 1
+    monkeypatch.undo()
+    assert len(list(s3_base.iter_objects(EXPORT_BUCKET, 'type=raw/'))) == 1
+
+def test_upload_object_to_s3_skip_unchanged(s3):
+    """Test function for skip_unchanged uploads with upload_object_to_s3() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    part_size = 5 * 1024 * 1024
+    line = 'x' * 99 + '\n'
+    
+    s3_base.upload_object_to_s3(b'plain content', EXPORT_BUCKET, 'Unchanged/plain.txt')
+    skipped_plain = s3_base.upload_object_to_s3(b'plain content', EXPORT_BUCKET, 'Unchanged/plain.txt',
+                                                skip_unchanged=True)
+    first = s3_base.upload_object_to_s3((line * 1000 for _ in range(120)), EXPORT_BUCKET, 'Unchanged/large.txt',
+                                        part_size=part_size, skip_unchanged=True)
+    second = s3_base.upload_object_to_s3((line * 1000 for _ in range(120)), EXPORT_BUCKET, 'Unchanged/large.txt',
+                                         part_size=part_size, skip_unchanged=True)
+    changed = s3_base.upload_object_to_s3((line * 1000 for _ in range(121)), EXPORT_BUCKET, 'Unchanged/large.txt',
+                                          part_size=part_size, skip_unchanged=True)
+    s3_base.store_raw_master_data_in_s3('sku', 'sku', pd.DataFrame({'id': [1, 2]}), False, 0, EXPORT_BUCKET, 'vnr',
+                                        parquet=True, skip_unchanged=True)
+    s3_base.store_raw_master_data_in_s3('sku', 'sku', pd.DataFrame({'id': [1, 2]}), False, 0, EXPORT_BUCKET, 'vnr',
+                                        parquet=True, skip_unchanged=True)
+    
+    obj = s3.Object(EXPORT_BUCKET, 'Unchanged/large.txt')
+    assert skipped_plain is False
+    assert first is True
+    assert second is False
+    assert changed is True
+    assert obj.content_length == 121 * 100000
+    assert 'content-sha256' in obj.metadata
+    assert s3_base.upload_stats['unchanged_checks'] == 6
+    assert s3_base.upload_stats['skipped_uploads'] == 3
+    assert s3_base.upload_stats['saved_requests'] == 1 + (3 + 2) + 1
+    assert s3_base.upload_stats['saved_bytes'] > 120 * 100000
+
+class RawResponse(io.BytesIO):
+    """Raw http response body for injected botocore responses
+    """
+
+    def stream(self, **kwargs):
+        yield self.read()
+
+
+def test_adaptive_retry_policy(s3, monkeypatch):
+    """Test function for the AdaptiveRetryPolicy of the s3 clients in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    from botocore.awsrequest import AWSResponse
+    s3_base = awsu.S3Base()
+    monkeypatch.setattr(awsu.s3_retry_policy, 'base_delay', 0.001)
+    monkeypatch.setattr(awsu.s3_retry_policy, 'success_threshold', 2)
+    awsu.s3_retry_policy.reset()
+    throttled = []
+    
+    def slow_down(request, **kwargs):
+        if len(throttled) < 3:
+            throttled.append(request.url)
+            return AWSResponse(request.url, 503, {}, RawResponse(
+                b'<Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>'))
+    s3_base.s3_conn.meta.client.meta.events.register_first('before-send.s3.PutObject', slow_down)
+    
+    s3_base.upload_object_to_s3(b'content', EXPORT_BUCKET, 'Hot/prefix/file.txt')
+    throttled_state = s3_base.get_retry_state()
+    for i in range(4):
+        s3_base.upload_object_to_s3(b'content', EXPORT_BUCKET, f'Hot/prefix/file{i}.txt')
+    state = s3_base.get_retry_state()
+    s3_base.s3_conn.meta.client.meta.events.unregister('before-send.s3.PutObject', slow_down)
+    
+    prefix = f'{EXPORT_BUCKET}/Hot/prefix'
+    assert s3.Object(EXPORT_BUCKET, 'Hot/prefix/file.txt').get()['Body'].read() == b'content'
+    assert len(throttled) == 3
+    assert throttled_state['throttles'] == 3
+    assert throttled_state['retries'] == 3
+    assert throttled_state['prefixes'][prefix]['rate'] == awsu.s3_retry_policy.initial_rate * 0.5 ** 3
+    assert state['prefixes'][prefix]['rate'] == throttled_state['prefixes'][prefix]['rate'] * 1.2 ** 2
+    assert state['failures'] == 0
+    assert s3_base.s3_conn.meta.client.meta.config.retries['total_max_attempts'] == 1
+
+def test_metrics_recorder(s3, tmp_path, monkeypatch):
+    """Test function for the MetricsRecorder and its sinks in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    s3_base.upload_as_json_to_s3({'id': 1}, EXPORT_BUCKET, 'Metrics/disabled.json')
+    assert awsu.metrics.snapshot(reset=True)['operations'] == {}
+    
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(5)
+    statsd = awsu.StatsdMetricsSink(port=receiver.getsockname()[1])
+    monkeypatch.setattr(awsu.metrics, 'enabled', True)
+    monkeypatch.setattr(awsu.metrics, 'sinks', [awsu.JsonFileMetricsSink(str(tmp_path / 'metrics.jsonl')), statsd])
+    s3_base.upload_as_json_to_s3({'id': 1}, EXPORT_BUCKET, 'Metrics/data.json')
+    s3_base.load_file_from_s3(EXPORT_BUCKET, 'Metrics/data.json')
+    s3_base.load_file_from_s3(EXPORT_BUCKET, 'Metrics/missing.json')
+    s3_base.encode_parquet(pd.DataFrame({'col1': [1, 2]}))
+    snapshot = awsu.metrics.flush()
+    
+    operations = snapshot['operations']
+    stored = json.loads((tmp_path / 'metrics.jsonl').read_text().splitlines()[0])
+    packet = receiver.recv(4096).decode('utf-8')
+    receiver.close()
+    assert operations['s3.PutObject'][EXPORT_BUCKET]['count'] == 1
+    assert operations['s3.PutObject'][EXPORT_BUCKET]['bytes_out'] == len(awsu.gu.json_dumps({'id': 1}))
+    assert operations['s3.GetObject'][EXPORT_BUCKET]['count'] == 2
+    assert operations['s3.GetObject'][EXPORT_BUCKET]['bytes_in'] == len(awsu.gu.json_dumps({'id': 1}))
+    assert operations['s3.GetObject'][EXPORT_BUCKET]['errors'] == {'NoSuchKey': 1}
+    assert sum(operations['s3.GetObject'][EXPORT_BUCKET]['latency_ms']['histogram'].values()) == 2
+    assert operations['encode.parquet']['']['bytes_out'] > 0
+    assert operations['encode.json']['']['count'] == 1
+    assert stored['operations'] == operations
+    assert f'data_utils.s3_GetObject.{EXPORT_BUCKET}.count:2|c' in packet.split('\n')
+    assert awsu.metrics.snapshot()['operations'] == {}
+
+def test_disk_cache(s3, tmp_path):
+    """Test function for the S3DiskCache of load_file_from_s3() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    cache = s3_base.enable_disk_cache(str(tmp_path), max_size=1000)
+    s3.Object(EXPORT_BUCKET, 'Cached/data.json').put(Body=json.dumps({'id': 1}))
+    s3.Object(EXPORT_BUCKET, 'Cached/data.json.gz').put(Body=gzip.compress(b'{"id": 2}'))
+    s3_base.upload_parquet_to_s3(f's3://{EXPORT_BUCKET}/Cached/data.parquet', pd.DataFrame({'col1': [1, 2]}))
+    
+    first = s3_base.load_json_from_s3(EXPORT_BUCKET, 'Cached/data.json')
+    second = s3_base.load_json_from_s3(EXPORT_BUCKET, 'Cached/data.json')
+    compressed = s3_base.load_json_from_s3(EXPORT_BUCKET, 'Cached/data.json.gz')
+    hits = dict(cache.stats)
+    s3.Object(EXPORT_BUCKET, 'Cached/data.json').put(Body=json.dumps({'id': 3}))
+    changed = s3_base.load_json_from_s3(EXPORT_BUCKET, 'Cached/data.json')
+    df = s3_base.load_parquet_with_wrangler(f's3://{EXPORT_BUCKET}/Cached/data.parquet')
+    s3.Object(EXPORT_BUCKET, 'Cached/data.json').delete()
+    missing = s3_base.load_file_from_s3(EXPORT_BUCKET, 'Cached/data.json')
+    
+    assert (first, second, compressed, changed) == ({'id': 1}, {'id': 1}, {'id': 2}, {'id': 3})
+    assert hits['hits'] == 1
+    assert hits['misses'] == 2
+    assert hits['saved_bytes'] == len(json.dumps({'id': 1}))
+    assert cache.stats['changed'] == 1
+    assert df['col1'].tolist() == [1, 2]
+    assert missing is None
+    assert cache.stats['evictions'] >= 1
+    assert [path.parent.name for path in tmp_path.rglob('*') if path.is_file()] == [
+        cache._key_hash(EXPORT_BUCKET, 'Cached/data.parquet')]
+    assert not any(path.name.startswith('.tmp-') for path in tmp_path.iterdir())
+    assert cache._size == sum(path.stat().st_size for path in tmp_path.rglob('*') if path.is_file())
+
+def test_load_parquet_with_wrangler_cached_dtypes(s3, tmp_path):
+    """Test function for the cached path of load_parquet_with_wrangler() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    df = pd.DataFrame({'col1': pd.array([1, None, 3], dtype='Int64'), 'col2': ['a', None, 'c'],
+                       'col3': [1.5, 2.5, None], 'col4': pd.array([1, 2, None], dtype='Int8'),
+                       'col5': pd.array([7, None, 9], dtype='UInt16'), 'col6': [True, None, False],
+                       'col7': pd.to_datetime(['2020-05-11 10:00', None, '2020-05-12 00:00']).tz_localize('Europe/Berlin'),
+                       'col8': [datetime.date(2020, 5, 11), None, datetime.date(2020, 5, 12)]})
+    s3_base.upload_parquet_to_s3(f's3://{EXPORT_BUCKET}/Dtypes/data.parquet', df)
+    
+    uncached = s3_base.load_parquet_with_wrangler(f's3://{EXPORT_BUCKET}/Dtypes/data.parquet')
+    s3_base.enable_disk_cache(str(tmp_path))
+    cached = s3_base.load_parquet_with_wrangler(f's3://{EXPORT_BUCKET}/Dtypes/data.parquet')
+    
+    assert cached.dtypes.to_dict() == uncached.dtypes.to_dict()
+    pd.testing.assert_frame_equal(cached, uncached)
+
+def test_read_arrow_from_cache(s3, tmp_path):
+    """Test function for read_arrow_from_cache() function in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    with pytest.raises(ValueError):
+        s3_base.read_arrow_from_cache(EXPORT_BUCKET, 'Mapped/data.parquet')
+    cache = s3_base.enable_disk_cache(str(tmp_path))
+    df = pd.DataFrame({'col1': list(range(10000)), 'col2': ['abc', 'def'] * 5000})
+    s3_base.upload_parquet_to_s3(f's3://{EXPORT_BUCKET}/Mapped/data.parquet', df)
+    
+    s3_base.read_arrow_from_cache(EXPORT_BUCKET, 'Mapped/data.parquet')
+    allocated = pa.total_allocated_bytes()
+    table = s3_base.read_arrow_from_cache(EXPORT_BUCKET, 'Mapped/data.parquet', columns=['col1'])
+    assert pa.total_allocated_bytes() == allocated
+    
+    decoded = s3_base.read_arrow_from_cache(EXPORT_BUCKET, 'Mapped/data.parquet', as_pandas=True,
+                                            materialize_ipc=False)
+    ipc_files = [path for path in tmp_path.rglob('*.arrow')]
+    assert table.column_names == ['col1']
+    assert table.column('col1').to_pylist() == list(range(10000))
+    assert decoded.equals(df)
+    assert len(ipc_files) == 1
+    assert cache.stats['hits'] == 2
+    assert s3_base.read_arrow_from_cache(EXPORT_BUCKET, 'Mapped/missing.parquet') is None
+    
+    cache.max_size = ipc_files[0].stat().st_size
+    s3_base.upload_parquet_to_s3(f's3://{EXPORT_BUCKET}/Mapped/other.parquet', df)
+    other = s3_base.read_arrow_from_cache(EXPORT_BUCKET, 'Mapped/other.parquet')
+    remaining = [path for path in tmp_path.rglob('*') if path.is_file()]
+    assert other.num_rows == 10000
+    assert [(path.parent.name, path.suffix) for path in remaining] == [
+        (cache._key_hash(EXPORT_BUCKET, 'Mapped/other.parquet'), '.arrow')]
+    assert cache.stats['evictions'] >= 2
+
+def test_get_parquet_metadata(s3, monkeypatch):
+    """Test function for get_parquet_metadata(), count_parquet_rows() and read_object_range() functions in awsutils
+    
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    df = pd.DataFrame({'col1': list(range(1000)), 'col2': [os.urandom(100).hex() for _ in range(1000)]})
+    for i in range(3):
+        s3_base.upload_parquet_to_s3(f's3://{EXPORT_BUCKET}/Footer/{i}_order.parquet', df,
+                                     parquet_writer={'row_group_size': 400})
+    s3.Object(EXPORT_BUCKET, 'Footer/range.txt').put(Body=b'0123456789')
+    
+    monkeypatch.setattr(awsu.metrics, 'enabled', True)
+    awsu.metrics.snapshot(reset=True)
+    metadata = s3_base.get_parquet_metadata(EXPORT_BUCKET, 'Footer/0_order.parquet', footer_size=1024)
+    requests = awsu.metrics.snapshot(reset=True)['operations']['s3.GetObject'][EXPORT_BUCKET]
+    
+    assert requests['count'] == 2
+    assert requests['bytes_in'] < 5000
+    assert s3_base.get_parquet_metadata(EXPORT_BUCKET, 'Footer/1_order.parquet')['num_rows'] == 1000
+    assert metadata['num_rows'] == 1000
+    assert metadata['size'] == s3.Object(EXPORT_BUCKET, 'Footer/0_order.parquet').content_length
+    assert metadata['schema'].names == ['col1', 'col2']
+    assert [row_group['num_rows'] for row_group in metadata['row_groups']] == [400, 400, 200]
+    assert metadata['row_groups'][1]['columns']['col1']['min'] == 400
+    assert metadata['row_groups'][1]['columns']['col1']['max'] == 799
+    assert s3_base.get_parquet_metadata(EXPORT_BUCKET, 'Footer/missing.parquet') is None
+    assert sorted(s3_base.get_parquet_metadata_for_prefix(EXPORT_BUCKET, 'Footer/')) == [
+        f'Footer/{i}_order.parquet' for i in range(3)]
+    assert s3_base.count_parquet_rows(EXPORT_BUCKET, 'Footer/') == 3000
+    assert s3_base.read_object_range(EXPORT_BUCKET, 'Footer/range.txt', 2, 4) == b'234'
+    assert s3_base.read_object_range(EXPORT_BUCKET, 'Footer/range.txt', -3) == b'789'
+    assert s3_base.read_object_range(EXPORT_BUCKET, 'Footer/range.txt', 8) == b'89'
+
+def test_resolve_parquet_writer():
+    """Test function for resolve_parquet_writer() function in awsutils
+    """
+    s3_base = awsu.S3Base()
+    
+    assert s3_base.resolve_parquet_writer() == {}
+    assert s3_base.resolve_parquet_writer('fast-write') == awsu.PARQUET_WRITER_PRESETS['fast-write']
+    assert s3_base.resolve_parquet_writer({'preset': 'small-files', 'compression_level': 3})['compression_level'] == 3
+    with pytest.raises(ValueError):
+        s3_base.resolve_parquet_writer('unknown')
+    
+    kwargs = s3_base.parquet_write_kwargs(['a', 'b'], {'compression': 'zstd', 'columns': {'b': {'write_statistics': False}}})
+    assert kwargs == {'compression': 'zstd', 'write_statistics': ['a']}
+
+def test_upload_parquet_with_wrangler_column_options(s3):
+    """Test function for upload_parquet_with_wrangler() function in awsutils with per-column writer options
+    """
+    s3_base = awsu.S3Base()
+    df = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})
+    s3_uri = f's3://{EXPORT_BUCKET}/Wrangler/data.parquet'
+    
+    s3_base.upload_parquet_with_wrangler(s3_uri, df, parquet_writer={
+        'preset': 'scan-optimised', 'columns': {'b': {'compression': 'gzip', 'write_statistics': False}}})
+    
+    body = s3.Object(EXPORT_BUCKET, 'Wrangler/data.parquet').get()['Body'].read()
+    metadata = pq.ParquetFile(pa.BufferReader(body)).metadata
+    assert metadata.num_rows == 3
+    assert metadata.row_group(0).column(0).compression == 'ZSTD'
+    assert metadata.row_group(0).column(1).compression == 'ZSTD'
+    assert metadata.row_group(0).column(1).statistics is None
+
 def test_upload_as_json_to_s3(s3):
     """Test function for upload_as_json_to_s3() function in awsutils
      
@@ -336,6 +1240,29 @@ def test_upload_object_to_s3(s3):
     
     assert content == 'some test data'
 
+def test_upload_object_to_s3_multipart(s3):
+    """Test function for streamed multipart uploads with upload_object_to_s3() function in awsutils
+     
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    
+    bucket = 'INPUT'
+    target_key = 'TestKey/1111111111.jsonp'
+    part_size = 5 * 1024 * 1024
+    line = json.dumps({'col1': 1, 'col2': 'abc'}) + '\n'
+    chunks = (line * 1000 for _ in range(300))
+    
+    s3_base.upload_object_to_s3(chunks, bucket, target_key, part_size=part_size, max_concurrency=2)
+    obj = s3.Object(bucket, target_key)
+    
+    assert obj.content_length == len(line) * 300000
+    assert obj.e_tag.endswith('-2"')
+    assert obj.get()['Body'].read().decode('utf-8') == line * 300000
+
 def test_delete_file_from_s3(s3):
     """Test function for delete_file_from_s3() function in awsutils
      
@@ -383,3 +1310,70 @@ def test_delete_all_keys_from_list(s3):
     objs = list(s3_bucket.objects.filter(Prefix=prefix))
     
     assert not objs
+
+def test_delete_all_keys_from_list_bulk(s3):
+    """Test function for the bulk mode of delete_all_keys_from_list() function in awsutils
+     
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    s3_base.delete_batch_size = 2
+    
+    bucket = 'INPUT'
+    prefix = 'BulkKey'
+    for i in range(5):
+        s3.Object(bucket, f'{prefix}/partition_chunk={i}/file.parquet').put(Body=b'data')
+    
+    result = s3_base.delete_all_keys_from_list(bucket, prefix, bulk=True, dry_run=True)
+    assert len(result['deleted']) == 5
+    assert len(list(s3.Bucket(bucket).objects.filter(Prefix=prefix))) == 5
+    
+    result = s3_base.delete_all_keys_from_list(bucket, prefix, bulk=True, max_workers=2)
+    assert len(result['deleted']) == 5
+    assert not result['errors']
+    assert not list(s3.Bucket(bucket).objects.filter(Prefix=prefix))
+    assert len(list(s3.Bucket(bucket).objects.filter(Prefix='TestKey'))) == 2
+
+def test_store_raw_data_in_s3_compressed(s3):
+    """Test function for compressed jsonp in store_raw_data_in_s3() function in awsutils
+     
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    s3_base = awsu.S3Base()
+    partition_date = datetime.date(2020, 5, 11)
+    lines = [json.dumps({'id': i, 'name': 'event'}) + '\n' for i in range(100)]
+    
+    s3_base.store_raw_data_in_s3(partition_date, 'order', iter(lines), False, 'vnr', EXPORT_BUCKET,
+                                 compression='gzip')
+    data_key = s3_base.create_data_key(partition_date, 'order.jsonp.gz', 'order', 'vnr')
+    obj = s3.Object(EXPORT_BUCKET, data_key)
+    
+    assert data_key.endswith('partition_day=11/order.jsonp.gz')
+    assert obj.content_encoding == 'gzip'
+    assert gzip.decompress(obj.get()['Body'].read()).decode('utf-8') == ''.join(lines)
+    assert s3_base.load_list_file_from_s3(EXPORT_BUCKET, data_key)[:2] == [lines[0].strip(), lines[1].strip()]
+    assert s3_base.load_file_from_s3(EXPORT_BUCKET, data_key, decompress=True) == ''.join(lines).encode('utf-8')
+
+def test_store_raw_master_data_in_s3_compressed(s3):
+    """Test function for compressed jsonp in store_raw_master_data_in_s3() function in awsutils
+     
+    Parameters
+    ----------
+    s3 : Mocked S3 Instance
+        Description
+    """
+    pytest.importorskip('zstandard')
+    s3_base = awsu.S3Base()
+    
+    s3_base.store_raw_master_data_in_s3('customer', 'customer', json.dumps({'id': 1}), False, 0,
+                                        EXPORT_BUCKET, 'vnr', compression='zstd', compression_level=10)
+    data_key = s3_base.create_data_key_dimension('customer.jsonp.zst', 'customer', 0, 'vnr')
+    
+    assert s3.Object(EXPORT_BUCKET, data_key).content_encoding == 'zstd'
+    assert s3_base.load_json_from_s3(EXPORT_BUCKET, data_key) == {'id': 1}
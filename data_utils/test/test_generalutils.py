@@ -4,6 +4,10 @@ from data_utils import generalutils as gu
 import pytest
 import pandas as pd
 import datetime
+import io
+import hashlib
+import json
+import math
 import IPython
 from freezegun import freeze_time
 from pytz import timezone
@@ -126,4 +130,95 @@ def test_create_time_partition():
     assert time_partition == f'partition_year={test_date.year}/partition_month={test_date.month}/partition_day={test_date.day}'
     
     time_partition = gu.create_time_partition(test_date, month= True)
-    assert time_partition == f'partition_year={test_date.year}/partition_month={test_date.month}'
\ No newline at end of file
+    assert time_partition == f'partition_year={test_date.year}/partition_month={test_date.month}'
+
+
+def test_chunk_iterable():
+    """Test function for chunk_iterable() function in generalutils
+    """
+    chunks = list(gu.chunk_iterable(iter(range(7)), 3))
+    assert chunks == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(gu.chunk_iterable([], 3)) == []
+
+
+def test_detect_compression():
+    """Test function for detect_compression() function in generalutils
+    """
+    assert gu.detect_compression('a/b/raw.jsonp.gz') == 'gzip'
+    assert gu.detect_compression('a/b/raw.jsonp.zst') == 'zstd'
+    assert gu.detect_compression('a/b/raw.jsonp') is None
+    assert gu.detect_compression('a/b/raw.jsonp', content_encoding='gzip') == 'gzip'
+
+
+def test_iter_stream_lines():
+    """Test function for iter_stream_lines() function in generalutils
+    """
+    stream = io.BytesIO(b'first line\nsecond line\n\nthird line')
+    lines = list(gu.iter_stream_lines(stream, chunk_size=4))
+    assert lines == [b'first line', b'second line', b'third line']
+
+
+def test_compress_chunks():
+    """Test function for compress_chunks() and decompress_bytes() functions in generalutils
+    """
+    chunks = ['{"id": %s}\n' % i for i in range(1000)]
+    compressed = b''.join(gu.compress_chunks(iter(chunks), 'gzip', level=9))
+    assert len(compressed) < len(''.join(chunks))
+    assert gu.decompress_bytes(compressed, 'gzip') == ''.join(chunks).encode('utf-8')
+    assert gu.decompress_bytes(b'plain', None) == b'plain'
+
+
+def test_decompress_zstd_frames():
+    """Test function for decompress_bytes() and open_decompressed_stream() with several zstd frames
+    """
+    zstandard = pytest.importorskip('zstandard')
+    compressor = zstandard.ZstdCompressor()
+    data = compressor.compress(b'a' * 10) + b''.join(gu.compress_chunks(iter(['b' * 10]), 'zstd'))
+    assert gu.decompress_bytes(data, 'zstd') == b'a' * 10 + b'b' * 10
+    assert gu.open_decompressed_stream(io.BytesIO(data), 'zstd').read() == b'a' * 10 + b'b' * 10
+
+
+def test_content_hash():
+    """Test function for ContentHash class in generalutils
+    """
+    body = b'x' * 25
+    content_hash = gu.ContentHash(part_size=10)
+    for i in range(0, len(body), 7):
+        content_hash.update(body[i:i + 7])
+    parts = [hashlib.md5(body[i:i + 10]).digest() for i in range(0, len(body), 10)]
+    single = gu.ContentHash(part_size=100)
+    single.update('x' * 25)
+    assert content_hash.size == 25
+    assert content_hash.parts == 3
+    assert content_hash.sha256 == hashlib.sha256(body).hexdigest()
+    assert content_hash.etag == f'"{hashlib.md5(b"".join(parts)).hexdigest()}-3"'
+    assert single.parts == 0
+    assert single.etag == f'"{hashlib.md5(body).hexdigest()}"'
+
+
+def test_json_codec(monkeypatch):
+    """Test function for json_loads and json_dumps in generalutils with the fast and the fallback backend
+    """
+    data = {'id': 1, 'name': 'Müller', 'values': [1.5, None, True], 2: 'int key'}
+    for backend in ('orjson', 'json'):
+        monkeypatch.setenv('DATA_UTILS_JSON_BACKEND', backend)
+        monkeypatch.setattr(gu, '_json_backend', None)
+        if gu.json_backend() != backend:
+            # orjson is not installed, the json module is still tested
+            continue
+        encoded = gu.json_dumps(data)
+        assert encoded == '{"id":1,"name":"Müller","values":[1.5,null,true],"2":"int key"}'.encode('utf-8')
+        assert gu.json_loads(encoded) == json.loads(encoded)
+        assert gu.json_loads(memoryview(encoded)) == gu.json_loads(encoded.decode('utf-8'))
+        assert gu.json_dumps(2 ** 70) == b'1180591620717411303424'
+        assert gu.json_dumps({'date': datetime.date(2020, 5, 11)}, default=str) == b'{"date":"2020-05-11"}'
+        assert gu.json_dumps({'time': datetime.datetime(2020, 5, 11, 10)}, default=str) == \
+            b'{"time":"2020-05-11 10:00:00"}'
+        assert gu.json_dumps({'values': [float('nan'), (1.5, float('inf'))]}) == b'{"values":[null,[1.5,null]]}'
+        # integers beyond 64 bit make orjson fall back to the json module
+        assert gu.json_dumps([float('nan'), 2 ** 70]) == b'[null,1180591620717411303424]'
+        assert gu.json_dumps({'time': datetime.datetime(2020, 5, 11, 10), 'big': 2 ** 70}, default=str) == \
+            b'{"time":"2020-05-11 10:00:00","big":1180591620717411303424}'
+        assert math.isnan(gu.json_loads(b'{"value": NaN}')['value'])
+        with pytest.raises(json.JSONDecodeError):
+            gu.json_loads(b'{no json')
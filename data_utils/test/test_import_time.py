@@ -0,0 +1,19 @@
+"""Test Cases for the import time of the data_utils modules
+"""
+import subprocess
+import sys
+from data_utils.test.benchmark import import_time
+
+
+def test_heavy_dependencies_loaded_on_first_use():
+    """Test that pandas, boto3 and the other heavy dependencies are only imported when they are used
+
+    The import-time budgets themselves are checked by the import_time benchmark,
+    as wall-clock limits are too noisy for shared test runners.
+    """
+    script = ('import sys; from data_utils import awsutils, aioawsutils, apiutils, fbutils, generalutils as gu; '
+              'heavy = ["pandas", "boto3", "botocore", "s3fs", "awswrangler", "pyarrow", "aiobotocore"]; '
+              'assert not [name for name in heavy if name in sys.modules]; '
+              'gu.create_data_frame({"a": [1]}); assert "pandas" in sys.modules; '
+              'assert fbutils.config["fb_data_url"]')
+    subprocess.check_call([sys.executable, '-c', script], cwd=import_time.PACKAGE_ROOT)
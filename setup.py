@@ -22,6 +22,13 @@ REQUIRED = [
     'pytz'
 ]
 
+# What packages are optional?
+EXTRAS = {
+    'async': ['aiobotocore'],
+    'orjson': ['orjson'],
+    'zstd': ['zstandard'],
+}
+
 # Import the README and use it as the long-description.
 # Note: this will only work if 'README.rst' is present in your MANIFEST.in file!
 try:
@@ -42,6 +49,7 @@ setup(
     license='MIT',
     packages=find_packages(exclude=("test",)),
     install_requires=REQUIRED,
+    extras_require=EXTRAS,
     include_package_data=True,
     classifiers=[
         "Programming Language :: Python :: 3.7",